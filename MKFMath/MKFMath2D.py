@@ -0,0 +1,47 @@
+""" Constants and scalar helper functions for 2D math
+"""
+
+__author__ = 'Mass KonFuzion'
+
+import math
+
+PI = math.pi
+PI2 = math.pi * 2.0
+PI_DIV_2 = math.pi * 0.5
+
+# Small values for floating point comparisons
+EPSILON_E3 = 1e-3
+EPSILON_E4 = 1e-4
+EPSILON_E5 = 1e-5
+EPSILON_E6 = 1e-6
+
+# Largest single-precision float (used as "infinity" in intersection tests)
+FLT_MAX = 3.402823466e+38
+
+
+def DEG_TO_RAD(ang):
+    """ Convert degrees to radians
+    """
+    return ang * (PI / 180.0)
+
+
+def RAD_TO_DEG(rads):
+    """ Convert radians to degrees
+    """
+    return rads * (180.0 / PI)
+
+
+def floatInterpolate(a, b, t):
+    """ Linearly interpolate between a (at t = 0) and b (at t = 1)
+    """
+    return a + ((b - a) * t)
+
+
+def floatClamp(n, lo, hi):
+    """ Clamp n to lie within the range [lo, hi]
+    """
+    if n < lo:
+        return lo
+    if n > hi:
+        return hi
+    return n
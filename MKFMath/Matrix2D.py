@@ -0,0 +1,95 @@
+""" 2D affine matrices
+
+A Matrix22 is a 2x2 linear part plus a translation, stored as a flat array('d') of 6 doubles:
+
+    [ a  b  tx ]        m[0] = a    m[1] = b
+    [ c  d  ty ]        m[2] = c    m[3] = d
+                        m[4] = tx   m[5] = ty
+
+so a single matrix can rotate, scale and translate a point.  As with the Vector2D_* functions, the
+Mat22_* functions write into an "out" object supplied by the caller (which may alias an input).
+"""
+
+__author__ = 'Mass KonFuzion'
+
+import math
+from array import array
+from MKFMath.Vector2D import *
+
+
+class Matrix22(array):
+    """ 2D affine matrix, stored as array('d', [a, b, c, d, tx, ty]); starts out as the identity
+    """
+    __slots__ = ()
+
+    def __new__(cls, a = 1.0, b = 0.0, c = 0.0, d = 1.0, tx = 0.0, ty = 0.0):
+        return array.__new__(cls, 'd', (a, b, c, d, tx, ty))
+
+    def __repr__(self):
+        return "Matrix22(%r, %r, %r, %r, %r, %r)" % tuple(self)
+
+    def __reduce__(self):
+        return (Matrix22, tuple(self))
+
+
+def Mat22_identity(m):
+    """ Set m to the identity matrix
+    """
+    m[0] = 1.0
+    m[1] = 0.0
+    m[2] = 0.0
+    m[3] = 1.0
+    m[4] = 0.0
+    m[5] = 0.0
+
+
+def Mat22_copy(dest, src):
+    """ Copy src into dest
+    """
+    dest[0:6] = src[0:6]
+
+
+def Mat22_setRotation(m, angle):
+    """ Set m to a rotation by angle (in RADIANS); the translation is reset to zero
+    """
+    cosA = math.cos(angle)
+    sinA = math.sin(angle)
+    m[0] = cosA
+    m[1] = -sinA
+    m[2] = sinA
+    m[3] = cosA
+    m[4] = 0.0
+    m[5] = 0.0
+
+
+def Mat22_setTranslation(m, x, y):
+    """ Set m to a translation by (x, y); the linear part is reset to the identity
+    """
+    m[0] = 1.0
+    m[1] = 0.0
+    m[2] = 0.0
+    m[3] = 1.0
+    m[4] = x
+    m[5] = y
+
+
+def Mat22_multvec(v, m, out):
+    """ out = m * v (v is treated as a point, so the translation is applied)
+    """
+    x = v[0]
+    y = v[1]
+    out[0] = (m[0] * x) + (m[1] * y) + m[4]
+    out[1] = (m[2] * x) + (m[3] * y) + m[5]
+
+
+def Mat22_mult(a, b, out):
+    """ out = a * b (i.e. applying out to a point is the same as applying b, then a)
+    """
+    a0, a1, a2, a3, a4, a5 = a
+    b0, b1, b2, b3, b4, b5 = b
+    out[0] = (a0 * b0) + (a1 * b2)
+    out[1] = (a0 * b1) + (a1 * b3)
+    out[2] = (a2 * b0) + (a3 * b2)
+    out[3] = (a2 * b1) + (a3 * b3)
+    out[4] = (a0 * b4) + (a1 * b5) + a4
+    out[5] = (a2 * b4) + (a3 * b5) + a5
@@ -0,0 +1,166 @@
+""" 2D vectors
+
+A Vector2D is a fixed-size array of 2 doubles, indexed as v[0] (x) and v[1] (y).  Being an
+array('d') rather than a list or a class with a __dict__, it is compact, and indexing it runs at C
+speed.
+
+The Vector2D_* functions never create vectors; they write their results into an "out" vector that
+the caller provides, which may also be one of the inputs (i.e. the operations can be done in place).
+"""
+
+__author__ = 'Mass KonFuzion'
+
+import math
+from array import array
+from MKFMath.MKFMath2D import *
+
+
+class Vector2D(array):
+    """ 2D vector, stored as array('d', [x, y])
+    """
+    __slots__ = ()
+
+    def __new__(cls, x = 0.0, y = 0.0):
+        return array.__new__(cls, 'd', (x, y))
+
+    def __repr__(self):
+        return "Vector2D(%r, %r)" % (self[0], self[1])
+
+    def __reduce__(self):
+        return (Vector2D, (self[0], self[1]))
+
+    def __copy__(self):
+        return Vector2D(self[0], self[1])
+
+    def __deepcopy__(self, memo):
+        return Vector2D(self[0], self[1])
+
+
+def Vector2D_setxy(v, x, y):
+    """ Set the components of v
+    """
+    v[0] = x
+    v[1] = y
+
+
+def Vector2D_copy(dest, src):
+    """ Copy src into dest
+    """
+    dest[0] = src[0]
+    dest[1] = src[1]
+
+
+def Vector2D_zero(v):
+    """ Set v to the zero vector
+    """
+    v[0] = 0.0
+    v[1] = 0.0
+
+
+def Vector2D_add(a, b, out):
+    """ out = a + b
+    """
+    out[0] = a[0] + b[0]
+    out[1] = a[1] + b[1]
+
+
+def Vector2D_sub(a, b, out):
+    """ out = a - b
+    """
+    out[0] = a[0] - b[0]
+    out[1] = a[1] - b[1]
+
+
+def Vector2D_scale(s, v, out):
+    """ out = s * v (s is a scalar)
+    """
+    out[0] = v[0] * s
+    out[1] = v[1] * s
+
+
+def Vector2D_madd(a, s, b, out):
+    """ out = a + s * b (multiply-add; s is a scalar)
+    """
+    out[0] = a[0] + (b[0] * s)
+    out[1] = a[1] + (b[1] * s)
+
+
+def Vector2D_negate(v, out):
+    """ out = -v
+    """
+    out[0] = -v[0]
+    out[1] = -v[1]
+
+
+def Vector2D_dot(a, b):
+    """ Return the dot product of a and b
+    """
+    return (a[0] * b[0]) + (a[1] * b[1])
+
+
+def Vector2D_wedge(a, b):
+    """ Return the wedge (2D cross) product of a and b -- i.e. the z component of a x b
+    """
+    return (a[0] * b[1]) - (a[1] * b[0])
+
+
+def Vector2D_lengthSq(v):
+    """ Return the squared length of v
+    """
+    return (v[0] * v[0]) + (v[1] * v[1])
+
+
+def Vector2D_length(v):
+    """ Return the length of v
+    """
+    return math.sqrt((v[0] * v[0]) + (v[1] * v[1]))
+
+
+def Vector2D_normalize(v, out):
+    """ out = v / |v|  (out is set to zero if v is (nearly) the zero vector)
+    """
+    length = math.sqrt((v[0] * v[0]) + (v[1] * v[1]))
+    if length < EPSILON_E5:
+        out[0] = 0.0
+        out[1] = 0.0
+        return
+    invLength = 1.0 / length
+    out[0] = v[0] * invLength
+    out[1] = v[1] * invLength
+
+
+def Vector2D_interpolate(a, b, t, out):
+    """ out = a + (b - a) * t
+    """
+    out[0] = a[0] + ((b[0] - a[0]) * t)
+    out[1] = a[1] + ((b[1] - a[1]) * t)
+
+
+def getPointOnRay(p, d, t):
+    """ Return the point p + (d * t), as a new Vector2D
+    """
+    return Vector2D(p[0] + (d[0] * t), p[1] + (d[1] * t))
+
+
+def findIntersectionIndex(p1, p2, p3, p4):
+    """ Return the index t (0 <= t <= 1) along segment p1->p2 at which it crosses segment p3->p4
+
+    Returns -1.0 if the segments are parallel or do not cross.
+    """
+    d1x = p2[0] - p1[0]
+    d1y = p2[1] - p1[1]
+    d2x = p4[0] - p3[0]
+    d2y = p4[1] - p3[1]
+
+    denom = (d1x * d2y) - (d1y * d2x)
+    if abs(denom) < EPSILON_E5:
+        return -1.0
+
+    ex = p3[0] - p1[0]
+    ey = p3[1] - p1[1]
+    t = ((ex * d2y) - (ey * d2x)) / denom
+    u = ((ex * d1y) - (ey * d1x)) / denom
+
+    if t < 0.0 or t > 1.0 or u < 0.0 or u > 1.0:
+        return -1.0
+    return t
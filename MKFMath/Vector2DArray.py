@@ -0,0 +1,68 @@
+""" Batched 2D vector operations (requires NumPy)
+
+A Vector2DArray is an (n, 2) float64 NumPy array -- row i holds the x and y of vector i.  The
+functions here are the batched counterparts of the Vector2D_* / Mat22_* functions: one call works on
+every row at once, writing into a caller-supplied "out" array (which may alias an input).
+"""
+
+__author__ = 'Mass KonFuzion'
+
+import numpy
+
+
+def Vector2DArray(n):
+    """ Return an array of n zero vectors
+    """
+    return numpy.zeros((n, 2), dtype = numpy.float64)
+
+
+def Vector2DArray_add(a, b, out):
+    """ out = a + b (row-wise; b may also be a single Vector2D)
+    """
+    numpy.add(a, b, out)
+
+
+def Vector2DArray_sub(a, b, out):
+    """ out = a - b (row-wise; b may also be a single Vector2D)
+    """
+    numpy.subtract(a, b, out)
+
+
+def Vector2DArray_scale(s, v, out):
+    """ out = s * v (s is a scalar, or an array of n scalars -- one per row)
+    """
+    if numpy.ndim(s) == 1:
+        s = s[:, numpy.newaxis]
+    numpy.multiply(v, s, out)
+
+
+def Vector2DArray_madd(a, s, b, out):
+    """ out = a + s * b (s is a scalar)
+    """
+    if out is a:
+        out += b * s
+    else:
+        numpy.multiply(b, s, out)
+        out += a
+
+
+def Vector2DArray_dot(a, b, out = None):
+    """ Return (or store in out) the row-wise dot products of a and b, as an array of n scalars
+    """
+    return numpy.einsum('ij,ij->i', a, b, out = out)
+
+
+def Vector2DArray_lengthSq(v, out = None):
+    """ Return (or store in out) the squared length of each row of v
+    """
+    return numpy.einsum('ij,ij->i', v, v, out = out)
+
+
+def Mat22_multvecArray(v, m, out):
+    """ out = m * v for every row of v (m is a Matrix22; the translation is applied)
+    """
+    a, b, c, d, tx, ty = m
+    x = v[:, 0].copy()
+    y = v[:, 1]
+    out[:, 0] = (a * x) + (b * y) + tx
+    out[:, 1] = (c * x) + (d * y) + ty
@@ -0,0 +1,9 @@
+""" MKFMath -- the vector and matrix math used by Falldown Rebirth
+
+Vector2D       -- 2D vectors and the Vector2D_* functions
+Matrix2D       -- 2D affine transforms (Matrix22) and the Mat22_* functions
+MKFMath2D      -- constants and scalar helpers
+Vector2DArray  -- batched versions of the vector/matrix functions over NumPy arrays (needs NumPy)
+"""
+
+__author__ = 'Mass KonFuzion'
@@ -7,7 +7,7 @@ import time
 #Note:  In Windows, the high-res timer is time.clock() -- the precision is
 #in microseconds (roughly).  In UNIX, the high-res timer is time.time().
 #Remember that for porting code
-#TODO:  Implement a Timer class capable of hi-res cross-platform timing
+#(inputtiming.hiresTime picks the right one for the platform)
 
 # TODO: Update ALL of this code so that the Application Class only overloads
 # function calls, e.g. to draw in OpenGL vs SDL/Pygame, or to call the correct
@@ -18,6 +18,11 @@ import sys
 
 # Import the GameObject class
 from gameobj import *
+from autopilot import Autopilot
+from inputtiming import hiresTime, InputQueue, LatencyMeter, INPUT_LEFT, INPUT_RIGHT
+
+# Number of balls in party mode (multi-ball mode; see GameObject.setBallCount)
+PARTY_BALLS = 50
 
 # This is some ish I downloaded
 #import vidcap
@@ -42,6 +47,22 @@ class PygameApplication:
         #self.fixedDeltaTimeS = 0.0125 # Corresponds to 80 FPS
         #self.fixedDeltaTimeS = 0.01667 # Corresponds to 60 FPS
 
+        # Checkpoints (a checkpoint.CheckpointWriter, or None for no checkpoints).  While playing, the game is saved
+        # every checkpointIntervalS seconds of game time, so it can be resumed after a restart
+        self.checkpointWriter = None
+        self.checkpointIntervalS = 5.0
+        self.checkpointTimeS = 0.0
+
+        # Autopilot (an autopilot.Autopilot), or None for a human player.  Toggled from the main menu
+        self.autopilot = None
+
+        # Key changes read from Pygame, waiting to be applied by the next ticks (see inputtiming.py)
+        self.inputQueue = InputQueue()
+        # Latency measurement mode:  a LatencyMeter (shown on screen), or None when off.  Toggled with F3
+        self.latencyMeter = None
+        self.latencyText = None
+        self.latencyTextCount = -1
+
         # Should we record video, using vidcap?
         #self._recordVideo = False
 
@@ -75,9 +96,22 @@ class PygameApplication:
         # Draw the game
         self.gameObj.draw(self.gameWindow)
 
+        # Show the input latency, in latency measurement mode (re-rendered only when there's a new measurement)
+        if self.latencyMeter != None:
+            if self.latencyTextCount != self.latencyMeter.count:
+                meter = self.latencyMeter
+                strTxt = "Input latency:  last %.1f ms, average %.1f ms, max %.1f ms (%d inputs)" % (
+                    meter.lastS * 1000.0, meter.averageS() * 1000.0, meter.maxS * 1000.0, meter.count)
+                self.latencyText = self.font.render(strTxt, True, (255, 255, 255))
+                self.latencyTextCount = meter.count
+            self.gameWindow.blit(self.latencyText, (0, 0))
+
         # Update the screen
         pygame.display.update()
 
+        if self.latencyMeter != None:
+            self.latencyMeter.framePresented(hiresTime())
+
 ##        # If we're recording video
 ##        if self._recordVideo:
 ##            vidcap.cap()
@@ -100,16 +134,54 @@ class PygameApplication:
         # Respond to user input
         ballRef.respondToControllerInput()
 
+    def setLatencyMode(self, enabled):
+        """ Turn latency measurement mode on or off
+        """
+        if enabled:
+            self.latencyMeter = LatencyMeter()
+            self.latencyTextCount = -1
+        else:
+            self.latencyMeter = None
+
+    def pollInput(self):
+        """ Read Pygame's events while playing:  queue the key changes (stamped with the time they were read), and
+        handle quitting
+        """
+        now = hiresTime()
+        for event in pygame.event.get():
+            # Quit
+            if event.type == pygame.QUIT:
+                # Save the game on the way out, so it can be resumed
+                if self.checkpointWriter != None:
+                    self.checkpointWriter.save(self.gameObj)
+                self.gameObj.stateMachine.setState('Exit')
+
+            elif event.type == pygame.KEYDOWN or event.type == pygame.KEYUP:
+                pressed = (event.type == pygame.KEYDOWN)
+                # Left arrow key
+                if (event.key == pygame.K_LEFT or event.key == pygame.K_j):
+                    self.inputQueue.push(now, INPUT_LEFT, pressed)
+                # Right arrow key
+                elif (event.key == pygame.K_RIGHT or event.key == pygame.K_l):
+                    self.inputQueue.push(now, INPUT_RIGHT, pressed)
+                # F3 toggles latency measurement mode
+                elif event.key == pygame.K_F3 and pressed:
+                    self.setLatencyMode(self.latencyMeter == None)
+
 
     def doPlayingState(self):
         """ Do the stuff that's supposed to happen in the 'Playing' game state
         """
         # Set previous time
-        self.previousTimeS = time.clock()
+        self.previousTimeS = hiresTime()
 
         # Set time accumulator
         self.accumulatorS = 0.0
 
+        # Key changes queued before now (e.g. in the last game, before it was reset) were read in another state, with
+        # stamps from before this game's clock started:  don't apply them to this game's first tick
+        self.inputQueue.clear()
+
         ballRef = self.gameObj.ball
 
         # Stay in this function/state for as long as the state doesn't change
@@ -119,39 +191,15 @@ class PygameApplication:
             # Variable used for debugging -- if true, pauses the whole frame
             DEBUG_RUN_FRAME = True
 
-            # Check for Pygame events (e.g. process input)
-            for event in pygame.event.get():
-                # Quit
-                if event.type == pygame.QUIT:
-                    self.gameObj.stateMachine.setState('Exit')
-
-                elif event.type == pygame.KEYDOWN:
-                    # Left arrow key
-                    if (event.key == pygame.K_LEFT or event.key == pygame.K_j):
-                        ballRef.controlState.setLeftKeyPressedTrue()
-                    # Right arrow key
-                    elif (event.key == pygame.K_RIGHT or event.key == pygame.K_l):
-                        ballRef.controlState.setRightKeyPressedTrue()
-                elif event.type == pygame.KEYUP:
-                    #DEBUGGING stuff
-                    if event.key == pygame.K_RETURN:
-                        DEBUG_RUN_FRAME = True
-
-                    if (event.key == pygame.K_LEFT or event.key == pygame.K_j):
-                        ballRef.controlState.setLeftKeyPressedFalse()
-                    elif (event.key == pygame.K_RIGHT or event.key == pygame.K_l):
-                        ballRef.controlState.setRightKeyPressedFalse()
+            # Check for Pygame events (e.g. process input).  The key changes are queued, and applied by the ticks
+            self.pollInput()
 
             # NOTE To return the game to normal (without pausing at each frame),
             # remove all lines that contain DEBUG_RUN_FRAME -- un-indent the
             # portions that follow this if DEBUG_RUN_FRAME statement
             if DEBUG_RUN_FRAME:
-                # Handle controller
-                self.doControllerInput(ballRef)
-
-
                 # Get hi-res time from the system
-                self.currentTimeS = time.clock()
+                self.currentTimeS = hiresTime()
 
                 # Calculate delta time
                 self.deltaTimeS = self.currentTimeS - self.previousTimeS
@@ -188,48 +236,39 @@ class PygameApplication:
                 # the gafferongames tutorials.)
 
                 while self.accumulatorS >= self.fixedDeltaTimeS:
-                    # Copy current physics state into previous state
-                    copyPhysicsState(ballRef.prevPhysState, ballRef.currPhysState)
-
-                    # Update the ball
-                    # NOTE:  This function has the code that processes the effect of
-                    # forces (including gravity) on the ball
-                    # DOUBLE NOTE: A better way to handle the level updates is
-                    # to make all objects derive from a base object, and
-                    # "integrate" or update all objects.
-                    ballRef.moveBall(self.fixedDeltaTimeS)
-
-                    # After moving the ball, check to see if we've been crushed
-                    # We're crushed if the center of the ball reaches the top of
-                    #the screen
-                    if int(ballRef.getPosition()[1]) < 0:
-                        # If we've gotten crushed, then we need to change the game
-                        # state to process the crushing.
-                        self.gameObj.stateMachine.setState('GotCrushed')
-
+                    # (In multi-ball mode, the player's ball changes when it gets crushed)
+                    ballRef = self.gameObj.ball
 
-                    # Update the level
-                    self.gameObj.moveLevel(self.fixedDeltaTimeS)
+                    # Sample the input every tick:  read any events that came in since the last read (so they're
+                    # stamped as early as possible), and apply the queued key changes that happened by the time this
+                    # tick simulates -- the frame's ticks run back to back, but each one stands for its own slice of
+                    # the frame (at most one change per key per tick, so a quick tap still lasts a tick)
+                    self.pollInput()
+                    tickTimeS = self.previousTimeS - self.accumulatorS + self.fixedDeltaTimeS
+                    stamp = self.inputQueue.apply(ballRef.controlState, tickTimeS)
+                    if self.latencyMeter != None:
+                        self.latencyMeter.inputApplied(stamp)
 
-                    # Constrain the ball to the screen
-                    self.gameObj.constrainBallToScreen()
+                    # The autopilot steers every tick (it presses the ball's keys, as a player would)
+                    if self.autopilot != None:
+                        self.autopilot.update()
 
-                    # Accumulate forces acting on the ball
-                    ballRef.accumulateForces(self.fixedDeltaTimeS)
-
-                    # Detect Collisions & Generate a contact
-                    self.gameObj.collision_GenerateContacts()
-
-                    # Process collisions
-                    # NOTE:  This function has the code that removes the effect of
-                    # gravity on the ball
-                    self.gameObj.collision_ProcessCollisions()
+                    # Handle controller
+                    self.doControllerInput(ballRef)
 
+                    # Advance the game (ball physics, level, and collisions) by one fixed timestep
+                    self.gameObj.step(self.fixedDeltaTimeS)
 
                     # DEBUG - print accumulator
                     #print "Accumulator: %f" % (self.accumulatorS)
                     self.accumulatorS -= self.fixedDeltaTimeS
 
+                    # Save a checkpoint now and then (the writer takes a snapshot, and writes it in the background)
+                    self.checkpointTimeS += self.fixedDeltaTimeS
+                    if self.checkpointWriter != None and self.checkpointTimeS >= self.checkpointIntervalS:
+                        self.checkpointWriter.save(self.gameObj)
+                        self.checkpointTimeS = 0.0
+
 
     ##            # k = left-over time / fixed dt
     ##            k = self.accumulatorS / self.fixedDeltaTimeS
@@ -299,9 +338,13 @@ class PygameApplication:
         #text is a surface -- pygame renders a string to the surface I've
         #called "text"
         text = self.font.render(strTxt, True, textColor)
+        text2 = None
+        text3 = None
 
         # Initialize the Text Position
         textPos = (0, 0)
+        text2Pos = (0, 30)
+        text3Pos = (0, 60)
 
 
         # Wait here until the user presses a key
@@ -309,15 +352,37 @@ class PygameApplication:
             # Clear screen
             self.gameWindow.fill ( (0,0,0) )
 
+            # (Re-)render the autopilot line whenever it's toggled
+            if text2 == None:
+                strTxt2 = "Press A to turn the autopilot %s" % ("off" if self.autopilot != None else "on")
+                text2 = self.font.render(strTxt2, True, textColor)
+            if text3 == None:
+                strTxt3 = "Press P to turn party mode (%d balls) %s" % (
+                    PARTY_BALLS, "off" if self.gameObj.ballCount > 1 else "on")
+                text3 = self.font.render(strTxt3, True, textColor)
+
             #Blit the "text surface" onto the "screen" surface
             self.gameWindow.blit(text, textPos)
+            self.gameWindow.blit(text2, text2Pos)
+            self.gameWindow.blit(text3, text3Pos)
 
             pygame.display.update()
 
             # Process Pygame events
             for event in pygame.event.get():
-                # If the user presses any key, then change the state
-                if event.type == pygame.KEYDOWN:
+                # A toggles the autopilot; any other key starts playing
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_a:
+                    if self.autopilot == None:
+                        self.autopilot = Autopilot(self.gameObj, self.fixedDeltaTimeS)
+                    else:
+                        self.autopilot = None
+                        self.gameObj.ball.controlState.reset()
+                    text2 = None
+                # P toggles party mode
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_p:
+                    self.gameObj.setBallCount(1 if self.gameObj.ballCount > 1 else PARTY_BALLS)
+                    text3 = None
+                elif event.type == pygame.KEYDOWN:
                     self.gameObj.stateMachine.setState('PlayingGame')
                 elif event.type == pygame.QUIT:
                     self.gameObj.stateMachine.setState('Exit')
@@ -327,6 +392,10 @@ class PygameApplication:
 
 
     def doGotCrushedState(self):
+        # The game is over, so there's nothing to resume
+        if self.checkpointWriter != None:
+            self.checkpointWriter.discard()
+
         # Temporary placeholder for the real introduction
         strTxt = "Oh snap, you got crushed!  Press a key to try again."
 
@@ -384,5 +453,7 @@ class PygameApplication:
 
         # If we reached this code, then the user clicked the X on the window (to
         # exit the program)
+        if self.checkpointWriter != None:
+            self.checkpointWriter.close()
         pygame.quit()
         sys.exit()
\ No newline at end of file
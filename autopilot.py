@@ -0,0 +1,195 @@
+""" Autopilot for Falldown
+
+An Autopilot plays the game by itself (e.g. for an attract mode, or to soak-test the game headless).  It steers the
+ball by pressing the ball's left/right keys (its BallControlState), just as a player would, so the game can't tell
+the difference.
+
+The plan
+--------
+The autopilot plans a target x position for every row:  where the ball should be when it passes through that row.
+The bottom row's target is the middle of its gap.  Every row above it targets the point in its own gap that is
+nearest the target of the row below it, so the ball drops through each gap already lined up (as far as it can be) for
+the next one, and the distance it has to roll when it lands -- at Ball.maxSpeed, while the row carries it towards the
+top of the screen -- is as short as it can be.
+
+The plan only depends on the rows' gaps, so it is only recomputed when the rows change (see
+GameObject.rowGeneration):  once per row shifted in.  Every other tick, the autopilot only checks which row the ball
+is above (which moves at most a row or so per tick), and steers towards that row's target.  So its cost per tick is
+O(1), amortized.
+
+Usage:
+    pilot = Autopilot(world)
+    every tick:
+        pilot.update()              # presses the ball's keys (the game then turns them into a direction)
+        world.step(dt)
+
+    python autopilot.py [TICKS] [SEED]       # play headless, and report how it went
+"""
+
+__author__ = 'Mass KonFuzion'
+
+import sys
+import time
+
+from gameobj import GameObject
+from levelgen import LevelGenerator
+
+
+class Autopilot(object):
+    """ Steers a GameObject's ball towards the next gap (see the module docstring)
+    """
+
+    def __init__(self, world, dt = .01, margin = 2.0):
+        """ Make an autopilot for world (an initialized GameObject), stepped every dt seconds
+
+        margin is how far (in pixels) inside the edges of a gap the ball aims to stay
+        """
+        self.world = world
+        self.margin = margin
+        # The ball moves maxSpeed * dt per tick; within half of that of the target is close enough
+        self.deadband = .5 * world.ball.maxSpeed * dt
+
+        # Target x for each row, and the rowGeneration it was planned for (None = not planned yet)
+        self.targets = [0.0] * world.numRows
+        self.generation = None
+        # Index of the first row the ball hasn't passed yet (numRows if it has passed them all)
+        self.rowIndex = 0
+
+        # Number of times the plan has been computed
+        self.plans = 0
+
+    def plan(self):
+        """ Compute the target x for each row
+        """
+        world = self.world
+        rows = world.rows
+        r = world.ball.radius + self.margin
+
+        target = (rows[-1].gap + .5) * rows[-1].blockWidth
+        for i in xrange(len(rows) - 1, -1, -1):
+            row = rows[i]
+            # The ball fits through the gap anywhere in [lo, hi]
+            lo = (row.gap * row.blockWidth) + r
+            hi = ((row.gap + 1) * row.blockWidth) - r
+            if lo > hi:
+                lo = hi = (row.gap + .5) * row.blockWidth
+            target = min(max(target, lo), hi)
+            self.targets[i] = target
+
+        # A row was shifted in (so the rows moved up an index) or the rows were re-created:  find the ball's row over
+        self.rowIndex = 0
+        self.generation = world.rowGeneration
+        self.plans += 1
+
+    def direction(self):
+        """ Return the direction (-1, 0, or 1) the ball should move in this tick
+        """
+        world = self.world
+        if self.generation != world.rowGeneration:
+            self.plan()
+
+        rows = world.rows
+        blockHeight = world.blockHeight
+        position = world.ball.currPhysState.position
+        y = position[1]
+
+        # The ball has passed a row once its center is below the bottom of the row
+        i = self.rowIndex
+        while i < len(rows) and rows[i].yPos + blockHeight < y:
+            i += 1
+        while i > 0 and rows[i - 1].yPos + blockHeight >= y:
+            i -= 1
+        self.rowIndex = i
+
+        if i == len(rows):
+            # Below every row (on the floor):  get ready for the bottom row
+            i -= 1
+        dx = self.targets[i] - position[0]
+        if dx > self.deadband:
+            return 1
+        elif dx < -self.deadband:
+            return -1
+        return 0
+
+    def update(self):
+        """ Press the ball's keys for this tick, and return the direction
+        """
+        direction = self.direction()
+        controlState = self.world.ball.controlState
+        controlState.leftKeyPressed = direction < 0
+        controlState.rightKeyPressed = direction > 0
+        return direction
+
+
+class SoakReport(object):
+    """ The result of a headless autopilot run
+    """
+    __slots__ = ('ticks', 'crushes', 'rowsShifted', 'plans', 'updateS', 'worstUpdateS')
+
+    def __init__(self):
+        self.ticks = 0
+        # Number of times the ball got crushed (the level restarts each time)
+        self.crushes = 0
+        self.rowsShifted = 0
+        # Number of times the autopilot planned, and the time it took in total and at worst for one tick
+        self.plans = 0
+        self.updateS = 0.0
+        self.worstUpdateS = 0.0
+
+    def __repr__(self):
+        return "SoakReport(%d ticks, %d crushes, %d rows, %d plans, %.1f us/tick, worst %.1f us)" % (
+            self.ticks, self.crushes, self.rowsShifted, self.plans,
+            (self.updateS * 1000000.0) / max(self.ticks, 1), self.worstUpdateS * 1000000.0)
+
+
+def soak(ticks = 100000, seed = 0, dt = .01, sizeX = 800, sizeY = 600):
+    """ Play ticks ticks headless with the autopilot, on the level generated from seed, and return a SoakReport
+    """
+    world = GameObject()
+    world.initStateMachine()
+    world.setScreenSize(sizeX, sizeY)
+    world.rowSource = LevelGenerator(10, seed = seed)
+    world.initLevel(sizeY, 6, 10)
+    world.stateMachine.setState('PlayingGame')
+
+    pilot = Autopilot(world, dt)
+    ball = world.ball
+    crushed = world.stateMachine.states['GotCrushed']
+    report = SoakReport()
+    clock = time.clock
+    for i in xrange(0, ticks):
+        start = clock()
+        ball.setDirection(pilot.update())
+        elapsed = clock() - start
+        report.updateS += elapsed
+        if elapsed > report.worstUpdateS:
+            report.worstUpdateS = elapsed
+
+        ball.respondToControllerInput()
+        generation = world.rowGeneration
+        world.step(dt)
+        if world.rowGeneration != generation:
+            report.rowsShifted += 1
+        if world.stateMachine.currentState == crushed:
+            report.crushes += 1
+            world.resetLevel(sizeY)
+            world.stateMachine.setState('PlayingGame')
+
+    report.ticks = ticks
+    report.plans = pilot.plans
+    return report
+
+
+def main(args):
+    if len(args) > 2:
+        print __doc__
+        return 1
+    ticks = int(args[0]) if len(args) > 0 else 100000
+    seed = int(args[1]) if len(args) > 1 else 0
+    report = soak(ticks, seed)
+    print report
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -8,13 +8,14 @@ __author__ = 'Mass KonFuzion'
 
 from MKFMath.Vector2D import *
 from MKFMath.Matrix2D import *
-from MKFCollision.primitives import *
-from MKFCollision.intersectiontools import *
+from collision import *
 from physics import *
 
 import pygame
 
-class BallControlState:
+class BallControlState(object):
+    __slots__ = ('leftKeyPressed', 'rightKeyPressed')
+
     def __init__(self):
         self.leftKeyPressed = False
         self.rightKeyPressed = False
@@ -35,9 +36,12 @@ class BallControlState:
         self.leftKeyPressed = False
         self.rightKeyPressed = False
 
-class Ball:
+class Ball(object):
     """ Ball class
     """
+    __slots__ = ('maxSpeed', 'radius', 'currPhysState', 'prevPhysState', 'direction', 'forceGravity', 'controlState',
+                 'collisionGeom', 'ballsRemaining')
+
     def __init__(self, rad = 0.0):
         """ Initialize ball
         """
@@ -84,8 +88,8 @@ class Ball:
         # Ball Control State
         self.controlState = BallControlState()
 
-        # Collision Geometry (basically an axis-aligned bounding box)
-        self.collisionGeom = CCollisionSphere2D(0.0, 0.0,self.radius)
+        # Collision Geometry (a sphere matching the ball)
+        self.collisionGeom = CollisionGeomSphere(self.radius)
 
         # Balls remaining (a.k.a. "lives" remaining)
         self.ballsRemaining = 3 # Default to 3 'lives'. We can set this via difficulty options
@@ -291,7 +295,7 @@ class Ball:
 
         x = self.currPhysState.position[0]
         y = self.currPhysState.position[1]
-        self.collisionGeom.setCenter(x, y)
+        self.collisionGeom.setPosition(x, y)
 
 
     def moveBall(self, dt):
@@ -0,0 +1,814 @@
+""" Benchmarks for Falldown Rebirth
+
+Usage:
+    python benchmark.py [benchmark name ...]
+
+With no names, every benchmark is run.
+"""
+
+__author__ = 'Mass KonFuzion'
+
+import sys
+import timeit
+
+
+def timePerCall(fn, n = 100000):
+    """ Return the average time (in microseconds) of calling fn() n times (best of 3 runs)
+    """
+    return min(timeit.repeat(fn, number = n, repeat = 3)) / n * 1000000.0
+
+
+def countAllocations(module, names, fn, n = 1000):
+    """ Return the average number of objects of the given types that fn() constructs per call
+
+    The types are looked up by name in module, and are temporarily replaced by counting wrappers
+    """
+    counter = [0]
+
+    def makeCounter(cls):
+        def counting(*args, **kwargs):
+            counter[0] += 1
+            return cls(*args, **kwargs)
+        return counting
+
+    originals = {}
+    for name in names:
+        originals[name] = getattr(module, name)
+        setattr(module, name, makeCounter(originals[name]))
+    try:
+        for i in xrange(0, n):
+            fn()
+    finally:
+        for name in names:
+            setattr(module, name, originals[name])
+    return counter[0] / float(n)
+
+
+def benchCollisionKernels():
+    """ Object-based sphere/AABB collision functions vs the scalar kernels they wrap
+    """
+    import collision
+    from MKFMath.Vector2D import Vector2D
+
+    sphere = collision.CollisionGeomSphere(15.0)
+    sphere.setPosition(412.0, 287.0)
+    box = collision.CollisionGeomAABB(200.0, 15.0)
+    box.setPosition(400.0, 315.0)
+    svel = Vector2D(0.0, 70.0)
+    bvel = Vector2D(0.0, -2.0)
+    normal = [0.0, 0.0]
+
+    sx, sy, sr = sphere.center[0], sphere.center[1], sphere.r
+    cx, cy, rx, ry = box.center[0], box.center[1], box.r[0], box.r[1]
+
+    cases = [
+        ("isIntersecting_Sphere_AABB",
+         lambda: collision.isIntersecting_Sphere_AABB(sphere, box),
+         lambda: collision.isIntersecting_Sphere_AABB_f(sx, sy, sr, cx, cy, rx, ry)),
+        ("minimumPenetrationDepthAndNormal_Sphere_AABB",
+         lambda: collision.minimumPenetrationDepthAndNormal_Sphere_AABB(sphere, box),
+         lambda: collision.minimumPenetrationDepthAndNormal_Sphere_AABB_f(sx, sy, sr, cx, cy, rx, ry, normal)),
+        ("intersect_Ray_AABB",
+         lambda: collision.intersect_Ray_AABB(sphere.center, svel, box),
+         lambda: collision.intersect_Ray_AABB_f(sx, sy, 0.0, 70.0, cx, cy, rx, ry)),
+        ("willIntersectMoving_Sphere_AABB",
+         lambda: collision.willIntersectMoving_Sphere_AABB(sphere, svel, box, bvel),
+         lambda: collision.willIntersectMoving_Sphere_AABB_f(sx, sy, sr, 0.0, 70.0, cx, cy, rx, ry, 0.0, -2.0)),
+    ]
+
+    allocTypes = ["Vector2D", "CollisionGeomAABB"]
+    print "%-46s %12s %12s %10s %10s" % ("function", "object us", "kernel us", "obj alloc", "krn alloc")
+    for name, objectFn, kernelFn in cases:
+        print "%-46s %12.3f %12.3f %10.1f %10.1f" % (name, timePerCall(objectFn), timePerCall(kernelFn),
+                                                     countAllocations(collision, allocTypes, objectFn),
+                                                     countAllocations(collision, allocTypes, kernelFn))
+
+
+class ListVector2D(object):
+    """ Naive list-backed 2D vector (the baseline that MKFMath.Vector2D is measured against)
+    """
+    def __init__(self, x = 0.0, y = 0.0):
+        self.v = [x, y]
+
+    def __getitem__(self, i):
+        return self.v[i]
+
+    def __setitem__(self, i, value):
+        self.v[i] = value
+
+
+class ListMatrix22(object):
+    """ Naive list-of-lists affine matrix baseline
+    """
+    def __init__(self):
+        self.m = [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]]
+
+
+def listMat22_multvec(v, m, out):
+    rows = m.m
+    x = v[0]
+    y = v[1]
+    out[0] = (rows[0][0] * x) + (rows[0][1] * y) + rows[0][2]
+    out[1] = (rows[1][0] * x) + (rows[1][1] * y) + rows[1][2]
+
+
+def benchMath():
+    """ MKFMath Vector2D / Matrix22 (and batched NumPy variants) vs a naive list-backed baseline
+    """
+    import physics
+    from MKFMath import Vector2D as V
+    from MKFMath import Matrix2D as M
+
+    def listState():
+        state = physics.EulerState()
+        for name in ("position", "velocity", "acceleration", "netForce"):
+            setattr(state, name, ListVector2D())
+        return state
+
+    a, b, out = V.Vector2D(3.0, 4.0), V.Vector2D(1.0, 2.0), V.Vector2D()
+    la, lb, lout = ListVector2D(3.0, 4.0), ListVector2D(1.0, 2.0), ListVector2D()
+    mat, lmat = M.Matrix22(), ListMatrix22()
+    M.Mat22_setRotation(mat, 0.5)
+    state, lstate = physics.EulerState(), listState()
+    prevState, lprevState = physics.EulerState(), listState()
+
+    cases = [
+        ("construct", lambda: V.Vector2D(1.0, 2.0), lambda: ListVector2D(1.0, 2.0)),
+        ("index", lambda: a[0] + a[1], lambda: la[0] + la[1]),
+        ("Vector2D_setxy", lambda: V.Vector2D_setxy(out, 1.0, 2.0), lambda: V.Vector2D_setxy(lout, 1.0, 2.0)),
+        ("Vector2D_add", lambda: V.Vector2D_add(a, b, out), lambda: V.Vector2D_add(la, lb, lout)),
+        ("Vector2D_dot", lambda: V.Vector2D_dot(a, b), lambda: V.Vector2D_dot(la, lb)),
+        ("Mat22_multvec", lambda: M.Mat22_multvec(a, mat, out), lambda: listMat22_multvec(la, lmat, lout)),
+        ("physics.integrate", lambda: physics.integrate(state, .01), lambda: physics.integrate(lstate, .01)),
+        ("copyPhysicsState", lambda: physics.copyPhysicsState(prevState, state),
+         lambda: physics.copyPhysicsState(lprevState, lstate)),
+    ]
+
+    print "%-24s %12s %12s %8s" % ("operation", "MKFMath us", "list us", "speedup")
+    for name, fastFn, listFn in cases:
+        fast = timePerCall(fastFn)
+        slow = timePerCall(listFn)
+        print "%-24s %12.3f %12.3f %7.2fx" % (name, fast, slow, slow / fast)
+
+    print "%-24s %12s %12s" % ("bytes per vector", sys.getsizeof(a),
+                               sys.getsizeof(la) + sys.getsizeof(la.__dict__) + sys.getsizeof(la.v))
+
+    try:
+        from MKFMath import Vector2DArray as VA
+    except ImportError:
+        print "(NumPy not available; skipping batched variants)"
+        return
+
+    n = 1000
+    vecs = [V.Vector2D(i, -i) for i in xrange(0, n)]
+    outs = [V.Vector2D() for i in xrange(0, n)]
+    arr = VA.Vector2DArray(n)
+    arr[:, 0] = range(0, n)
+    arr[:, 1] = -arr[:, 0]
+    arrOut = VA.Vector2DArray(n)
+
+    def loopMultvec():
+        for i in xrange(0, n):
+            M.Mat22_multvec(vecs[i], mat, outs[i])
+
+    def loopAdd():
+        for i in xrange(0, n):
+            V.Vector2D_add(vecs[i], b, outs[i])
+
+    batchCases = [
+        ("Mat22_multvec x%d" % n, lambda: VA.Mat22_multvecArray(arr, mat, arrOut), loopMultvec),
+        ("Vector2D_add x%d" % n, lambda: VA.Vector2DArray_add(arr, b, arrOut), loopAdd),
+    ]
+    print "%-24s %12s %12s %8s" % ("batched operation", "NumPy us", "loop us", "speedup")
+    for name, batchFn, loopFn in batchCases:
+        fast = timePerCall(batchFn, 1000)
+        slow = timePerCall(loopFn, 1000)
+        print "%-24s %12.3f %12.3f %7.2fx" % (name, fast, slow, slow / fast)
+
+
+def benchBatchedCollision():
+    """ Per-pair sphere/AABB tests in a Python loop vs the batched NumPy collision API
+    """
+    import random
+    import collision
+
+    rng = random.Random(32)
+    print "%-15s %-46s %12s %12s %8s" % ("spheres x boxes", "query", "loop us", "batched us", "speedup")
+    for n, m in [(1, 12), (8, 12), (64, 12), (256, 256)]:
+        spheres = []
+        for i in xrange(0, n):
+            s = collision.CollisionGeomSphere(15.0)
+            s.setPosition(rng.uniform(0.0, 800.0), rng.uniform(0.0, 600.0))
+            spheres.append(s)
+        boxes = []
+        for j in xrange(0, m):
+            b = collision.CollisionGeomAABB(rng.uniform(40.0, 360.0), 15.0)
+            b.setPosition(rng.uniform(0.0, 800.0), rng.uniform(0.0, 600.0))
+            boxes.append(b)
+        centers, radii = collision.packSpheres(spheres)
+        boxCenters, boxHalfExtents = collision.packAABBs(boxes)
+        velocities = centers * 0.0 + (0.0, 70.0)
+        boxVelocities = boxCenters * 0.0 + (0.0, -2.0)
+        svel = (0.0, 70.0)
+        bvel = (0.0, -2.0)
+
+        def loopIntersect():
+            for s in spheres:
+                for b in boxes:
+                    collision.isIntersecting_Sphere_AABB(s, b)
+
+        def loopPenetration():
+            for s in spheres:
+                for b in boxes:
+                    collision.minimumPenetrationDepthAndNormal_Sphere_AABB(s, b)
+
+        def loopMoving():
+            for s in spheres:
+                for b in boxes:
+                    collision.willIntersectMoving_Sphere_AABB(s, svel, b, bvel)
+
+        cases = [
+            ("isIntersecting_Spheres_AABBs", loopIntersect,
+             lambda: collision.isIntersecting_Spheres_AABBs(centers, radii, boxCenters, boxHalfExtents)),
+            ("minimumPenetrationDepthAndNormal_Spheres_AABBs", loopPenetration,
+             lambda: collision.minimumPenetrationDepthAndNormal_Spheres_AABBs(centers, radii, boxCenters,
+                                                                              boxHalfExtents)),
+            ("willIntersectMoving_Spheres_AABBs", loopMoving,
+             lambda: collision.willIntersectMoving_Spheres_AABBs(centers, radii, velocities, boxCenters,
+                                                                 boxHalfExtents, boxVelocities)),
+        ]
+        calls = max(10, 100000 / (n * m))
+        for name, loopFn, batchFn in cases:
+            slow = timePerCall(loopFn, calls)
+            fast = timePerCall(batchFn, calls)
+            print "%-15s %-46s %12.1f %12.1f %7.2fx" % ("%d x %d" % (n, m), name, slow, fast, slow / fast)
+
+
+def makeWorld(seed = 0):
+    """ Return a GameObject with the default level (6 rows x 10 blocks on an 800 x 600 screen), in the playing state
+    """
+    import os
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import random
+    import gameobj
+
+    random.seed(seed)
+    world = gameobj.GameObject()
+    world.initStateMachine()
+    world.setScreenSize(800, 600)
+    world.initLevel(600, 6, 10)
+    world.stateMachine.setState('PlayingGame')
+    return world
+
+
+def playScripted(world, ticks, seed = 1, dt = .01):
+    """ Step world for the given number of ticks, with pseudo-random (but repeatable) steering; restart on crush
+    """
+    import random
+
+    rng = random.Random(seed)
+    direction = 0
+    crushed = world.stateMachine.states['GotCrushed']
+    for i in xrange(0, ticks):
+        if rng.random() < .02:
+            direction = rng.choice([-1, 0, 1])
+        world.ball.setDirection(direction)
+        world.ball.respondToControllerInput()
+        world.step(dt)
+        if world.stateMachine.currentState == crushed:
+            world.resetLevel(world.sizeY)
+            world.stateMachine.setState('PlayingGame')
+
+
+def deepSizeOf(obj):
+    """ Return the total size in bytes of obj and every object reachable from it
+
+    Classes, modules, functions and other objects shared by the whole program are not counted.
+    """
+    import gc
+    import types
+
+    shared = (type, types.ClassType, types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+              types.MethodType, types.CodeType)
+    seen = set()
+    pending = [obj]
+    total = 0
+    while pending:
+        o = pending.pop()
+        if id(o) in seen or isinstance(o, shared) or o is None:
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+        pending.extend(gc.get_referents(o))
+    return total
+
+
+def benchMemory():
+    """ Bytes per row, per ball and per world (a GameObject with the default 6 rows x 10 blocks)
+    """
+    world = makeWorld()
+
+    rowBytes = [deepSizeOf(row) for row in world.rows]
+    block = [b for b in world.rows[0].blocks if b is not None][0]
+    print "%-24s %10d" % ("bytes per row", sum(rowBytes) / len(rowBytes))
+    print "%-24s %10d" % ("bytes per block", deepSizeOf(block))
+    print "%-24s %10d" % ("bytes per ball", deepSizeOf(world.ball))
+    print "%-24s %10d" % ("bytes per world", deepSizeOf(world))
+
+
+def benchResting():
+    """ Resting-contact fast path vs the full collision pipeline
+
+    The fast path makes the collision stage of a resting tick several times cheaper, but a whole tick only gets
+    about 1.5x faster in scripted play (and some runs show no gain at all):  moving the ball and the rows costs the
+    same either way, and the ball isn't resting on every tick
+    """
+    world = makeWorld()
+    while world.restingRowIndex < 0:
+        world.step(.01)
+
+    def fullPipeline():
+        world.ball.accumulateForces(.01)
+        world.collision_GenerateContacts()
+        world.collision_ProcessCollisions()
+
+    full = timePerCall(fullPipeline)
+    fast = timePerCall(world.collision_KeepResting)
+    print "%-36s %12s %12s %8s" % ("", "full us", "fast us", "speedup")
+    print "%-36s %12.3f %12.3f %7.2fx" % ("collision stage, ball resting", full, fast, full / fast)
+
+    def game(fastPath):
+        def play():
+            world = makeWorld()
+            world.restingFastPath = fastPath
+            playScripted(world, 1000)
+        return play
+
+    full = timePerCall(game(False), 3) / 1000.0
+    fast = timePerCall(game(True), 3) / 1000.0
+    print "%-36s %12.3f %12.3f %7.2fx" % ("whole tick, scripted play", full, fast, full / fast)
+    print "(only the collision stage gets several times cheaper; the rest of a tick costs the same either way)"
+
+
+def recordSchedule(world, ticks, dt = .01):
+    """ Play world for the given number of ticks, steering the ball toward the gap below it
+
+    Returns the input schedule ((timeS, direction) pairs, see eventsim.py) that was played
+    """
+    schedule = []
+    direction = None
+    crushed = world.stateMachine.states['GotCrushed']
+    for i in xrange(0, ticks):
+        x, y = world.ball.getPosition()
+        target = x
+        for row in world.rows:
+            if row.yPos > y:
+                target = (row.gap + .5) * world.blockWidth
+                break
+        newDirection = 0
+        if x < target - 10:
+            newDirection = 1
+        elif x > target + 10:
+            newDirection = -1
+        if newDirection != direction:
+            direction = newDirection
+            schedule.append((i * dt, direction))
+        world.ball.setDirection(direction)
+        world.ball.respondToControllerInput()
+        world.step(dt)
+        if world.stateMachine.currentState == crushed:
+            break
+    return schedule
+
+
+def benchEventSim():
+    """ Event-driven simulation vs the tick engine, 10 minutes of game time
+    """
+    import eventsim
+
+    ticks = 60000
+    schedule = recordSchedule(makeWorld(), ticks)
+
+    def tickEngine():
+        world = makeWorld()
+        sim = eventsim.EventSim(world, schedule)    # (only used to look up the schedule)
+        for i in xrange(0, ticks):
+            world.ball.setDirection(sim.directionAt(i))
+            world.ball.respondToControllerInput()
+            world.step(.01)
+        return world.ball.getPosition()
+
+    def eventEngine():
+        sim = eventsim.EventSim(makeWorld(), schedule)
+        sim.runUntil(ticks)
+        return sim
+
+    tickPos = tickEngine()
+    sim = eventEngine()
+    print "%d input changes, %d events, final position (%.1f, %.1f) vs (%.1f, %.1f)" % (
+        len(schedule), len(sim.events), tickPos[0], tickPos[1], sim.x, sim.y)
+
+    full = min(timeit.repeat(tickEngine, number = 1, repeat = 1)) * 1000.0
+    fast = min(timeit.repeat(eventEngine, number = 1, repeat = 3)) * 1000.0
+    print "%-36s %12s %12s %8s" % ("", "tick ms", "event ms", "speedup")
+    print "%-36s %12.1f %12.1f %7.0fx" % ("10 minute game", full, fast, full / fast)
+
+
+def benchSurvival():
+    """ Survivability solver, random gap sequences
+    """
+    import random
+    import survival
+
+    solver = survival.solverForGameObject(makeWorld())
+    rng = random.Random(0)
+    print "%-36s %12s %12s %12s" % ("", "us/sequence", "us/row", "survivable")
+    for length in (10, 100, 1000):
+        sequences = [[rng.randint(0, solver.numBlocks - 1) for i in xrange(0, length)] for j in xrange(0, 100)]
+        survivable = [0]
+
+        def solveAll():
+            survivable[0] = 0
+            for gaps in sequences:
+                if solver.solve(gaps).survivable:
+                    survivable[0] += 1
+
+        us = timePerCall(solveAll, 1) / len(sequences)
+        print "%-36s %12.1f %12.2f %11d%%" % ("%d rows" % length, us, us / length, survivable[0])
+
+
+def benchLevelGen():
+    """ Procedural level generator:  cost per row, and tail latency
+    """
+    import levelgen
+
+    gen = levelgen.LevelGenerator(10, seed = 0)
+    print "%-36s %12s %12s" % ("", "mean us", "99.9% us")
+
+    # (The very worst calls are at the mercy of the OS scheduler, so report the 99.9th percentile)
+    times = [0.0] * 100000
+    clock = timeit.default_timer
+    for i in xrange(0, len(times)):
+        start = clock()
+        gen.nextRow()
+        times[i] = clock() - start
+    times.sort()
+    tail = times[int(len(times) * .999)] * 1000000.0
+    print "%-36s %12.3f %12.3f" % ("nextRow (100000 rows, ramping)", timePerCall(gen.nextRow), tail)
+
+    world = makeWorld()
+    plain = timePerCall(lambda: world.shiftRows(world.sizeY), 10000)
+    world.rowSource = levelgen.LevelGenerator(world.blocksPerRow, seed = 0)
+    world.resetLevel(world.sizeY)
+    generated = timePerCall(lambda: world.shiftRows(world.sizeY), 10000)
+    print "%-36s %12.3f" % ("shiftRows, random gap", plain)
+    print "%-36s %12.3f" % ("shiftRows, level generator", generated)
+
+
+def benchLevelFile():
+    """ Memory-mapped level files:  opening a big level, and reading rows
+    """
+    import os
+    import random
+    import tempfile
+    import levelfile
+
+    numRows = 1000000
+    fd, filename = tempfile.mkstemp(".fdl")
+    os.close(fd)
+    try:
+        levelfile.convertSeed(filename, 0, numRows)
+        print "%-36s %12s" % ("", "us")
+        print "%-36s %12.3f" % ("open %d-row level" % numRows,
+                                timePerCall(lambda: levelfile.LevelFile(filename).close(), 100))
+
+        level = levelfile.LevelFile(filename)
+        rng = random.Random(0)
+        rows = [rng.randint(0, numRows - 1) for i in xrange(0, 1000)]
+
+        def readRandomRows():
+            for n in rows:
+                level.row(n)
+
+        print "%-36s %12.3f" % ("row(n), random n", timePerCall(readRandomRows, 100) / len(rows))
+        print "%-36s %12.3f" % ("nextRow", timePerCall(level.nextRow))
+        level.close()
+    finally:
+        os.remove(filename)
+
+
+def benchTickRate():
+    """ Row movement at different tick rates:  speed accuracy, and CPU cost per second of game time
+    """
+    import row
+
+    print "%-36s %12s %12s %12s" % ("10 sec of row movement", "expected px", "whole px", "sub-pixel")
+    for speed, hz in ((200, 100), (150, 60), (200, 60), (200, 30), (330, 30)):
+        dt = 1.0 / hz
+        ticks = 10 * hz
+        # The old way (truncating every step to whole pixels), vs FalldownRow.moveRow
+        whole = 0
+        for i in xrange(0, ticks):
+            whole = whole + int(-speed * dt)
+        testRow = row.FalldownRow(0.0, 10, 80.0, 30.0, -speed)
+        for i in xrange(0, ticks):
+            testRow.moveRow(dt)
+        print "%-36s %12.1f %12.1f %12.1f" % ("%d px/sec at %d Hz" % (speed, hz), -speed * 10.0, whole, testRow.yPos)
+
+    print
+    print "%-36s %12s" % ("", "ms/game sec")
+    for hz in (100, 60, 30):
+        def play():
+            playScripted(makeWorld(), hz * 10, dt = 1.0 / hz)
+        print "%-36s %12.3f" % ("scripted play at %d Hz" % hz, timePerCall(play, 1) / 10000.0)
+
+
+def benchFixedPoint():
+    """ Fixed-point physics:  CPU cost per second of game time vs the float physics, and repeatability
+    """
+    print "%-36s %12s %12s" % ("", "ms/game sec", "state hash")
+    for fixed in (False, True):
+        hashes = set()
+        for i in xrange(0, 3):
+            world = makeWorld()
+            world.setFixedPointPhysics(fixed)
+            playScripted(world, 3000)
+            hashes.add(world.stateHash())
+
+        def play():
+            world = makeWorld()
+            world.setFixedPointPhysics(fixed)
+            playScripted(world, 3000)
+        name = "fixed-point" if fixed else "float"
+        ms = timePerCall(play, 1) / 30000.0
+        print "%-36s %12.3f %12s" % (name, ms, hashes.pop()[:12] if len(hashes) == 1 else "DIFFERS")
+
+
+def benchSnapshot():
+    """ World snapshots:  snapshot/restore vs copy.deepcopy of the GameObject
+    """
+    import copy
+    import snapshot
+
+    world = makeWorld()
+    playScripted(world, 500)
+    ring = snapshot.SnapshotRing(world.numRows, 64)
+    snap = world.snapshot()
+
+    print "%-36s %12s" % ("", "usec/call")
+    print "%-36s %12.1f" % ("copy.deepcopy(world)", timePerCall(lambda: copy.deepcopy(world), 200))
+    print "%-36s %12.1f" % ("world.snapshot(snap)", timePerCall(lambda: world.snapshot(snap), 20000))
+    print "%-36s %12.1f" % ("SnapshotRing.push", timePerCall(lambda: ring.push(world), 20000))
+    print "%-36s %12.1f" % ("world.restore(snap)", timePerCall(lambda: world.restore(snap), 20000))
+
+    def branch():
+        # Restore, then play 10 ticks from the snapshot (e.g. one AI lookahead branch)
+        world.restore(snap)
+        for i in xrange(0, 10):
+            world.step(.01)
+    print "%-36s %12.1f" % ("restore + 10 ticks", timePerCall(branch, 2000))
+
+
+def benchVersus():
+    """ Versus rollback:  cost of rolling back and re-simulating N ticks (vs a 16.7 ms frame at 60 FPS)
+    """
+    import versus
+
+    world = versus.makeVersusWorld(0)
+    playScripted(world, 300)
+    snap = world.snapshot()
+
+    print "%-36s %12s" % ("", "ms")
+    for n in (1, 4, 8, 16):
+        def rollback():
+            world.restore(snap)
+            for i in xrange(0, n):
+                world.step(versus.VERSUS_DT)
+        print "%-36s %12.3f" % ("restore + %d ticks" % n, timePerCall(rollback, 200) / 1000.0)
+
+    sessions = versus.playLocalMatch(3000, 1, 8, 8)
+    s = sessions[0]
+    print "%-36s %12.3f" % ("longest rollback in a local match", s.maxRollbackS * 1000.0)
+
+
+def benchCheckpoint():
+    """ Checkpoints:  cost on the game thread vs writing the file, and the worst tick while checkpointing
+    """
+    import os
+    import tempfile
+    import time
+    import checkpoint
+
+    world = makeWorld()
+    playScripted(world, 500)
+    filename = os.path.join(tempfile.mkdtemp(), "falldown.checkpoint")
+    writer = checkpoint.CheckpointWriter(filename)
+    snap = world.snapshot()
+
+    print "%-36s %12s" % ("", "usec")
+    print "%-36s %12.1f" % ("CheckpointWriter.save", timePerCall(lambda: writer.save(world), 1000))
+    writer.flush()
+    print "%-36s %12.1f" % ("encode + atomic write (writer thread)", timePerCall(
+        lambda: checkpoint.writeCheckpointFile(filename, checkpoint.encodeCheckpoint(
+            snap.numRows, snap.buffer, snap.randomState, snap.rowSourceState)), 100))
+    print "%-36s %12d" % ("checkpoint size (bytes)", os.path.getsize(filename))
+
+    # Worst tick (step + checkpoint every 10th tick), vs without checkpoints
+    for every in (0, 10):
+        worst = 0.0
+        for i in xrange(0, 2000):
+            start = time.time()
+            world.step(.01)
+            if every and i % every == 0:
+                writer.save(world)
+            worst = max(worst, time.time() - start)
+        writer.flush()
+        name = "worst tick, checkpoint every %d ticks" % every if every else "worst tick, no checkpoints"
+        print "%-36s %12.1f" % (name, worst * 1000000.0)
+
+    writer.discard()
+    writer.close()
+    os.rmdir(os.path.dirname(filename))
+
+
+def benchRLEnv():
+    """ RL environments:  env-steps/sec of VectorFalldownEnv, by number of copies
+    """
+    import time
+    import numpy
+    import falldownenv
+
+    print "%-36s %12s" % ("", "steps/sec")
+    for numEnvs in (1, 16, 256, 1024, 4096):
+        env = falldownenv.VectorFalldownEnv(numEnvs, seed = 1)
+        rng = numpy.random.RandomState(1)
+        actions = rng.randint(0, 3, (64, numEnvs))
+        env.reset()
+        steps = 0
+        start = time.time()
+        while time.time() - start < 1.0:
+            for i in xrange(0, 64):
+                env.step(actions[i])
+            steps += 64 * numEnvs
+        print "%-36s %12.0f" % ("%d copies" % numEnvs, steps / (time.time() - start))
+
+
+def benchPixelObs():
+    """ Pixel observations:  84 x 84 images rendered per second, from GameObjects and from VectorFalldownEnv
+    """
+    import numpy
+    import falldownenv
+    import pixelobs
+
+    print "%-36s %12s" % ("", "images/sec")
+    for numWorlds in (1, 16, 64):
+        worlds = [makeWorld(i) for i in xrange(0, numWorlds)]
+        renderer = pixelobs.PixelRenderer(numWorlds)
+        us = timePerCall(lambda: renderer.renderWorlds(worlds), max(10, 20000 / numWorlds))
+        print "%-36s %12.0f" % ("%d GameObjects" % numWorlds, numWorlds * 1000000.0 / us)
+        renderer.close()
+
+    for numEnvs in (16, 256):
+        env = falldownenv.VectorFalldownEnv(numEnvs, seed = 1)
+        env.reset()
+        env.step(numpy.ones(numEnvs, dtype = numpy.int64))
+        renderer = pixelobs.PixelRenderer(numEnvs)
+        us = timePerCall(lambda: renderer.renderEnv(env), max(10, 20000 / numEnvs))
+        print "%-36s %12.0f" % ("VectorFalldownEnv, %d copies" % numEnvs, numEnvs * 1000000.0 / us)
+        renderer.close()
+
+
+def benchAutopilot():
+    """ Autopilot:  planning cost per tick, and a headless soak on a generated level
+    """
+    import autopilot
+
+    report = autopilot.soak(20000, seed = 0)
+    print "%-36s %12s %12s %12s %12s" % ("", "us/tick", "worst us", "rows", "crushes")
+    print "%-36s %12.2f %12.1f %12d %12d" % ("20000 ticks, level generator", report.updateS * 1000000.0 / report.ticks,
+                                             report.worstUpdateS * 1000000.0, report.rowsShifted, report.crushes)
+
+
+def benchManifold():
+    """ Contact manifold:  tick cost, and ticks with more than one contact, as the rows get closer together
+    """
+    import gameobj
+    import levelgen
+
+    resolved = [0]
+    resolveManifold = gameobj.GameObject.collision_ResolveManifold
+
+    def countingResolve(self):
+        resolved[0] += 1
+        resolveManifold(self)
+
+    print "%-36s %12s %12s" % ("", "us/tick", "multi-contact")
+    gameobj.GameObject.collision_ResolveManifold = countingResolve
+    try:
+        for spacing in (105.0, 60.0, 45.0):
+            world = makeWorld()
+            world.rowSource = levelgen.LevelGenerator(10, seed = 1, spacing = spacing)
+            world.resetLevel(600)
+            resolved[0] = 0
+            us = timePerCall(lambda: playScripted(world, 1000), 5) / 1000
+            # (timePerCall plays 3 runs of 5 calls)
+            print "%-36s %12.2f %12.1f%%" % ("row spacing %d" % spacing, us, resolved[0] * 100.0 / (3 * 5 * 1000))
+    finally:
+        gameobj.GameObject.collision_ResolveManifold = resolveManifold
+
+
+def benchMultiBall():
+    """ Multi-ball mode:  tick cost by number of balls (the broadphase keeps the cost per ball flat)
+    """
+    print "%-36s %12s %12s" % ("", "us/tick", "us/ball")
+    for numBalls in (1, 2, 10, 100, 500):
+        world = makeWorld()
+        world.setBallCount(numBalls)
+        # (Steer the balls right, so they fall through the gaps)
+        world.ball.setDirection(1)
+        world.ball.respondToControllerInput()
+        snap = world.snapshot()
+
+        def play():
+            # Start over every 100 ticks, so no balls are crushed and every tick has all of them in play
+            world.restore(snap)
+            for i in xrange(0, 100):
+                world.step(.01)
+
+        us = timePerCall(play, max(1, 200 / numBalls)) / 100
+        print "%-36s %12.1f %12.2f" % ("%d balls" % numBalls, us, us / numBalls)
+
+
+def benchSpatialHash():
+    """ Collidables:  tick cost, and the cost of finding what the ball touches, with and without the spatial hash
+    """
+    import random
+    import collision
+    import spatialhash
+
+    print "%-36s %12s %12s %12s" % ("", "us/tick", "hash us", "all-pairs us")
+    for numCollidables in (0, 100, 500, 2000):
+        world = makeWorld()
+        rng = random.Random(1)
+        for i in xrange(0, numCollidables):
+            # (A kind with no handler, so none of them are collected and the count stays put)
+            world.addCollidable(rng.randrange(0, world.numRows), 'marker', rng.uniform(0, 800), 6, 6)
+        collidables = [obj for row in world.rows if row.collidables for obj in row.collidables]
+        sphere = world.ball.collisionGeom
+        hits = []
+
+        def viaHash():
+            del hits[:]
+            world.spatialHash.querySphere(sphere.center[0], sphere.center[1], sphere.r, hits)
+            for obj in hits:
+                geom = obj.geom
+                collision.isIntersecting_Sphere_AABB_f(sphere.center[0], sphere.center[1], sphere.r,
+                                                       geom.center[0], geom.center[1], geom.r[0], geom.r[1])
+
+        def allPairs():
+            for obj in collidables:
+                geom = obj.geom
+                collision.isIntersecting_Sphere_AABB_f(sphere.center[0], sphere.center[1], sphere.r,
+                                                       geom.center[0], geom.center[1], geom.r[0], geom.r[1])
+
+        us = timePerCall(lambda: playScripted(world, 1000), 5) / 1000
+        print "%-36s %12.2f %12.2f %12.2f" % ("%d collidables" % numCollidables, us, timePerCall(viaHash, 10000),
+                                              timePerCall(allPairs, 1000))
+
+
+# Benchmark name -> function
+BENCHMARKS = [
+    ("collision", benchCollisionKernels),
+    ("math", benchMath),
+    ("batchcollision", benchBatchedCollision),
+    ("memory", benchMemory),
+    ("resting", benchResting),
+    ("eventsim", benchEventSim),
+    ("survival", benchSurvival),
+    ("levelgen", benchLevelGen),
+    ("levelfile", benchLevelFile),
+    ("tickrate", benchTickRate),
+    ("fixedpoint", benchFixedPoint),
+    ("snapshot", benchSnapshot),
+    ("versus", benchVersus),
+    ("checkpoint", benchCheckpoint),
+    ("rlenv", benchRLEnv),
+    ("pixelobs", benchPixelObs),
+    ("autopilot", benchAutopilot),
+    ("manifold", benchManifold),
+    ("multiball", benchMultiBall),
+    ("spatialhash", benchSpatialHash),
+]
+
+
+def main(names):
+    for name, fn in BENCHMARKS:
+        if names and name not in names:
+            continue
+        print "== %s: %s" % (name, fn.__doc__.strip())
+        fn()
+        print
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
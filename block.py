@@ -8,9 +8,12 @@ __author__ = 'Mass KonFuzion'
 import pygame
 from MKFMath.Vector2D import *
 
-class FalldownBlock:
+class FalldownBlock(object):
     """ Block class
     """
+    # Rows hold many blocks, so blocks are slotted (no per-instance __dict__)
+    __slots__ = ('position', 'width', 'height')
+
     def __init__(self, blockWidth = 50.0, blockHeight = 30.0, blocksPerRow = 16.0):
         """ Initialize the FalldownBlock
 
@@ -44,6 +47,7 @@ class FalldownBlock:
         # Note:  We're not actually creating a Rect object; we're simply creating a 4-tuple.  Pygame defines a Rect
         # object as a 4-tuple, with the following elements:  x, y, w, h.  Thus, Pygame
         # uses the 4-tuple/Rect object to draw a rectangle at screen position (x,y), with width = w and height = h.
-        myRect = (self.position[0], self.position[1], self.width, self.height)
+        # (The position can be a fraction of a pixel -- see FalldownRow.moveRow)
+        myRect = (int(self.position[0]), int(self.position[1]), self.width, self.height)
 
         pygame.draw.rect(screen, (200,0,0), myRect, 2)
\ No newline at end of file
@@ -0,0 +1,258 @@
+""" Mid-game checkpoints for Falldown
+
+A checkpoint is a WorldSnapshot (see snapshot.py) saved to disk, so a game in progress survives a power cut or a
+restart.  The file format is:
+
+    header      magic "FDCP", version, number of rows, snapshot size, aux size     (CHECKPOINT_HEADER, 16 bytes)
+    snapshot    the snapshot's packed buffer
+    aux         the random module's state, the row source's state, the Collidables, and the level's identity,
+                marshalled
+    crc         CRC-32 of everything before it                                      (CHECKPOINT_CRC, 4 bytes)
+
+Checkpoints are written atomically (to a temporary file, which then replaces the checkpoint), so a power cut in
+the middle of a write leaves the previous checkpoint intact.
+
+A CheckpointWriter writes checkpoints on a background thread:  the game thread only takes the snapshot (tens of
+microseconds), so saving a checkpoint never holds up a frame.
+
+Usage:
+    writer = CheckpointWriter("falldown.checkpoint")
+    writer.save(world)                                  # every few seconds, while playing
+    ...
+    resumeFromCheckpoint(world, "falldown.checkpoint")  # at startup
+"""
+
+__author__ = 'Mass KonFuzion'
+
+import marshal
+import os
+import struct
+import threading
+import zlib
+
+from snapshot import BALL_FORMAT, WorldSnapshot, snapshotLayout
+
+# magic, version, number of rows, snapshot size, aux size
+CHECKPOINT_HEADER = struct.Struct("<4sHHII")
+CHECKPOINT_CRC = struct.Struct("<I")
+CHECKPOINT_MAGIC = "FDCP"
+CHECKPOINT_VERSION = 1
+
+# Pending-write marker:  remove the checkpoint file
+_DISCARD = object()
+
+
+def levelIdentity(world):
+    """ Return the identity of world's level (its row source's identity() -- see levelgen.py), or None if it has none
+    """
+    rowSource = world.rowSource
+    if rowSource != None and hasattr(rowSource, 'identity'):
+        return rowSource.identity()
+    return None
+
+
+def encodeCheckpoint(numRows, buffer, randomState, rowSourceState, collidableState = None, identity = None):
+    """ Return the checkpoint file contents for a snapshot (given as its number of rows, packed buffer, random
+    state, row source state, and Collidable state), on the level with the given identity (see levelIdentity)
+    """
+    aux = marshal.dumps((randomState, rowSourceState, collidableState, identity))
+    data = CHECKPOINT_HEADER.pack(CHECKPOINT_MAGIC, CHECKPOINT_VERSION, numRows, len(buffer), len(aux)) + \
+           str(buffer) + aux
+    return data + CHECKPOINT_CRC.pack(zlib.crc32(data) & 0xffffffff)
+
+
+def decodeCheckpoint(data):
+    """ Return the WorldSnapshot in checkpoint file contents, and the identity of the level it was saved on
+
+    Raises ValueError if data is not a checkpoint (or is damaged)
+    """
+    if len(data) < CHECKPOINT_HEADER.size + CHECKPOINT_CRC.size:
+        raise ValueError("not a Falldown checkpoint")
+    magic, version, numRows, snapshotSize, auxSize = CHECKPOINT_HEADER.unpack_from(data)
+    if magic != CHECKPOINT_MAGIC or version != CHECKPOINT_VERSION:
+        raise ValueError("not a Falldown checkpoint")
+    end = CHECKPOINT_HEADER.size + snapshotSize + auxSize
+    if len(data) != end + CHECKPOINT_CRC.size:
+        raise ValueError("checkpoint is truncated")
+    if CHECKPOINT_CRC.unpack_from(data, end)[0] != zlib.crc32(data[:end]) & 0xffffffff:
+        raise ValueError("checkpoint is damaged")
+
+    # In multi-ball mode, the snapshot ends with the other balls (see snapshot.py)
+    ballSize = struct.calcsize("<" + BALL_FORMAT)
+    extra = snapshotSize - snapshotLayout(numRows).size
+    if extra < 0 or extra % ballSize != 0:
+        raise ValueError("checkpoint is from a different version of the game")
+    snap = WorldSnapshot(numRows, 1 + (extra // ballSize))
+    start = CHECKPOINT_HEADER.size
+    snap.buffer[:] = data[start:start + snapshotSize]
+    aux = marshal.loads(data[start + snapshotSize:end])
+    snap.randomState, snap.rowSourceState = aux[:2]
+    # (Checkpoints written before there were Collidables don't have them)
+    if len(aux) > 2:
+        snap.collidableState = aux[2]
+    # (Nor the level's identity)
+    identity = None
+    if len(aux) > 3:
+        identity = aux[3]
+    return snap, identity
+
+
+def writeCheckpointFile(filename, data):
+    """ Replace the file with data, atomically
+    """
+    tmpName = filename + ".tmp"
+    f = open(tmpName, "wb")
+    try:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    finally:
+        f.close()
+    try:
+        os.rename(tmpName, filename)
+    except OSError:
+        # (Windows won't rename over an existing file)
+        os.remove(filename)
+        os.rename(tmpName, filename)
+
+
+def loadCheckpoint(filename):
+    """ Return the WorldSnapshot saved in a checkpoint file, and the identity of the level it was saved on
+
+    Raises IOError if the file can't be read, or ValueError if it is not a checkpoint (or is damaged)
+    """
+    f = open(filename, "rb")
+    try:
+        data = f.read()
+    finally:
+        f.close()
+    return decodeCheckpoint(data)
+
+
+def resumeFromCheckpoint(world, filename):
+    """ Put world (an initialized GameObject) in the state saved in a checkpoint file
+
+    Returns True if the game was resumed, or False if there is no usable checkpoint (e.g. there isn't one, it's
+    damaged, or it's for a different level, or a level with a different number of rows or balls)
+    """
+    try:
+        snap, identity = loadCheckpoint(filename)
+    except (IOError, ValueError):
+        return False
+    if snap.numRows != world.numRows or snap.numBalls > world.ballCount:
+        return False
+    # The checkpoint has to be from the same level (e.g. not another level file's, with the same kind of state)
+    if identity != levelIdentity(world):
+        return False
+    # The checkpoint has to be from the same kind of row source (e.g. not a level file's, for a level generator)
+    if world.rowSource == None or not hasattr(world.rowSource, 'getState'):
+        if snap.rowSourceState != None:
+            return False
+    elif type(snap.rowSourceState) != type(world.rowSource.getState()):
+        return False
+    world.restore(snap)
+    return True
+
+
+class CheckpointWriter(object):
+    """ Writes checkpoints of a game to a file, on a background thread
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        # Snapshot that save() takes (reused for every checkpoint)
+        self.snapshot = None
+
+        # The next write for the thread:  (numRows, buffer, random state, row source state, Collidable state, level
+        # identity), _DISCARD, or None.  A newer checkpoint replaces one that hasn't been written yet
+        self.pending = None
+        self.busy = False
+        self.closing = False
+        self.condition = threading.Condition()
+        # Number of checkpoints written, and the last error (if any) the thread ran into
+        self.written = 0
+        self.error = None
+
+        self.thread = threading.Thread(target = self.run, name = "CheckpointWriter")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def save(self, world):
+        """ Take a snapshot of world, and write it to the checkpoint file (in the background)
+        """
+        if self.snapshot == None or self.snapshot.numRows != world.numRows or \
+           self.snapshot.numBalls != len(world.balls):
+            self.snapshot = WorldSnapshot(world.numRows, len(world.balls))
+        snap = world.snapshot(self.snapshot)
+        # Copy the buffer (the snapshot is reused); the other states are immutable
+        self.post((snap.numRows, str(snap.buffer), snap.randomState, snap.rowSourceState, snap.collidableState,
+                   levelIdentity(world)))
+
+    def discard(self):
+        """ Remove the checkpoint file (e.g. when the game is over, so there's nothing to resume)
+        """
+        self.post(_DISCARD)
+
+    def post(self, job):
+        self.condition.acquire()
+        try:
+            self.pending = job
+            self.condition.notify()
+        finally:
+            self.condition.release()
+
+    def flush(self):
+        """ Wait until every checkpoint saved so far is on disk
+        """
+        self.condition.acquire()
+        try:
+            while self.pending != None or self.busy:
+                self.condition.wait()
+        finally:
+            self.condition.release()
+
+    def close(self):
+        """ Write any pending checkpoint, and stop the thread
+        """
+        self.condition.acquire()
+        try:
+            self.closing = True
+            self.condition.notify()
+        finally:
+            self.condition.release()
+        self.thread.join()
+
+    def run(self):
+        """ The writer thread
+        """
+        while True:
+            self.condition.acquire()
+            try:
+                while self.pending == None and not self.closing:
+                    self.condition.wait()
+                job = self.pending
+                self.pending = None
+                if job == None:
+                    # Closing, and nothing left to write
+                    return
+                self.busy = True
+            finally:
+                self.condition.release()
+
+            try:
+                if job is _DISCARD:
+                    if os.path.exists(self.filename):
+                        os.remove(self.filename)
+                else:
+                    writeCheckpointFile(self.filename, encodeCheckpoint(*job))
+                    self.written += 1
+            except (IOError, OSError), e:
+                # Keep playing:  a failed checkpoint only means there's less to resume from
+                self.error = e
+
+            self.condition.acquire()
+            try:
+                self.busy = False
+                self.condition.notifyAll()
+            finally:
+                self.condition.release()
@@ -8,19 +8,22 @@ import pygame
 
 __author__ = 'Mass KonFuzion'
 
-class CollisionGeomAABB:
+class CollisionGeomAABB(object):
     """ The CollisionGeomAABB is simply a rectangle.
 
     Collisions will be handled by creating an axis-aligned bounding box rectangle,
 
     """
+    # The collision geoms are slotted (no per-instance __dict__); every row owns up to 2 of them
+    __slots__ = ('center', 'r')
+
     def __init__(self, rx = 0.0, ry = 0.0):
         """ Initialize CollisionGeom (axis-aligned bounding box)
         """
 
         # The dimensions of the CollisionGeom
         self.center = Vector2D()
-        self.r = [float(rx), float(ry)]
+        self.r = Vector2D(float(rx), float(ry))
 
     def setPosition(self, x, y):
         """ Set the position of the CollisionGeom
@@ -65,9 +68,11 @@ class CollisionGeomAABB:
 
         pygame.draw.rect(screen, (200, 200, 200), myRect, 1)
 
-class CollisionGeomSphere:
+class CollisionGeomSphere(object):
     """ Sphere collision geometry
     """
+    __slots__ = ('center', 'r')
+
     def __init__(self, radius = 0.0):
         self.center = Vector2D(0.0, 0.0)
         self.r = float(radius)
@@ -81,11 +86,12 @@ class CollisionGeomSphere:
     def draw(self, screen):
         pygame.draw.circle(screen, (200, 200, 200), (int(self.center[0]), int(self.center[1])), int(self.r), 1)
 
-class CollisionGeomCapsule:
+class CollisionGeomCapsule(object):
     """ Capsule collision geometry
 
     A "capsule" is a sphere-swept line segment
     """
+    __slots__ = ('a', 'b', 'r')
 
     def __init__(self):
         self.a = Vector2D()
@@ -101,9 +107,10 @@ class CollisionGeomCapsule:
     def setRadius(self, radius):
         self.r = float(radius)
 
-class CollisionGeomSegment:
+class CollisionGeomSegment(object):
     """ Line segment collision geometry
     """
+    __slots__ = ('a', 'b')
 
     def __init__(self):
         self.a = Vector2D()
@@ -118,28 +125,152 @@ class CollisionGeomSegment:
 
 
 #=================================================
-# Essential Distance Functions
+# Scalar Kernels
 #=================================================
+# These work on plain floats -- sphere center and radius, box center and half-extents -- and
+# never create Vector2Ds or CollisionGeoms, so they allocate nothing per call.  The object-based
+# functions further down are thin wrappers around them.
 
-def sqDist_Point_AABB(p, b):
-    """ Return the square of the distance between a point p and AABB b
-    (i.e. the closest distance)
+def sqDist_Point_AABB_f(px, py, cx, cy, rx, ry):
+    """ Return the square of the distance between point (px, py) and the AABB centered at
+    (cx, cy) with half-extents (rx, ry)
     """
-
     sqDist = 0.0
 
-    b_min = b.getMinPoint()
-    b_max = b.getMaxPoint()
+    # x axis
+    v = cx - rx
+    if px < v:
+        sqDist = sqDist + ((v - px) * (v - px))
+    v = cx + rx
+    if px > v:
+        sqDist = sqDist + ((px - v) * (px - v))
+
+    # y axis
+    v = cy - ry
+    if py < v:
+        sqDist = sqDist + ((v - py) * (v - py))
+    v = cy + ry
+    if py > v:
+        sqDist = sqDist + ((py - v) * (py - v))
 
-    for i in xrange(0, 2):
-        v = p[i]
+    return sqDist
 
-        if v < b_min[i]:
-            sqDist = sqDist + ((b_min[i] - v) * (b_min[i] - v))
-        if v > b_max[i]:
-            sqDist = sqDist + ((v - b_max[i]) * (v - b_max[i]))
 
-    return sqDist
+def isIntersecting_Sphere_AABB_f(sx, sy, sr, cx, cy, rx, ry):
+    """ Return True if the sphere at (sx, sy) with radius sr overlaps the AABB centered at
+    (cx, cy) with half-extents (rx, ry)
+    """
+    return sqDist_Point_AABB_f(sx, sy, cx, cy, rx, ry) <= sr * sr
+
+
+def minimumPenetrationDepthAndNormal_Sphere_AABB_f(sx, sy, sr, cx, cy, rx, ry, outNormal):
+    """ Return the smallest penetration depth of a sphere into an AABB, and write the
+    corresponding surface normal into outNormal[0] and outNormal[1]
+
+    NOTE:  This function assumes that the sphere is already colliding with the AABB
+    """
+    # Vector that points from the center of the box to the center of the sphere
+    vx = sx - cx
+    vy = sy - cy
+
+    # Top side (normal [0, -1]) -- in Pygame, "top" is the min y side
+    d = ry + vy + sr
+    nx = 0.0
+    ny = -1.0
+
+    # Left side (normal [-1, 0])
+    tmp = rx + vx + sr
+    if tmp < d:
+        d = tmp
+        nx = -1.0
+        ny = 0.0
+
+    # Bottom side (normal [0, 1])
+    tmp = ry - vy + sr
+    if tmp < d:
+        d = tmp
+        nx = 0.0
+        ny = 1.0
+
+    # Right side (normal [1, 0])
+    tmp = rx - vx + sr
+    if tmp < d:
+        d = tmp
+        nx = 1.0
+        ny = 0.0
+
+    outNormal[0] = nx
+    outNormal[1] = ny
+    return d
+
+
+def intersect_Ray_AABB_f(px, py, dx, dy, cx, cy, rx, ry):
+    """ Return the time t where a ray, starting at (px, py) in direction (dx, dy), enters the
+    AABB centered at (cx, cy) with half-extents (rx, ry), or None if it misses
+    """
+    tmin = 0.0
+    tmax = FLT_MAX
+
+    # x slab
+    if abs(dx) < EPSILON_E5:
+        # Ray is parallel to slab. No hit if origin not within slab
+        if px < cx - rx or px > cx + rx:
+            return None
+    else:
+        ood = 1.0 / dx
+        t1 = (cx - rx - px) * ood
+        t2 = (cx + rx - px) * ood
+        if t1 > t2:
+            t1, t2 = t2, t1
+        if t1 > tmin:
+            tmin = t1
+        if t2 < tmax:
+            tmax = t2
+        if tmin > tmax:
+            return None
+
+    # y slab
+    if abs(dy) < EPSILON_E5:
+        if py < cy - ry or py > cy + ry:
+            return None
+    else:
+        ood = 1.0 / dy
+        t1 = (cy - ry - py) * ood
+        t2 = (cy + ry - py) * ood
+        if t1 > t2:
+            t1, t2 = t2, t1
+        if t1 > tmin:
+            tmin = t1
+        if t2 < tmax:
+            tmax = t2
+        if tmin > tmax:
+            return None
+
+    return tmin
+
+
+def willIntersectMoving_Sphere_AABB_f(sx, sy, sr, svx, svy, cx, cy, rx, ry, bvx, bvy):
+    """ Return the time t at which a moving sphere first touches a moving AABB (or None)
+
+    The sphere is at (sx, sy) with radius sr, moving by (svx, svy) per unit time; the box is
+    centered at (cx, cy) with half-extents (rx, ry), moving by (bvx, bvy) per unit time.
+    """
+    # Treat the box as stationary, and cast the sphere center along the relative velocity
+    # against the box expanded by the sphere radius
+    return intersect_Ray_AABB_f(sx, sy, svx - bvx, svy - bvy, cx, cy, rx + sr, ry + sr)
+
+
+
+#=================================================
+# Essential Distance Functions
+#=================================================
+
+def sqDist_Point_AABB(p, b):
+    """ Return the square of the distance between a point p and AABB b
+    (i.e. the closest distance)
+    """
+
+    return sqDist_Point_AABB_f(p[0], p[1], b.center[0], b.center[1], b.r[0], b.r[1])
 
 
 def sqDist_Point_Segment(segA, segB, ptC):
@@ -326,55 +457,9 @@ def minimumPenetrationDepthAndNormal_Sphere_AABB(s, b):
 
     NOTE:  This function assumes that the sphere is already colliding with the AABB
     """
-    b_min = b.getMinPoint()
-    b_max = b.getMaxPoint()
-
-    n = Vector2D() # Surface normal vector to return
-    retn = Vector2D()
-    d = 0.0
-
-    # Get the vector that points from the center of the box to the center of the sphere
-    v = Vector2D()
-    Vector2D_sub(s.center, b.center, v)
-
-
-    # NOTE:  In normal circumstances, we would calculate a surface normal.
-    # But since we're working with axis-aligned boxes, we already know the normal, so fuggit :-)
-
-    # Do Top Side First
-    # In Pygame, "top side" is (b_min[0], b_min[1]) --> (b_max[0], b_min[1])
-    Vector2D_setxy(n, 0, -1)
-    d = b.r[1] - (Vector2D_dot(v, n) - s.r)
-    Vector2D_setxy(retn, n[0], n[1])
-    #print "depth: %f, v: %s" % (d, n)
-
-    # Do left side
-    Vector2D_setxy(n, -1, 0)
-    tmp = b.r[0] - (Vector2D_dot(v, n) - s.r)
-    #print "depth: %f, v: %s" % (tmp, n)
-
-    if tmp < d:
-        d = tmp
-        Vector2D_setxy(retn, n[0], n[1])
-
-    # Do bottom side
-    Vector2D_setxy(n, 0, 1)
-    tmp = b.r[1] - (Vector2D_dot(v, n) - s.r)
-    #print "depth: %f, v: %s" % (tmp, n)
-
-    if tmp < d:
-        d = tmp
-        Vector2D_setxy(retn, n[0], n[1])
-
-    # Do right side
-    Vector2D_setxy(n, 1, 0)
-    tmp = b.r[0] - (Vector2D_dot(v, n) - s.r)
-    #print "depth: %f, v: %s" % (tmp, n)
-
-    if tmp < d:
-        d = tmp
-        Vector2D_setxy(retn, n[0], n[1])
-
+    retn = Vector2D() # Surface normal vector to return
+    d = minimumPenetrationDepthAndNormal_Sphere_AABB_f(s.center[0], s.center[1], s.r,
+                                                       b.center[0], b.center[1], b.r[0], b.r[1], retn)
     return d, retn
 
 
@@ -550,77 +635,144 @@ def isIntersecting_Sphere_AABB(sphere, box):
     NOTE:  If the collision test returns True, then go for more refined collision
     testing and response.
     """
-
-    # Compute squared distance between sphere center and AABB
-    sqDist = sqDist_Point_AABB(sphere.center, box)
-
     # Sphere and AABB intersect if the (squared) distance between the sphere center and AABB is less than the (squared)
     # sphere radius
-    return (sqDist <= sphere.r * sphere.r)
+    return isIntersecting_Sphere_AABB_f(sphere.center[0], sphere.center[1], sphere.r,
+                                        box.center[0], box.center[1], box.r[0], box.r[1])
 
 
 def intersect_Ray_AABB(p, d, a):
     """ Return the time (or index) t where a ray, starting at point p, in direction d, intersects with AABB a
     """
-
-    tmin = 0.0
-    tmax = FLT_MAX
-
-    a_min = a.getMinPoint()
-    a_max = a.getMaxPoint()
-
-    for i in xrange(0,2):
-        if abs(d[i]) < EPSILON_E5:
-            # Ray is parallel to slab. No hit if origin not within slab
-            if p[i] < a_min[i] or p[i] > a_max[i]:
-                return None
-        else:
-            # Compute intersection of t value of ray with near and far plane of slab
-            ood = 1.0 / d[i]
-            t1 = (a_min[i] - p[i]) * ood
-            t2 = (a_max[i] - p[i]) * ood
-            # Make t1 the intersection with near plane; t2 is intersection of far plane
-            if t1 > t2:
-                # Swap t1 and t2
-                t1, t2 = t2, t1
-            # Compute the intersection of slab intersection intervals
-            if t1 > tmin:
-                tmin = t1
-
-            if t2 > tmax:
-                tmax = t2
-            # Exit with no collision as soon as slab intersection becomes empty
-            if tmin > tmax:
-                return None
-    # Ray intersects all 3 slabs.  Return the time t of intersection (tmin)
-    return tmin
+    return intersect_Ray_AABB_f(p[0], p[1], d[0], d[1], a.center[0], a.center[1], a.r[0], a.r[1])
 
 def willIntersectMoving_Sphere_AABB(s, svel, b, bvel):
     """ Intersect a moving sphere with a moving AABB
     The sphere is s
-    The direction of movement of the sphere is given by d
-    The box is b
+    The direction of movement of the sphere is given by svel
+    The box is b, moving in direction bvel
 
     Return time t of intersection (or None if no intersection)
     """
-    # TODO:  Make this a bool -- or otherwise rename it to something sensible
     # TODO: Do we test for current intersection? Or do we keep it as 2 separate tests
     # TODO: If so, then do we also get rid of the is-intersecting test from willIntersect_AABB_AABB?
 
-    # Subtract the velocity of the box from the ball (Treat the box as stationary and the ball as moving)
-    # i.e. compute the relative velocity of the sphere to the box
-    rvel = Vector2D()
-    Vector2D_sub(svel, bvel, rvel)
+    #NOTE:  Technically, the most accurate way to do this function is to use a sphere-swept rectangle (lozenge)
+    return willIntersectMoving_Sphere_AABB_f(s.center[0], s.center[1], s.r, svel[0], svel[1],
+                                             b.center[0], b.center[1], b.r[0], b.r[1], bvel[0], bvel[1])
 
-    # Create a copy of b, to extend the boundaries by the radius of r
-    e = CollisionGeomAABB()
-    e.setPosition(b.center[0], b.center[1])
-    e.setDimensions(b.r[0] + s.r, b.r[1] + s.r)
 
-    #NOTE:  Technically, the most accurate way to do this function is to use a sphere-swept rectangle (lozenge)
 
-    # Intersect ray against expanded AABB e. Exit with no intersection if ray misses e; otherwise, get the intersection
-    # point p and time t as a result
-    tIntersection = intersect_Ray_AABB(s.center, svel, e)
+#=================================================
+# Batched Sphere / AABB (requires NumPy)
+#=================================================
+# These answer the same questions as the Sphere / AABB functions above, but for every pairing of n spheres
+# with m boxes in one call.  Spheres are given as an (n, 2) array of centers and an (n,) array of radii; boxes
+# as (m, 2) arrays of centers and half-extents.  Results are (n, m) arrays, where [i, j] is the answer for
+# sphere i against box j.  (To test a single sphere or box, pass arrays with one row.)
+
+def packSpheres(spheres):
+    """ Return (centers, radii) arrays for a list of CollisionGeomSpheres
+    """
+    import numpy
+    centers = numpy.array([s.center for s in spheres], dtype = numpy.float64).reshape(-1, 2)
+    radii = numpy.array([s.r for s in spheres], dtype = numpy.float64)
+    return centers, radii
+
 
-    return tIntersection
\ No newline at end of file
+def packAABBs(boxes):
+    """ Return (centers, halfExtents) arrays for a list of CollisionGeomAABBs
+    """
+    import numpy
+    centers = numpy.array([b.center for b in boxes], dtype = numpy.float64).reshape(-1, 2)
+    halfExtents = numpy.array([b.r for b in boxes], dtype = numpy.float64).reshape(-1, 2)
+    return centers, halfExtents
+
+
+def sqDist_Points_AABBs(points, boxCenters, boxHalfExtents):
+    """ Return the (n, m) array of squared distances between n points and m AABBs
+    """
+    import numpy
+    # Per-axis distance outside the box (0 when the point is within the box's extent on that axis)
+    v = numpy.abs(points[:, numpy.newaxis, :] - boxCenters[numpy.newaxis, :, :]) - boxHalfExtents[numpy.newaxis, :, :]
+    numpy.maximum(v, 0.0, v)
+    return numpy.einsum('ijk,ijk->ij', v, v)
+
+
+def isIntersecting_Spheres_AABBs(centers, radii, boxCenters, boxHalfExtents):
+    """ Return an (n, m) boolean mask; [i, j] is True if sphere i overlaps box j
+    """
+    return sqDist_Points_AABBs(centers, boxCenters, boxHalfExtents) <= (radii * radii)[:, None]
+
+
+def minimumPenetrationDepthAndNormal_Spheres_AABBs(centers, radii, boxCenters, boxHalfExtents):
+    """ Return (depths, normals): the (n, m) smallest penetration depths of each sphere into each box, and the
+    (n, m, 2) corresponding surface normals
+
+    As with minimumPenetrationDepthAndNormal_Sphere_AABB, the results are only meaningful for pairs that are
+    colliding -- mask them with isIntersecting_Spheres_AABBs.  Ties are broken the same way (top, left, bottom,
+    right).
+    """
+    import numpy
+    # Vector that points from the center of each box to the center of each sphere
+    v = centers[:, numpy.newaxis, :] - boxCenters[numpy.newaxis, :, :]
+    r = radii[:, numpy.newaxis]
+    rx = boxHalfExtents[numpy.newaxis, :, 0]
+    ry = boxHalfExtents[numpy.newaxis, :, 1]
+
+    # Depth through each side, stacked in the order top, left, bottom, right
+    sides = numpy.empty((4,) + v.shape[:2])
+    sides[0] = ry + v[:, :, 1] + r
+    sides[1] = rx + v[:, :, 0] + r
+    sides[2] = ry - v[:, :, 1] + r
+    sides[3] = rx - v[:, :, 0] + r
+
+    # argmin returns the first minimum, which matches the scalar kernel's strict < comparisons
+    side = numpy.argmin(sides, axis = 0)
+    depths = sides.min(axis = 0)
+    sideNormals = numpy.array([[0.0, -1.0], [-1.0, 0.0], [0.0, 1.0], [1.0, 0.0]])
+    return depths, sideNormals[side]
+
+
+def intersect_Rays_AABBs(origins, directions, boxCenters, boxHalfExtents):
+    """ Return the (n, m) times where each of n rays enters each of m AABBs (NaN where the ray misses)
+
+    origins and directions are (n, 2) arrays, or (n, m, 2) arrays when each pairing has its own ray
+    """
+    import numpy
+    if origins.ndim == 2:
+        origins = origins[:, numpy.newaxis, :]
+    if directions.ndim == 2:
+        directions = directions[:, numpy.newaxis, :]
+    lo = boxCenters - boxHalfExtents
+    hi = boxCenters + boxHalfExtents
+
+    parallel = numpy.abs(directions) < EPSILON_E5
+    ood = 1.0 / numpy.where(parallel, 1.0, directions)
+    t1 = (lo - origins) * ood
+    t2 = (hi - origins) * ood
+    tNear = numpy.minimum(t1, t2)
+    tFar = numpy.maximum(t1, t2)
+
+    # A ray parallel to a slab puts no limit on t if its origin is within the slab; otherwise it misses
+    inside = (origins >= lo) & (origins <= hi)
+    tNear = numpy.where(parallel, numpy.where(inside, -numpy.inf, numpy.inf), tNear)
+    tFar = numpy.where(parallel, numpy.inf, tFar)
+
+    tmin = numpy.maximum(tNear.max(axis = 2), 0.0)
+    tmax = numpy.minimum(tFar.min(axis = 2), FLT_MAX)
+    return numpy.where(tmin <= tmax, tmin, numpy.nan)
+
+
+def willIntersectMoving_Spheres_AABBs(centers, radii, velocities, boxCenters, boxHalfExtents, boxVelocities):
+    """ Return the (n, m) times at which each moving sphere first touches each moving box (NaN where they don't)
+
+    velocities is (n, 2) and boxVelocities is (m, 2), both in distance per unit time
+    """
+    import numpy
+    # Same approach as willIntersectMoving_Sphere_AABB_f:  cast each sphere center along its velocity relative
+    # to the box, against the box expanded by the sphere radius
+    relVel = velocities[:, numpy.newaxis, :] - boxVelocities[numpy.newaxis, :, :]
+    expanded = boxHalfExtents[numpy.newaxis, :, :] + radii[:, numpy.newaxis, numpy.newaxis]
+    origins = numpy.broadcast_to(centers[:, numpy.newaxis, :], relVel.shape)
+    return intersect_Rays_AABBs(origins, relVel, boxCenters, expanded)
@@ -0,0 +1,656 @@
+""" Event-driven simulation of Falldown, for headless runs (balance tools, survival statistics, etc.)
+
+The tick-based engine (GameObject.step) advances the world by fixedDeltaTimeS = .01 sec at a time.  But most of the
+time, nothing interesting happens from one tick to the next:  the rows rise at a constant yVel, and the ball either
+rests on a row (rolling at maxSpeed or standing still), free-falls under constant gravity, drops through a gap, or
+lies on the floor.  Each of those motions has a closed form, so EventSim computes how many ticks can pass before the
+next event (a row leaving the top of the screen, the ball reaching the edge of a gap, landing on a row, touching a
+wall, an input change, being crushed) and jumps over them in one go, using the closed form -- so the cost of a run
+depends on the number of events, not the number of ticks.  Only the event ticks themselves are simulated one at a
+time, with exactly the same rules as GameObject.step (including its contact manifold, for rows closer together than
+the ball is wide).  The two engines produce the same game (see
+compareWithTickEngine):  the jumps compute in one multiply what the tick engine sums tick by tick, so positions agree
+to within rounding error (~1e-12 pixels), and landing on a row or a wall snaps both to the same whole pixel.  Both
+consume the random number generator identically (one randint per new row).
+
+The player's input is a piecewise-constant schedule:  a list of (timeS, direction) pairs, sorted by time, where
+direction is -1 (left), 0 (no input) or 1 (right), in effect from timeS onward.
+
+Usage:
+    sim = EventSim(world, [(0.0, 1), (1.5, -1), (2.0, 0)])   # world is an initialized GameObject
+    sim.run(600.0)                                           # simulate up to 10 minutes (or until crushed)
+    print sim.crushed, sim.timeS(), sim.events
+
+NOTE:  The ball's spin (its angle) is not simulated; it has no effect on the game.
+NOTE:  EventSim plays the default level (random gaps, constant row speed), i.e. a GameObject without a rowSource.
+"""
+
+__author__ = 'Mass KonFuzion'
+
+import bisect
+import math
+import random
+from collision import *
+
+
+def _contactDepth(contact):
+    """ Sort key for the contact manifold:  a contact's penetration depth
+    """
+    return contact[0]
+
+
+class EventSim(object):
+    """ Event-driven Falldown simulation (a single life -- the simulation stops when the ball is crushed)
+    """
+
+    def __init__(self, world, schedule = None, rng = random, dt = .01):
+        """ Copy the state of world (a GameObject whose level has been initialized)
+
+        New rows get their gaps from rng.randint, just like FalldownRow does with the random module.
+        """
+        ball = world.ball
+        self.rng = rng
+        self.dt = dt
+
+        # Level dimensions
+        self.sizeX = world.sizeX
+        self.sizeY = world.sizeY
+        self.numBlocks = world.blocksPerRow
+        self.blockWidth = world.blockWidth
+        self.blockHeight = world.blockHeight
+        self.rowStep = world.rows[0].yVel * dt    # Distance the rows move per tick (see moveRow)
+        self.rowSpacing = world.rowSpacing
+
+        # Ball properties
+        self.radius = ball.collisionGeom.r
+        self.maxSpeed = ball.maxSpeed
+        self.gravity = ball.forceGravity[1] * ball.currPhysState.inverseMass
+
+        # Ball state.  accel is the ball's current y acceleration:  gravity, or 0 if it was resting on a row last tick
+        state = ball.currPhysState
+        self.x = state.position[0]
+        self.y = state.position[1]
+        self.vy = state.velocity[1]
+        self.accel = state.netForce[1] * state.inverseMass
+
+        # Rows, as parallel lists of y positions and gap indices
+        self.rowY = [row.yPos for row in world.rows]
+        self.rowGap = [row.gap for row in world.rows]
+
+        # Resting contact:  the index of the supporting row, and which of its CollisionGeoms the ball sits on
+        self.restingRow = -1
+        self.restingGeom = -1
+        if world.restingRowIndex >= 0:
+            self.restingRow = world.restingRowIndex
+            self.restingGeom = world.rows[world.restingRowIndex].collisionGeoms.index(world.restingGeom)
+
+        # The CollisionGeoms of a row only depend on its gap, so build them once per gap index (as (cx, rx) pairs)
+        self.gapGeoms = [self.makeGapGeoms(g) for g in xrange(0, self.numBlocks)]
+        self.geomRY = int(self.blockHeight * .5)
+
+        # A ball lying on the floor bounces in a tiny cycle (gravity pulls it a fraction of a pixel below the floor, and
+        # constrainBallToScreen puts it back every few ticks).  Work out the cycle once, so whole cycles can be skipped
+        self.floorY = float(int(self.sizeY - self.radius))
+        self.floorPeriod, self.floorMaxY = self.makeFloorCycle()
+
+        # Contacts found by the current tick, as (depth, normal x, normal y, row index, geom index) tuples (see step),
+        # resolved as a manifold when there's more than one
+        self.contacts = []
+        self.contactIterations = world.contactIterations
+        self.normal = [0.0, 0.0]
+
+        self.tick = 0
+        self.crushed = False
+        # Events, as (tick, kind, detail) tuples.  kind is 'land' (detail = row index), 'rolloff', 'shift' (detail = new
+        # row's gap index), or 'crush'
+        self.events = []
+
+        self.setSchedule(schedule or [(0.0, 0)])
+
+    def makeGapGeoms(self, gap):
+        """ Return the (center x, half-width) pairs of the CollisionGeoms of a row with the given gap index
+
+        (These match FalldownRow.createCollisionGeoms exactly, including its rounding)
+        """
+        n = self.numBlocks
+        bw = self.blockWidth
+        if gap == 0:
+            width = (n - 1) * bw
+            return [(int(bw + (width * .5)), int(width * .5))]
+        elif gap == n - 1:
+            width = (n - 1) * bw
+            return [(int(width * .5), int(width * .5))]
+        else:
+            width = bw * gap
+            width2 = bw * (n - gap + 1)
+            return [(int(width * .5), int(width * .5)),
+                    (int(((gap + 1) * bw) + (width2 * .5)), int(width2 * .5))]
+
+    def setSchedule(self, schedule):
+        """ Set the input schedule:  a list of (timeS, direction) pairs, sorted by time
+        """
+        # Convert the times to ticks.  The direction of entry i applies to every tick after tick scheduleTicks[i]
+        self.scheduleTicks = [int(round(t / self.dt)) for t, d in schedule]
+        self.scheduleDirs = [d for t, d in schedule]
+
+    def directionAt(self, tick):
+        """ Return the input direction for the tick after the given tick
+        """
+        i = bisect.bisect_right(self.scheduleTicks, tick)
+        if i == 0:
+            return 0
+        return self.scheduleDirs[i - 1]
+
+    def nextInputChange(self, tick):
+        """ Return the first tick (after the given tick) at which the schedule changes direction, or None
+        """
+        i = bisect.bisect_right(self.scheduleTicks, tick)
+        if i == len(self.scheduleTicks):
+            return None
+        return self.scheduleTicks[i]
+
+    def timeS(self):
+        """ Return the simulated time, in seconds
+        """
+        return self.tick * self.dt
+
+    # ---------------------------------------------------------------------------------------------------------------
+    # Running
+    # ---------------------------------------------------------------------------------------------------------------
+
+    def run(self, durationS):
+        """ Simulate until the given time (in seconds), or until the ball is crushed
+        """
+        self.runUntil(int(round(durationS / self.dt)))
+
+    def runUntil(self, endTick):
+        """ Simulate until the given tick, or until the ball is crushed
+        """
+        while self.tick < endTick and not self.crushed:
+            direction = self.directionAt(self.tick)
+            n = endTick - self.tick
+            change = self.nextInputChange(self.tick)
+            if change != None and change - self.tick < n:
+                n = change - self.tick
+
+            if self.restingRow >= 0:
+                n = self.restingQuietTicks(direction, n)
+                if n > 0:
+                    self.skipResting(direction, n)
+                    continue
+            elif self.y == self.floorY and self.vy == 0 and self.accel == self.gravity:
+                n = self.floorQuietTicks(direction, n)
+                if n > 0:
+                    self.skipFloor(direction, n)
+                    continue
+            elif self.accel == self.gravity and self.vy >= 0:
+                n = self.airborneQuietTicks(direction, n)
+                if n > 0:
+                    self.skipAirborne(direction, n)
+                    continue
+
+            # The next tick is an event (or we're in a situation that has no closed form); simulate it exactly
+            self.step(direction)
+
+    def step(self, direction):
+        """ Simulate one tick, exactly as GameObject.step does
+        """
+        dt = self.dt
+        r = self.radius
+
+        # Move the ball
+        x = self.x + (direction * self.maxSpeed * dt)
+        y = self.y + (self.vy * dt)
+        vy = self.vy + (self.accel * dt)
+        self.tick += 1
+
+        # Crushed?
+        if int(y) < 0:
+            self.x = x
+            self.y = y
+            self.vy = vy
+            self.crushed = True
+            self.events.append((self.tick, 'crush', None))
+            return
+
+        # Move the level
+        rowY = self.rowY
+        for i in xrange(0, len(rowY)):
+            rowY[i] = rowY[i] + self.rowStep
+        if rowY[0] <= (0 - int(self.blockHeight)):
+            self.shiftRows()
+
+        # Constrain the ball to the screen
+        if int(x - r) < 0:
+            x = float(int(r))
+            y = float(int(y))
+        elif int(x + r) > int(self.sizeX):
+            x = float(int(self.sizeX - r))
+            y = float(int(y))
+        if int(y + r) > int(self.sizeY):
+            y = float(int(self.sizeY - r))
+            vy = 0.0
+
+        # Collisions (every contact, as in collision_GenerateContacts)
+        accel = self.gravity
+        normal = self.normal
+        contacts = self.contacts
+        del contacts[:]
+        halfHeight = self.blockHeight * .5
+        ry = self.geomRY
+        for i in xrange(0, len(rowY)):
+            cy = rowY[i] + halfHeight
+            if y - r > cy + ry or y + r < cy - ry:
+                continue
+            geoms = self.gapGeoms[self.rowGap[i]]
+            for j in xrange(0, len(geoms)):
+                cx, rx = geoms[j]
+                if isIntersecting_Sphere_AABB_f(x, y, r, cx, cy, rx, ry):
+                    depth = minimumPenetrationDepthAndNormal_Sphere_AABB_f(x, y, r, cx, cy, rx, ry, normal)
+                    contacts.append((depth, normal[0], normal[1], i, j))
+
+        wasResting = self.restingRow >= 0
+        self.restingRow = -1
+        self.restingGeom = -1
+        landedRow = -1
+        if len(contacts) == 1:
+            depth, nx, ny, i, j = contacts[0]
+            if int(nx) == 0 and int(ny) == -1:
+                landedRow = i
+                self.restingGeom = j
+            x = x + (nx * depth)
+            y = y + (ny * depth)
+        elif len(contacts) > 1:
+            x, y, landedRow = self.resolveContacts(x, y)
+        if landedRow >= 0:
+            accel = 0.0
+            vy = 0.0
+            self.restingRow = landedRow
+            if not wasResting:
+                self.events.append((self.tick, 'land', landedRow))
+        if wasResting and self.restingRow < 0:
+            self.events.append((self.tick, 'rolloff', None))
+
+        self.x = x
+        self.y = y
+        self.vy = vy
+        self.accel = accel
+
+    def resolveContacts(self, x, y):
+        """ Resolve the contacts in self.contacts for a ball at (x, y), as GameObject.collision_ResolveContacts does:
+        deepest first, each one re-measured from where the ball is by then, for up to contactIterations passes
+
+        Returns (x, y, landedRow):  the ball's new position, and the index of the deepest row it landed on top of in
+        the first pass (or -1).  Sets restingGeom to the geom it landed on
+        """
+        r = self.radius
+        normal = self.normal
+        halfHeight = self.blockHeight * .5
+        ry = self.geomRY
+
+        # Deepest first (sort is stable, so ties stay in the order they were found)
+        contacts = self.contacts
+        contacts.sort(key = _contactDepth, reverse = True)
+
+        landedRow = -1
+        for iteration in xrange(0, self.contactIterations):
+            moved = False
+            for depth, nx, ny, i, j in contacts:
+                cx, rx = self.gapGeoms[self.rowGap[i]][j]
+                cy = self.rowY[i] + halfHeight
+                if not isIntersecting_Sphere_AABB_f(x, y, r, cx, cy, rx, ry):
+                    continue
+                depth = minimumPenetrationDepthAndNormal_Sphere_AABB_f(x, y, r, cx, cy, rx, ry, normal)
+                if depth <= 0.0:
+                    continue
+
+                if iteration == 0 and landedRow < 0 and normal[0] == 0.0 and normal[1] == -1.0:
+                    landedRow = i
+                    self.restingGeom = j
+                x = x + (depth * normal[0])
+                y = y + (depth * normal[1])
+                moved = True
+            if not moved:
+                break
+
+        return x, y, landedRow
+
+    def shiftRows(self):
+        """ Drop the top row, and add a new one at the bottom of the screen (as GameObject.shiftRows does)
+        """
+        gap = self.rng.randint(0, self.numBlocks - 1)
+        self.rowY.append(self.rowY[-1] + self.rowSpacing)
+        self.rowGap.append(gap)
+        del self.rowY[0]
+        del self.rowGap[0]
+        if self.restingRow >= 0:
+            self.restingRow -= 1
+            if self.restingRow < 0:
+                self.restingGeom = -1
+        self.events.append((self.tick, 'shift', gap))
+
+    def ticksUntilShift(self):
+        """ Return the number of ticks until the top row leaves (i.e. the tick that shifts the rows)
+        """
+        distance = self.rowY[0] + int(self.blockHeight)
+        ticks = int(math.ceil(distance / float(-self.rowStep)))
+        if self.rowStep != int(self.rowStep):
+            # The rows move a fraction of a pixel per tick, so their positions pick up rounding errors along the way;
+            # err on the early side
+            ticks -= 1
+        return max(ticks, 1)
+
+    def moveRows(self, n):
+        """ Move the rows n ticks' worth
+        """
+        rowY = self.rowY
+        s = self.rowStep * n
+        for i in xrange(0, len(rowY)):
+            rowY[i] = rowY[i] + s
+
+    # ---------------------------------------------------------------------------------------------------------------
+    # Resting on a row
+    # ---------------------------------------------------------------------------------------------------------------
+
+    def restingQuietTicks(self, direction, n):
+        """ Return how many of the next n ticks (at most) the ball simply rides along on its row
+        """
+        r = self.radius
+        s = self.rowStep
+        i = self.restingRow
+        y = self.y
+        x = self.x
+        step = direction * self.maxSpeed * self.dt
+
+        # The top row must not leave, and the ball must not be crushed (see step) during the skipped ticks
+        n = min(n, self.ticksUntilShift() - 1)
+        if y < 0:
+            return 0
+        n = min(n, int(y / -s) + 1)
+
+        # Each tick, the row rises by -s pixels before the ball is snapped back on top.  While the ball's center is
+        # over the supporting geom, it stays put.  Past the geom's edge by dx, it stays on as long as it still touches
+        # the geom, i.e. dx^2 + (r + s)^2 <= r^2 (and the top of the geom is its shallowest side)
+        dy = r + s
+        overhang2 = (r * r) - (dy * dy)
+        if dy <= 0 or overhang2 <= 0:
+            return 0
+        overhang = math.sqrt(overhang2) - 1e-7
+        if r - overhang < -s:
+            return 0
+
+        geoms = self.gapGeoms[self.rowGap[i]]
+        cx, rx = geoms[self.restingGeom]
+        lo = max(cx - rx - overhang, r)
+        hi = min(cx + rx + overhang, self.sizeX - r)
+
+        # Nothing else may be within reach:  the other geom of the row, and the rows above and below (all rows move
+        # together, so these distances don't change while the ball rides along)
+        for j in xrange(0, len(geoms)):
+            if j != self.restingGeom:
+                ox, orx = geoms[j]
+                if (ox - orx) - (cx + rx + overhang) <= r and (cx - rx - overhang) - (ox + orx) <= r:
+                    return 0
+        halfHeight = self.blockHeight * .5
+        ry = self.geomRY
+        if i > 0 and y - r <= self.rowY[i - 1] + halfHeight + ry:
+            return 0
+        if i < len(self.rowY) - 1 and y + r >= self.rowY[i + 1] + halfHeight - ry:
+            return 0
+
+        # The ball may move at most this many ticks before it leaves [lo, hi] (i.e. rolls off, or touches a wall)
+        if x < lo or x > hi:
+            return 0
+        if step > 0:
+            n = min(n, int((hi - x) / step))
+        elif step < 0:
+            n = min(n, int((lo - x) / step))
+        return max(n, 0)
+
+    def skipResting(self, direction, n):
+        """ Advance n ticks while the ball rides along on its row
+        """
+        self.moveRows(n)
+        self.x = self.advance(self.x, direction * self.maxSpeed * self.dt, n)
+        self.y = self.rowY[self.restingRow] + (self.blockHeight * .5) - self.geomRY - self.radius
+        self.tick += n
+
+    # ---------------------------------------------------------------------------------------------------------------
+    # Falling
+    # ---------------------------------------------------------------------------------------------------------------
+
+    def fallPosition(self, k):
+        """ Return the ball's y position after k more ticks of free fall
+        """
+        dt = self.dt
+        return self.y + (dt * ((k * self.vy) + (self.gravity * dt * k * (k - 1) * .5)))
+
+    def firstFallTick(self, offset, rate, n):
+        """ Return the first tick k in [1, n] where fallPosition(k) + offset + (rate * k) >= 0, or n + 1 if none
+
+        (i.e. where the falling ball catches up to something moving at rate pixels per tick)
+        """
+        dt = self.dt
+        # fallPosition(k) + offset + rate * k = a*k^2 + b*k + c
+        a = self.gravity * dt * dt * .5
+        b = (self.vy * dt) - a + rate
+        c = self.y + offset
+        if c + b + a >= 0:
+            return 1
+        if a > 0:
+            disc = (b * b) - (4 * a * c)
+            if disc < 0:
+                return n + 1
+            k = int(math.ceil((-b + math.sqrt(disc)) / (2 * a)))
+        elif b > 0:
+            k = int(math.ceil(-c / b))
+        else:
+            return n + 1
+        k = max(k, 1)
+        # The root is only approximate; nudge k to the exact tick
+        while k > 1 and self.fallPosition(k - 1) + offset + (rate * (k - 1)) >= 0:
+            k -= 1
+        while k <= n and self.fallPosition(k) + offset + (rate * k) < 0:
+            k += 1
+        return min(k, n + 1)
+
+    def airborneQuietTicks(self, direction, n):
+        """ Return how many of the next n ticks (at most) the ball falls freely (or drops cleanly through a gap)
+        """
+        r = self.radius
+        s = self.rowStep
+        x = self.x
+        step = direction * self.maxSpeed * self.dt
+
+        n = min(n, self.ticksUntilShift() - 1)
+        if self.y < 0 or n <= 0:
+            return 0
+
+        # The ball must not touch the floor or the walls
+        n = min(n, self.firstFallTick(r - self.sizeY, 0, n) - 1)
+        if x < r or x > self.sizeX - r:
+            return 0
+        if step > 0:
+            n = min(n, int(((self.sizeX - r) - x) / step))
+        elif step < 0:
+            n = min(n, int((r - x) / step))
+
+        # Whenever the ball overlaps a row vertically, it must be clear of the row's geoms (i.e. inside the gap)
+        halfHeight = self.blockHeight * .5
+        ry = self.geomRY
+        for i in xrange(0, len(self.rowY)):
+            if n <= 0:
+                break
+            top = self.rowY[i] + halfHeight - ry
+            bottom = self.rowY[i] + halfHeight + ry
+            if bottom < self.y - r:
+                # The row is above the ball, and rising away from it
+                continue
+            # First tick where the ball's bottom reaches the row's top, and first tick where the ball's top passes
+            # the row's bottom
+            start = self.firstFallTick(r - top, -s, n)
+            if start > n:
+                continue
+            end = self.firstFallTick(-r - bottom, -s, n)
+            if end <= start:
+                continue
+
+            lo, hi = self.gapInterior(self.rowGap[i])
+            if x + (step * start) < lo or x + (step * start) > hi:
+                n = start - 1
+                continue
+            last = min(end - 1, n)
+            if x + (step * last) < lo or x + (step * last) > hi:
+                # The ball reaches a side of the gap while passing through; stop at the tick before it does
+                if step > 0:
+                    n = min(n, int((hi - x) / step))
+                else:
+                    n = min(n, int((lo - x) / step))
+        return max(n, 0)
+
+    def gapInterior(self, gap):
+        """ Return the range of ball x positions (lo, hi) that are clear of the geoms of a row with the given gap
+        """
+        r = self.radius
+        lo = -FLT_MAX
+        hi = FLT_MAX
+        gapCenter = (gap + .5) * self.blockWidth
+        for cx, rx in self.gapGeoms[gap]:
+            if cx < gapCenter:
+                lo = max(lo, cx + rx + r + 1e-7)
+            else:
+                hi = min(hi, cx - rx - r - 1e-7)
+        return lo, hi
+
+    def skipAirborne(self, direction, n):
+        """ Advance n ticks of free fall
+        """
+        self.moveRows(n)
+        self.y = self.fallPosition(n)
+        self.vy = self.vy + (self.gravity * self.dt * n)
+        self.x = self.advance(self.x, direction * self.maxSpeed * self.dt, n)
+        self.tick += n
+
+    def advance(self, x, step, n):
+        """ Return x after n ticks of moving step pixels per tick
+        """
+        return x + (step * n)
+
+
+    # ---------------------------------------------------------------------------------------------------------------
+    # Lying on the floor
+    # ---------------------------------------------------------------------------------------------------------------
+
+    def makeFloorCycle(self):
+        """ Return (period, maxY) of the floor cycle:  the number of ticks before a ball lying on the floor is put back
+        on the floor, and the lowest it sinks in between (as a y position)
+        """
+        y = self.floorY
+        vy = 0.0
+        maxY = y
+        period = 0
+        while True:
+            y = y + (vy * self.dt)
+            vy = vy + (self.gravity * self.dt)
+            period += 1
+            if int(y + self.radius) > int(self.sizeY):
+                return period, maxY
+            maxY = max(maxY, y)
+
+    def floorQuietTicks(self, direction, n):
+        """ Return how many of the next n ticks (at most) the ball lies on the floor, untouched by the rows
+
+        The answer is a whole number of floor cycles, so the ball ends up back at the start of the cycle.
+        """
+        r = self.radius
+        s = self.rowStep
+        x = self.x
+        step = direction * self.maxSpeed * self.dt
+
+        n = min(n, self.ticksUntilShift() - 1)
+        if x < r or x > self.sizeX - r:
+            return 0
+        if step > 0:
+            n = min(n, int(((self.sizeX - r) - x) / step))
+        elif step < 0:
+            n = min(n, int((r - x) / step))
+
+        # The rows rise past the ball; while one of them is level with it, the ball must be inside its gap
+        halfHeight = self.blockHeight * .5
+        ry = self.geomRY
+        ballTop = self.floorY - r - 1
+        ballBottom = self.floorMaxY + r + 1
+        for i in xrange(0, len(self.rowY)):
+            if n <= 0:
+                break
+            top = self.rowY[i] + halfHeight - ry
+            bottom = self.rowY[i] + halfHeight + ry
+            if bottom < ballTop:
+                continue
+            # The row reaches the ball after start ticks, and has passed it after last ticks
+            start = max(int((top - ballBottom) / -s), 0)
+            if start > n:
+                continue
+            lo, hi = self.gapInterior(self.rowGap[i])
+            last = min(int((bottom - ballTop) / -s) + 1, n)
+            if min(x, x + (step * last)) < lo or max(x, x + (step * last)) > hi:
+                n = start - 1
+        return max(n - (n % self.floorPeriod), 0)
+
+    def skipFloor(self, direction, n):
+        """ Advance n ticks (a whole number of floor cycles) while the ball lies on the floor
+        """
+        self.moveRows(n)
+        self.x = self.advance(self.x, direction * self.maxSpeed * self.dt, n)
+        self.tick += n
+
+
+def compareWithTickEngine(seed, schedule, durationS, sampleEveryS = .5, numRows = 6, dt = .01):
+    """ Run the same game (random seed and input schedule) with the tick-based engine and with EventSim, on the
+    default level with numRows rows, stepped every dt seconds
+
+    Returns (maxError, tickCrush, eventCrush):  the largest difference in ball position (in pixels) between the two,
+    sampled every sampleEveryS seconds, and the tick at which each engine's ball got crushed (or None).
+    """
+    import gameobj
+
+    random.seed(seed)
+    world = gameobj.GameObject()
+    world.initStateMachine()
+    world.setScreenSize(800, 600)
+    world.initLevel(600, numRows, 10)
+    world.stateMachine.setState('PlayingGame')
+
+    sim = EventSim(world, schedule, dt = dt)
+    rngState = random.getstate()
+
+    # Tick-based run, sampling the ball's position
+    endTick = int(round(durationS / dt))
+    sampleTicks = int(round(sampleEveryS / dt))
+    samples = []
+    tickCrush = None
+    crushed = world.stateMachine.states['GotCrushed']
+    for k in xrange(0, endTick):
+        world.ball.setDirection(sim.directionAt(k))
+        world.ball.respondToControllerInput()
+        world.step(dt)
+        if world.stateMachine.currentState == crushed:
+            tickCrush = k + 1
+            break
+        if (k + 1) % sampleTicks == 0:
+            pos = world.ball.getPosition()
+            samples.append((k + 1, pos[0], pos[1]))
+
+    # Event-driven run, stopping at the same sample ticks
+    random.setstate(rngState)
+    maxError = 0.0
+    for k, x, y in samples:
+        sim.runUntil(k)
+        if sim.crushed:
+            break
+        maxError = max(maxError, math.hypot(sim.x - x, sim.y - y))
+    sim.runUntil(endTick)
+    eventCrush = None
+    if sim.crushed:
+        eventCrush = sim.tick
+    return maxError, tickCrush, eventCrush
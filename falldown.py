@@ -1,8 +1,24 @@
 """ Falldown Rebirth
+
+Usage:
+    python falldown.py [--latency] [level file]
+
+With a level file (see levelfile.py), the game plays that level's rows; otherwise, it generates a level.  With
+--latency, the game starts in latency measurement mode (see inputtiming.py; F3 toggles it while playing).
+
+The game in progress is checkpointed to CHECKPOINT_FILE every few seconds.  If the game is restarted (e.g. after a
+power cut), it picks up where the checkpoint left off.  (To resume a game on a level file, give the same level file.)
 """
 __author__ = 'Mass KonFuzion'
 
 from application import *
+from levelgen import *
+from levelfile import *
+from checkpoint import *
+import sys
+
+# Where the game in progress is checkpointed
+CHECKPOINT_FILE = "falldown.checkpoint"
 
 def main():
     """ Main function.  Here is where all the magic happens.
@@ -11,15 +27,40 @@ def main():
     app = PygameApplication()
 
     # The game object has a Pygame Application Object in it.  Initialize it
-    app.initializeGraphics(800, 600)
+    app.initializeGraphics(GAME_SIZE[0], GAME_SIZE[1])
 
     # Set game object's dimensions
     app.gameObj.setScreenSize(app.sizeX, app.sizeY)
 
+    args = sys.argv[1:]
+    if "--latency" in args:
+        args.remove("--latency")
+        app.setLatencyMode(True)
+
+    # The rows come from a level file, if one was given.  If not, they come from a level generator, so the game gets
+    # harder as it goes
+    blocksPerRow = 10
+    if len(args) > 0:
+        level = LevelFile(args[0])
+        problems = layoutProblems(level.numBlocks, app.gameObj)
+        if problems:
+            print "%s: %s" % (args[0], problems[0])
+            sys.exit(1)
+        app.gameObj.rowSource = level
+        blocksPerRow = level.numBlocks
+    else:
+        app.gameObj.rowSource = LevelGenerator(blocksPerRow)
+
     # Initialize the game object
-    app.gameObj.initLevel(app.sizeY, 6, 10)
+    app.gameObj.initLevel(app.sizeY, GAME_ROWS, blocksPerRow)
     app.gameObj.initStateMachine()
 
+    # Resume the game from the last checkpoint, if there is one.  Start at the main menu, so the player can get
+    # ready (pressing a key carries on playing)
+    if resumeFromCheckpoint(app.gameObj, CHECKPOINT_FILE):
+        app.gameObj.stateMachine.setState('MainMenu')
+    app.checkpointWriter = CheckpointWriter(CHECKPOINT_FILE)
+
     # Start the game loop.
     app.doGameLoop()
 
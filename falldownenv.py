@@ -0,0 +1,478 @@
+""" Reinforcement-learning environments for Falldown (requires NumPy)
+
+VectorFalldownEnv runs many copies of the game at once, with the game's physics (GameObject.step) done on NumPy
+arrays:  one call steps every copy, so it's fast enough to train agents on.  Given the same gaps and inputs, a copy
+plays out exactly as a GameObject does (the default level, without a row source), with any number of rows --
+including its contact manifold, when the rows are closer together than the ball is wide (see compareWithGameObject,
+and paritycheck.py).  FalldownEnv is a single copy.  Both
+follow the Gym conventions (reset() returns an observation; step(action) returns (observation, reward, done, info)),
+but don't need Gym.
+
+Actions:  ACTION_LEFT, ACTION_NONE, ACTION_RIGHT (0, 1, 2).
+
+Observations are float32 vectors of OBS_BALL_SIZE + 2 * numObservedRows values:
+    ball x / sizeX, ball y / sizeY, ball y velocity / maxSpeed, 1 if the ball is resting on a row (else 0)
+    then, for each of the next numObservedRows rows that the ball hasn't passed (nearest first):
+        gap center x / sizeX, (row top - ball y) / sizeY        (or -1, 2 if there aren't that many rows)
+
+The observations are written into one preallocated array, (numEnvs, observation size), and step() and reset()
+return that array itself (not a copy) -- so the caller can keep a reference to it, but has to copy anything it wants
+to keep past the next step.
+
+Rewards:  aliveReward per tick survived, plus rowReward per row the ball gets below; crushReward when the ball gets
+crushed (which ends the episode).  An episode also ends (truncated) after maxSteps steps.  VectorFalldownEnv resets
+finished copies automatically (so the observation returned for them is the first one of their next episode).
+
+Usage:
+    env = VectorFalldownEnv(256, seed = 1)
+    obs = env.reset()
+    while training:
+        obs, rewards, dones, info = env.step(policy(obs))
+"""
+
+__author__ = 'Mass KonFuzion'
+
+import math
+import random
+
+import numpy
+
+ACTION_LEFT = 0
+ACTION_NONE = 1
+ACTION_RIGHT = 2
+
+# Number of ball values at the start of an observation
+OBS_BALL_SIZE = 4
+
+# Penetration depth sides, in the order minimumPenetrationDepthAndNormal_Sphere_AABB_f tests them (ties go to the
+# first):  top, left, bottom, right
+_NORMAL_X = numpy.array([0.0, -1.0, 0.0, 1.0])
+_NORMAL_Y = numpy.array([-1.0, 0.0, 1.0, 0.0])
+
+
+class VectorFalldownEnv(object):
+    """ numEnvs copies of Falldown, stepped together
+    """
+
+    def __init__(self, numEnvs, numObservedRows = 3, seed = None, maxSteps = 6000, frameSkip = 1, dt = .01,
+                 aliveReward = .01, rowReward = 1.0, crushReward = -1.0, autoReset = True, sizeX = 800, sizeY = 600,
+                 numRows = 6, blocksPerRow = 10):
+        """ Set up the environments
+
+        The level is the default one (see GameObject.initLevel):  numRows rows of blocksPerRow blocks on a sizeX x
+        sizeY screen, rising at 200 pixels/sec, with random gaps.  Each step is frameSkip ticks of dt seconds.
+        """
+        self.numEnvs = numEnvs
+        self.numObservedRows = numObservedRows
+        self.maxSteps = maxSteps
+        self.frameSkip = frameSkip
+        self.dt = dt
+        self.aliveReward = aliveReward
+        self.rowReward = rowReward
+        self.crushReward = crushReward
+        self.autoReset = autoReset
+        self.rng = numpy.random.RandomState(seed)
+
+        # Level layout (as GameObject.initLevel and Ball set it up)
+        self.sizeX = float(sizeX)
+        self.sizeY = float(sizeY)
+        self.numRows = numRows
+        self.blocksPerRow = blocksPerRow
+        self.blockWidth = float(sizeX // blocksPerRow)
+        self.blockHeight = sizeY / 20.0
+        self.rowSpacing = (sizeY + self.blockHeight) / numRows
+        self.rowVel = -200.0
+        self.radius = 15.0
+        self.maxSpeed = 800.0
+        self.gravity = 7000.0
+        # Relaxation passes over a contact manifold (see GameObject.contactIterations)
+        self.contactIterations = 4
+
+        n = numEnvs
+        # Ball state
+        self.x = numpy.zeros(n)
+        self.y = numpy.zeros(n)
+        self.vy = numpy.zeros(n)
+        self.ay = numpy.zeros(n)
+        self.resting = numpy.zeros(n, dtype = bool)
+        # Rows:  the top of each row, its gap, and its CollisionGeoms (up to 2 per row:  center x, half-width, and
+        # whether it exists -- as FalldownRow.createCollisionGeoms makes them)
+        self.rowY = numpy.zeros((n, numRows))
+        self.rowGap = numpy.zeros((n, numRows), dtype = numpy.int64)
+        self.geomX = numpy.zeros((n, numRows, 2))
+        self.geomRX = numpy.zeros((n, numRows, 2))
+        self.geomValid = numpy.zeros((n, numRows, 2), dtype = bool)
+
+        # Rows shifted out so far, and rows the ball has got below (counting from the start of the episode)
+        self.rowsShifted = numpy.zeros(n, dtype = numpy.int64)
+        self.rowsPassed = numpy.zeros(n, dtype = numpy.int64)
+        self.steps = numpy.zeros(n, dtype = numpy.int64)
+
+        # Outputs (returned by step and reset, and overwritten by the next call)
+        self.obs = numpy.zeros((n, OBS_BALL_SIZE + (2 * numObservedRows)), dtype = numpy.float32)
+        self.rewards = numpy.zeros(n)
+        self.dones = numpy.zeros(n, dtype = bool)
+        self.truncated = numpy.zeros(n, dtype = bool)
+        # Rows passed and steps taken in the episodes that just ended (for the copies whose done is True)
+        self.episodeRows = numpy.zeros(n, dtype = numpy.int64)
+        self.episodeSteps = numpy.zeros(n, dtype = numpy.int64)
+        self.info = {'truncated': self.truncated, 'episodeRows': self.episodeRows, 'episodeSteps': self.episodeSteps}
+
+        # Scratch
+        self.envIndex = numpy.arange(n)
+        self.rowIndex = numpy.arange(numRows)
+        self.observedIndex = numpy.arange(numObservedRows)
+
+        self.resetEnvs(self.envIndex)
+
+    @property
+    def observationSize(self):
+        return self.obs.shape[1]
+
+    @property
+    def actionCount(self):
+        return 3
+
+    def seed(self, seed):
+        self.rng.seed(seed)
+
+    def reset(self):
+        """ Start a new episode in every copy, and return the observations
+        """
+        self.resetEnvs(self.envIndex)
+        self.observe()
+        return self.obs
+
+    def resetEnvs(self, envs):
+        """ Start a new episode in the given copies (an array of indices)
+        """
+        count = len(envs)
+        if count == 0:
+            return
+        # The ball starts at the top middle of the screen, at rest (with no force on it yet, as in a new GameObject)
+        self.x[envs] = self.sizeX / 2
+        self.y[envs] = self.radius
+        self.vy[envs] = 0.0
+        self.ay[envs] = 0.0
+        self.resting[envs] = False
+        # The top row starts halfway down the screen
+        self.rowY[envs] = (self.sizeY / 2) + (self.rowSpacing * self.rowIndex)
+        self.rowGap[envs] = self.rng.randint(0, self.blocksPerRow, (count, self.numRows))
+        self.updateGeoms(envs)
+        self.rowsShifted[envs] = 0
+        self.rowsPassed[envs] = 0
+        self.steps[envs] = 0
+
+    def updateGeoms(self, envs):
+        """ Recompute the CollisionGeoms of the given copies' rows from their gaps
+        """
+        gap = self.rowGap[envs]
+        bw = self.blockWidth
+        # (centers and half-widths are truncated to whole pixels, as in createCollisionGeoms)
+        # The blocks left of the gap
+        left = numpy.floor((gap * bw) * .5)
+        self.geomX[envs, :, 0] = left
+        self.geomRX[envs, :, 0] = left
+        self.geomValid[envs, :, 0] = gap > 0
+        # The blocks right of the gap (FalldownRow makes this one (numBlocks - gap + 1) blocks wide, past the
+        # edge of the screen)
+        right = (bw * (self.blocksPerRow - gap + 1)) * .5
+        self.geomX[envs, :, 1] = numpy.floor(((gap + 1) * bw) + right)
+        self.geomRX[envs, :, 1] = numpy.floor(right)
+        self.geomValid[envs, :, 1] = gap < self.blocksPerRow - 1
+
+    def step(self, actions):
+        """ Step every copy, with an array of actions (one per copy), and return (observations, rewards, dones, info)
+
+        info holds arrays:  'truncated' (True where the episode ended by running out of steps), and 'episodeRows' and
+        'episodeSteps' (the rows passed and steps taken, in the episodes that just ended)
+        """
+        directions = numpy.asarray(actions) - 1
+        self.rewards[:] = 0.0
+        self.dones[:] = False
+        for i in xrange(0, self.frameSkip):
+            # Copies that got crushed earlier in this step don't earn any more reward
+            alive = ~self.dones
+            crushed, newRows = self.tick(directions)
+            self.rewards += numpy.where(alive, self.aliveReward + (self.rowReward * newRows), 0.0)
+            crushed &= alive
+            self.rewards[crushed] += self.crushReward
+            self.dones |= crushed
+
+        self.steps += 1
+        self.truncated[:] = (self.steps >= self.maxSteps) & ~self.dones
+        self.dones |= self.truncated
+
+        finished = numpy.flatnonzero(self.dones)
+        self.episodeRows[finished] = self.rowsPassed[finished]
+        self.episodeSteps[finished] = self.steps[finished]
+        if self.autoReset:
+            self.resetEnvs(finished)
+        self.observe()
+        return self.obs, self.rewards, self.dones, self.info
+
+    def tick(self, directions):
+        """ Advance every copy by one tick (as GameObject.step does), and return (crushed, rows passed):  a boolean
+        array of the copies that got crushed, and the number of rows each copy got below
+        """
+        dt = self.dt
+        r = self.radius
+        bh = self.blockHeight
+        x = self.x
+        y = self.y
+        vy = self.vy
+
+        # Move the ball (position first, then velocity, as physics.integrate does)
+        x += directions * (self.maxSpeed * dt)
+        y += vy * dt
+        vy += self.ay * dt
+
+        # Crushed once the center of the ball is a whole pixel above the top of the screen
+        crushed = y <= -1.0
+
+        # Move the rows; shift in a new row where the top row has left the screen
+        self.rowY += self.rowVel * dt
+        shift = numpy.flatnonzero(self.rowY[:, 0] <= -bh)
+        if len(shift):
+            self.rowY[shift, :-1] = self.rowY[shift, 1:]
+            self.rowY[shift, -1] = self.rowY[shift, -2] + self.rowSpacing
+            self.rowGap[shift, :-1] = self.rowGap[shift, 1:]
+            self.rowGap[shift, -1] = self.rng.randint(0, self.blocksPerRow, len(shift))
+            self.updateGeoms(shift)
+            self.rowsShifted[shift] += 1
+
+        # Keep the ball on the screen (with the same int() truncations as GameObject.constrainBallToScreen)
+        wall = numpy.trunc(x - r) < 0
+        x[wall] = int(r)
+        rightWall = numpy.trunc(x + r) > int(self.sizeX)
+        x[rightWall] = int(self.sizeX - r)
+        wall |= rightWall
+        y[wall] = numpy.trunc(y[wall])
+        onFloor = numpy.trunc(y + r) > int(self.sizeY)
+        y[onFloor] = int(self.sizeY - r)
+        vy[onFloor] = 0.0
+
+        # Gravity, then collisions:  find the CollisionGeoms that the ball overlaps
+        self.ay[:] = self.gravity
+        ry = bh * .5
+        dx = x[:, numpy.newaxis, numpy.newaxis] - self.geomX
+        dy = y[:, numpy.newaxis] - (self.rowY + ry)
+        ox = numpy.maximum(numpy.abs(dx) - self.geomRX, 0.0)
+        oy = numpy.maximum(numpy.abs(dy) - ry, 0.0)[:, :, numpy.newaxis]
+        hits = (((ox * ox) + (oy * oy)) <= r * r) & self.geomValid
+        hits = hits.reshape(self.numEnvs, -1)
+        # The first and last CollisionGeoms (in row order) that the ball overlaps
+        first = numpy.argmax(hits, axis = 1)
+        last = (hits.shape[1] - 1) - numpy.argmax(hits[:, ::-1], axis = 1)
+        contact = hits[self.envIndex, first]
+        self.resting[:] = False
+
+        # More than one contact (only possible when the rows are closer together than the ball is wide):  resolve
+        # them as a manifold, as GameObject.collision_ResolveContacts does
+        multi = numpy.flatnonzero(contact & (first != last))
+        if len(multi):
+            self.resolveManifold(multi, hits[multi], dx, dy)
+
+        # A single contact:  push the ball out of the geom it overlaps
+        envs = numpy.flatnonzero(contact & (first == last))
+        if len(envs):
+            geom = first[envs]
+            cdx = dx.reshape(self.numEnvs, -1)[envs, geom]
+            cdy = dy[envs, geom // 2]
+            crx = self.geomRX.reshape(self.numEnvs, -1)[envs, geom]
+            # Penetration depth through each side:  top, left, bottom, right
+            depths = numpy.empty((len(envs), 4))
+            depths[:, 0] = ry + cdy + r
+            depths[:, 1] = crx + cdx + r
+            depths[:, 2] = ry - cdy + r
+            depths[:, 3] = crx - cdx + r
+            side = numpy.argmin(depths, axis = 1)
+            depth = depths[numpy.arange(len(envs)), side]
+
+            # On top of a row:  cancel gravity and stop falling
+            top = envs[side == 0]
+            self.ay[top] = 0.0
+            vy[top] = 0.0
+            self.resting[top] = True
+
+            x[envs] += depth * _NORMAL_X[side]
+            y[envs] += depth * _NORMAL_Y[side]
+
+        # Rows passed:  rows whose bottom is above the ball's center (counted once each)
+        below = (self.rowY + bh < y[:, numpy.newaxis]).sum(axis = 1)
+        newRows = numpy.maximum(self.rowsShifted + below - self.rowsPassed, 0)
+        self.rowsPassed += newRows
+        return crushed, newRows
+
+    def resolveManifold(self, envs, hits, dx, dy):
+        """ Resolve the contacts of the given copies (an array of indices, each with more than one contact; hits is
+        their row of tick()'s hits array), as GameObject.collision_ResolveContacts does:  deepest first, each one
+        re-measured from where the ball is by then, for contactIterations passes.  A copy lands on the first row top
+        it's pushed out of in the first pass
+        """
+        r = self.radius
+        ry = self.blockHeight * .5
+        count = len(envs)
+        index = numpy.arange(count)
+        maxHits = hits.sum(axis = 1).max()
+        x = self.x[envs]
+        y = self.y[envs]
+        geomX = self.geomX[envs].reshape(count, -1)
+        geomRX = self.geomRX[envs].reshape(count, -1)
+        geomY = numpy.repeat(self.rowY[envs] + ry, 2, axis = 1)
+
+        # Order the contacts deepest first (a stable sort, so ties stay in row order, as they're found); the
+        # geoms that aren't contacts go last
+        cdx = dx[envs].reshape(count, -1)
+        cdy = numpy.repeat(dy[envs], 2, axis = 1)
+        depth = numpy.minimum(numpy.minimum(ry + cdy, geomRX + cdx), numpy.minimum(ry - cdy, geomRX - cdx)) + r
+        order = numpy.argsort(numpy.where(hits, -depth, numpy.inf), axis = 1, kind = 'mergesort')
+
+        landed = numpy.zeros(count, dtype = bool)
+        depths = numpy.empty((count, 4))
+        for iteration in xrange(0, self.contactIterations):
+            for k in xrange(0, maxHits):
+                geom = order[:, k]
+                gx = geomX[index, geom]
+                grx = geomRX[index, geom]
+                cdx = x - gx
+                cdy = y - geomY[index, geom]
+                ox = numpy.maximum(numpy.abs(cdx) - grx, 0.0)
+                oy = numpy.maximum(numpy.abs(cdy) - ry, 0.0)
+                active = hits[index, geom] & (((ox * ox) + (oy * oy)) <= r * r)
+                # Penetration depth through each side:  top, left, bottom, right
+                depths[:, 0] = ry + cdy + r
+                depths[:, 1] = grx + cdx + r
+                depths[:, 2] = ry - cdy + r
+                depths[:, 3] = grx - cdx + r
+                side = numpy.argmin(depths, axis = 1)
+                depth = depths[index, side]
+                active &= depth > 0.0
+                if iteration == 0:
+                    landed |= active & (side == 0)
+                x += numpy.where(active, depth * _NORMAL_X[side], 0.0)
+                y += numpy.where(active, depth * _NORMAL_Y[side], 0.0)
+
+        self.x[envs] = x
+        self.y[envs] = y
+        top = envs[landed]
+        self.ay[top] = 0.0
+        self.vy[top] = 0.0
+        self.resting[top] = True
+
+    def observe(self):
+        """ Write the observations into self.obs
+        """
+        obs = self.obs
+        k = self.numObservedRows
+        obs[:, 0] = self.x / self.sizeX
+        obs[:, 1] = self.y / self.sizeY
+        obs[:, 2] = self.vy / self.maxSpeed
+        obs[:, 3] = self.resting
+
+        # The rows the ball hasn't passed yet are the last ones (the rows are in order, top to bottom)
+        notPassed = self.rowY + self.blockHeight >= self.y[:, numpy.newaxis]
+        first = self.numRows - notPassed.sum(axis = 1)
+        index = first[:, numpy.newaxis] + self.observedIndex
+        valid = index < self.numRows
+        index = numpy.minimum(index, self.numRows - 1)
+        rows = self.envIndex[:, numpy.newaxis]
+        gapX = ((self.rowGap[rows, index] + .5) * self.blockWidth) / self.sizeX
+        rowDY = (self.rowY[rows, index] - self.y[:, numpy.newaxis]) / self.sizeY
+        obs[:, OBS_BALL_SIZE::2] = numpy.where(valid, gapX, -1.0)
+        obs[:, OBS_BALL_SIZE + 1::2] = numpy.where(valid, rowDY, 2.0)
+
+
+class FalldownEnv(object):
+    """ A single copy of Falldown (see VectorFalldownEnv for the arguments, observations and rewards)
+    """
+
+    def __init__(self, **options):
+        options['autoReset'] = False
+        self.env = VectorFalldownEnv(1, **options)
+        # The observation:  a view of the vector environment's buffer
+        self.obs = self.env.obs[0]
+        self.action = numpy.zeros(1, dtype = numpy.int64)
+
+    @property
+    def observationSize(self):
+        return self.env.observationSize
+
+    @property
+    def actionCount(self):
+        return self.env.actionCount
+
+    def seed(self, seed):
+        self.env.seed(seed)
+
+    def reset(self):
+        """ Start a new episode, and return the observation
+        """
+        self.env.reset()
+        return self.obs
+
+    def step(self, action):
+        """ Take an action, and return (observation, reward, done, info)
+        """
+        self.action[0] = action
+        obs, rewards, dones, info = self.env.step(self.action)
+        return self.obs, float(rewards[0]), bool(dones[0]), {'truncated': bool(info['truncated'][0])}
+
+
+class _PythonRandom(object):
+    """ Draws gaps from the random module, the way FalldownRow does, for a VectorFalldownEnv's rng (see
+    compareWithGameObject)
+    """
+
+    def randint(self, low, high, size):
+        count = int(numpy.prod(size))
+        return numpy.array([random.randint(low, high - 1) for i in xrange(0, count)]).reshape(size)
+
+
+def compareWithGameObject(seed, directions, numRows = 6, dt = .01):
+    """ Play the same game (random seed, and a list of directions -- -1, 0 or 1 -- one per tick) with a GameObject
+    and with a one-copy VectorFalldownEnv, on the default level with numRows rows, stepped every dt seconds
+
+    Both draw their gaps from the random module (seeded with seed), so they play the same rows.  Returns (maxError,
+    objectCrush, envCrush):  the largest difference in ball position (in pixels) between the two, over every tick,
+    and the tick at which each one's ball got crushed (or None).
+    """
+    import gameobj
+
+    random.seed(seed)
+    world = gameobj.GameObject()
+    world.initStateMachine()
+    world.setScreenSize(800, 600)
+    world.initLevel(600, numRows, 10)
+    world.stateMachine.setState('PlayingGame')
+
+    positions = []
+    objectCrush = None
+    crushed = world.stateMachine.states['GotCrushed']
+    for k in xrange(0, len(directions)):
+        world.ball.setDirection(directions[k])
+        world.ball.respondToControllerInput()
+        world.step(dt)
+        if world.stateMachine.currentState == crushed:
+            objectCrush = k + 1
+            break
+        pos = world.ball.getPosition()
+        positions.append((pos[0], pos[1]))
+
+    random.seed(seed)
+    env = VectorFalldownEnv(1, dt = dt, autoReset = False, numRows = numRows)
+    env.rng = _PythonRandom()
+    env.resetEnvs(env.envIndex)
+    action = numpy.zeros(1)
+    maxError = 0.0
+    envCrush = None
+    for k in xrange(0, len(directions)):
+        action[0] = directions[k]
+        crushedEnvs, newRows = env.tick(action)
+        if crushedEnvs[0]:
+            envCrush = k + 1
+            break
+        if k < len(positions):
+            x, y = positions[k]
+            maxError = max(maxError, math.hypot(env.x[0] - x, env.y[0] - y))
+    return maxError, objectCrush, envCrush
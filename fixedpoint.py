@@ -0,0 +1,381 @@
+""" Fixed-point physics for Falldown
+
+The regular physics (physics.integrate, GameObject.constrainBallToScreen, the collision pipeline) works in floats,
+with int() truncations here and there, so a game can play out slightly differently on different machines and Python
+builds.  FixedPointPhysics runs the same game loop entirely in integers:
+
+    positions       1/256 pixel         (FP_ONE = 1 pixel)
+    velocities      1/256 pixel/sec
+    accelerations   1/256 pixel/sec^2
+    time            microseconds
+
+Integer arithmetic is exact, so the same inputs always give the same game, bit for bit, on any machine -- a replay
+or a sweep result can be checked by comparing stateHash()es instead of simulating it again.
+
+The fixed-point state is authoritative:  after every step, the ball's and rows' float state is set from it (so
+drawing, the state machine, and anything else that reads the GameObject keeps working).  The float state is never
+read back, except for the things the game sets from outside the physics:  the ball's direction, the rows' speeds,
+and new rows (which are still made by GameObject.shiftRows).
+
+Usage:
+    world.setFixedPointPhysics(True)        # world is an initialized GameObject; world.step now runs in fixed-point
+    print stateHash(world)
+"""
+
+__author__ = 'Mass KonFuzion'
+
+import hashlib
+import struct
+
+from MKFMath.MKFMath2D import PI2
+from MKFMath.Vector2D import *
+from collision import *
+from physics import copyPhysicsState
+
+# Fractional bits of a fixed-point value
+FP_SHIFT = 8
+FP_ONE = 1 << FP_SHIFT
+
+# Microseconds per second
+US_PER_SEC = 1000000
+
+
+def toFixed(x):
+    """ Convert a float to fixed-point (rounding to the nearest 1/256)
+    """
+    return int(round(x * FP_ONE))
+
+
+def toFloat(x):
+    """ Convert a fixed-point value to a float (exactly)
+    """
+    return x / float(FP_ONE)
+
+
+def truncate(x):
+    """ Truncate a fixed-point value to a whole number of pixels, toward zero (as int() truncates a float)
+    """
+    if x < 0:
+        return -((-x) >> FP_SHIFT << FP_SHIFT)
+    return x >> FP_SHIFT << FP_SHIFT
+
+
+def toMicroseconds(dt):
+    """ Convert a timestep in seconds to whole microseconds
+    """
+    return int(round(dt * US_PER_SEC))
+
+
+class FixedPointPhysics(object):
+    """ Runs a GameObject's physics in fixed-point (see the module docstring)
+    """
+
+    def __init__(self, world):
+        self.world = world
+
+        # Ball:  position, velocity, and acceleration (the x velocity comes from the ball's direction every step)
+        self.x = 0
+        self.y = 0
+        self.vx = 0
+        self.vy = 0
+        self.ay = 0
+
+        # Rows:  the top of each row, and the fraction of a fixed-point unit (in 1/US_PER_SEC) each has yet to move
+        self.rowY = []
+        self.rowCarry = []
+        # Each row's CollisionGeoms, as (geom, center x, half-width) tuples
+        self.rowGeoms = []
+
+        # Contact normal (written by the penetration kernel)
+        self.normal = Vector2D()
+        # Contacts found this tick, as (depth, normal x, normal y, row index, geom, center x, center y, half-width)
+        self.contacts = []
+
+        self.capture()
+
+    def capture(self):
+        """ Take the fixed-point state from the world's float state
+
+        Call this whenever the level is set up (GameObject.initLevel and resetLevel do)
+        """
+        world = self.world
+        ball = world.ball
+        physState = ball.currPhysState
+
+        self.sizeX = toFixed(world.sizeX)
+        self.sizeY = toFixed(world.sizeY)
+        self.radius = toFixed(ball.radius)
+        self.maxSpeed = toFixed(ball.maxSpeed)
+        self.gravity = toFixed(ball.forceGravity[1] * physState.inverseMass)
+        self.blockHeight = toFixed(world.blockHeight)
+        self.halfHeight = self.blockHeight >> 1
+
+        self.x = toFixed(physState.position[0])
+        self.y = toFixed(physState.position[1])
+        self.vx = toFixed(physState.velocity[0])
+        self.vy = toFixed(physState.velocity[1])
+        self.ay = toFixed(physState.netForce[1] * physState.inverseMass)
+
+        self.rowY = [toFixed(row.yPos) for row in world.rows]
+        self.rowCarry = [0] * len(world.rows)
+        self.rowGeoms = [self.captureGeoms(row) for row in world.rows]
+
+    def captureGeoms(self, row):
+        """ Return a row's CollisionGeoms as (geom, center x, half-width) tuples
+        """
+        geoms = []
+        for geom in row.collisionGeoms:
+            if geom != None:
+                geoms.append((geom, toFixed(geom.center[0]), toFixed(geom.r[0])))
+        return geoms
+
+    def step(self, dt):
+        """ Advance the game by one fixed timestep, dt (in seconds).  Mirrors GameObject.step
+        """
+        world = self.world
+        ball = world.ball
+        dtUs = toMicroseconds(dt)
+
+        copyPhysicsState(ball.prevPhysState, ball.currPhysState)
+
+        # Integrate (position first, then velocity, as physics.integrate does).  // rounds toward -infinity
+        self.vx = ball.direction * self.maxSpeed
+        self.x += (self.vx * dtUs) // US_PER_SEC
+        self.y += (self.vy * dtUs) // US_PER_SEC
+        self.vy += (self.ay * dtUs) // US_PER_SEC
+
+        # Crushed once the center of the ball is a whole pixel above the top of the screen (as in GameObject.step)
+        if self.y <= -FP_ONE:
+            world.stateMachine.setState('GotCrushed')
+
+        self.moveLevel(dtUs)
+        self.constrainBallToScreen()
+
+        if not (world.restingRowIndex >= 0 and world.restingFastPath and self.keepResting()):
+            # Gravity, then collisions
+            self.ay = self.gravity
+            self.processCollisions()
+
+        self.syncFloats(dt)
+
+    def moveLevel(self, dtUs):
+        """ Move the rows, and shift in a new row once the top row has left the screen
+        """
+        world = self.world
+        rowY = self.rowY
+        rowCarry = self.rowCarry
+        for i in xrange(0, len(rowY)):
+            # Carry the remainder from step to step, so the rows move at exactly their speed on average
+            delta, rowCarry[i] = divmod((toFixed(world.rows[i].yVel) * dtUs) + rowCarry[i], US_PER_SEC)
+            rowY[i] += delta
+
+        if rowY[0] <= -self.blockHeight:
+            # GameObject.shiftRows makes the new row (from the row source, if there is one); the float rows have to be
+            # up to date for it to put the new row in the right place
+            for i in xrange(0, len(rowY)):
+                world.rows[i].setYPos(toFloat(rowY[i]))
+            world.shiftRows(toFloat(rowY[-1]) + world.rowSpacing)
+
+            newRow = world.rows[-1]
+            del rowY[0]
+            del rowCarry[0]
+            del self.rowGeoms[0]
+            rowY.append(toFixed(newRow.yPos))
+            rowCarry.append(0)
+            self.rowGeoms.append(self.captureGeoms(newRow))
+
+    def constrainBallToScreen(self):
+        """ Keep the ball between the walls, and above the floor
+
+        Truncates to whole pixels exactly where GameObject.constrainBallToScreen does:  the ball is only pushed back
+        once it's a whole pixel into a wall (or the floor), and then it's put on a whole pixel (y too, for a wall)
+        """
+        r = self.radius
+        if truncate(self.x - r) < 0:
+            self.x = truncate(r)
+            self.y = truncate(self.y)
+        elif truncate(self.x + r) > truncate(self.sizeX):
+            self.x = truncate(self.sizeX - r)
+            self.y = truncate(self.y)
+
+        if truncate(self.y + r) > truncate(self.sizeY):
+            self.y = truncate(self.sizeY - r)
+            self.vx = 0
+            self.vy = 0
+
+    def penetration(self, cx, cy, rx):
+        """ Return (depth, normal x, normal y) of the ball's penetration into an AABB, or None if they don't touch
+
+        (The scalar kernels work on these integers as they are:  every value they compute is an integer well below
+        2^53, so even their float sums are exact)
+        """
+        x = self.x
+        y = self.y
+        r = self.radius
+        ry = self.halfHeight
+        if not isIntersecting_Sphere_AABB_f(x, y, r, cx, cy, rx, ry):
+            return None
+        normal = self.normal
+        depth = minimumPenetrationDepthAndNormal_Sphere_AABB_f(x, y, r, cx, cy, rx, ry, normal)
+        return depth, int(normal[0]), int(normal[1])
+
+    def keepResting(self):
+        """ Carry a resting ball along with its supporting row.  Mirrors GameObject.collision_KeepResting
+        """
+        world = self.world
+        i = world.restingRowIndex
+        rowY = self.rowY
+        r = self.radius
+
+        # The neighbouring rows must be clear of the ball
+        if (i > 0 and self.y - r <= rowY[i - 1] + self.blockHeight) or \
+           (i < len(rowY) - 1 and self.y + r >= rowY[i + 1]):
+            world.clearResting()
+            return False
+
+        cy = rowY[i] + self.halfHeight
+        contact = None
+        for geom, cx, rx in self.rowGeoms[i]:
+            if geom is world.restingGeom:
+                contact = self.penetration(cx, cy, rx)
+            elif self.penetration(cx, cy, rx) != None:
+                # The ball reaches the far side of the gap
+                world.clearResting()
+                return False
+
+        if contact == None or contact[2] != -1:
+            # Rolled off the edge of the gap
+            world.clearResting()
+            return False
+
+        self.y -= contact[0]
+        return True
+
+    def processCollisions(self):
+        """ Find the ball's contacts with the rows, and respond to them as GameObject.collision_ProcessCollisions does
+        (a single contact) or GameObject.collision_ResolveManifold does (more than one)
+        """
+        world = self.world
+        contacts = self.contacts
+        del contacts[:]
+        for i in xrange(0, len(self.rowY)):
+            cy = self.rowY[i] + self.halfHeight
+            for geom, cx, rx in self.rowGeoms[i]:
+                c = self.penetration(cx, cy, rx)
+                if c != None:
+                    contacts.append((c[0], c[1], c[2], i, geom, cx, cy, rx))
+
+        if len(contacts) == 0:
+            world.clearResting()
+            return
+        if len(contacts) > 1:
+            self.resolveManifold()
+            return
+
+        depth, nx, ny, contactRow, contactGeom = contacts[0][:5]
+        if nx == 0 and ny == -1:
+            # Landed on top of the row:  cancel gravity, and stop falling
+            self.ay = 0
+            self.vy = 0
+            world.restingRowIndex = contactRow
+            world.restingGeom = contactGeom
+        else:
+            world.clearResting()
+
+        self.x += depth * nx
+        self.y += depth * ny
+
+    def resolveManifold(self):
+        """ Resolve more than one contact:  deepest first, re-measured as the ball moves, for up to
+        world.contactIterations passes.  Mirrors GameObject.collision_ResolveManifold
+        """
+        world = self.world
+        contacts = self.contacts
+        contacts.sort(key = _contactDepth, reverse = True)
+
+        landedRow = -1
+        landedGeom = None
+        for iteration in xrange(0, world.contactIterations):
+            moved = False
+            for c in contacts:
+                contactRow, geom, cx, cy, rx = c[3:]
+                p = self.penetration(cx, cy, rx)
+                if p == None or p[0] <= 0:
+                    continue
+                depth, nx, ny = p
+                if iteration == 0 and landedRow < 0 and nx == 0 and ny == -1:
+                    landedRow = contactRow
+                    landedGeom = geom
+                self.x += depth * nx
+                self.y += depth * ny
+                moved = True
+            if not moved:
+                break
+
+        if landedRow >= 0:
+            self.ay = 0
+            self.vy = 0
+            world.restingRowIndex = landedRow
+            world.restingGeom = landedGeom
+        else:
+            world.clearResting()
+
+    def syncFloats(self, dt):
+        """ Set the world's float state from the fixed-point state
+        """
+        world = self.world
+        ball = world.ball
+        physState = ball.currPhysState
+
+        ball.setPosition(toFloat(self.x), toFloat(self.y))
+        ball.setVelocity(toFloat(self.vx), toFloat(self.vy))
+        Vector2D_setxy(physState.acceleration, 0.0, toFloat(self.ay))
+        Vector2D_setxy(physState.netForce, 0.0, toFloat(self.ay) * physState.mass)
+
+        # The ball's rotation is only drawn, so it stays in floats (as in physics.integrate)
+        physState.angularVelocity = (physState.velocity[0] * dt) / physState.mass
+        physState.angle = (physState.angle + physState.angularVelocity) % PI2
+
+        for i in xrange(0, len(self.rowY)):
+            world.rows[i].setYPos(toFloat(self.rowY[i]))
+
+
+def _contactDepth(contact):
+    """ Sort key for the contacts:  penetration depth
+    """
+    return contact[0]
+
+
+def stateHash(world):
+    """ Return a hash (hex string) of the game state:  the ball(s), the rows, the resting contact, and the
+    Collidables (and pickups collected), if there are any
+
+    With fixed-point physics, the hash is of the fixed-point state, so it is the same on every machine.  Otherwise,
+    it's a hash of the float state (only comparable between runs on the same machine and Python build).
+    """
+    h = hashlib.sha1()
+    fp = world.fixedPhysics
+    if fp != None:
+        values = [fp.x, fp.y, fp.vx, fp.vy, fp.ay, world.restingRowIndex] + fp.rowY + [row.gap for row in world.rows]
+        h.update(struct.pack("<%dq" % len(values), *values))
+    else:
+        physState = world.ball.currPhysState
+        values = [physState.position[0], physState.position[1], physState.velocity[0], physState.velocity[1],
+                  physState.netForce[1]] + [row.yPos for row in world.rows]
+        # The other balls, in multi-ball mode
+        for i in xrange(1, len(world.balls)):
+            physState = world.balls[i].currPhysState
+            values += [physState.position[0], physState.position[1], physState.velocity[1]]
+        h.update(struct.pack("<%dd" % len(values), *values))
+        h.update(struct.pack("<%dq" % (len(world.rows) + 1), world.restingRowIndex, *[row.gap for row in world.rows]))
+
+    # The Collidables ride with the rows, so (like the rows' gaps) they're hashed by what they are and which row
+    # they're on.  (Nothing is added if there are none, so the hash of a game without any is the same as ever)
+    collidables = world.collidableState()
+    if collidables != None:
+        pickupsCollected, objs = collidables
+        h.update(struct.pack("<q", pickupsCollected))
+        for rowIndex, kind, x, halfWidth, halfHeight, offsetY in objs:
+            h.update(struct.pack("<q4d", rowIndex, x, halfWidth, halfHeight, offsetY))
+            h.update(kind)
+    return h.hexdigest()
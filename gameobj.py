@@ -5,9 +5,20 @@ This is the object that actually contains the game
 
 __author__ = 'Mass KonFuzion'
 
+import bisect
+
 from ball import *
 from row import *
 from statemachine import *
+from fixedpoint import FixedPointPhysics, stateHash
+from snapshot import WorldSnapshot
+from spatialhash import *
+
+
+def _contactDepth(contact):
+    """ Sort key for the contact manifold:  a contact's penetration depth
+    """
+    return contact[0]
 
 
 class GameObject:
@@ -22,6 +33,9 @@ class GameObject:
         self.numRows = 3
         # List of FalldownRows
         self.rows = []
+        # Counts changes to the rows (a row added, re-created, or shifted in).  Anything that caches something about
+        # the rows (e.g. an autopilot.Autopilot's plan) can compare it to know when to recompute
+        self.rowGeneration = 0
         # Blocks per row
         self.blocksPerRow = 16
 
@@ -29,6 +43,9 @@ class GameObject:
 
         self.blockHeight = 0.0
 
+        # Vertical distance between the tops of neighbouring rows (computed in initLevel)
+        self.rowSpacing = 0.0
+
         # Screen size -- get this from the PygameApplication class (i.e. the PygameApplication class should pass it
         # into this GameObject)
         self.sizeX = 0
@@ -36,9 +53,49 @@ class GameObject:
 
         self.ball = Ball(15.0)
 
+        # The balls in play.  Normally that's just self.ball; in multi-ball mode (see setBallCount), a level starts
+        # with ballCount balls, all steered together.  self.ball is always balls[0]
+        self.balls = [self.ball]
+        self.ballCount = 1
+
+        # Row source (e.g. a levelgen.LevelGenerator).  If set, new rows get their gap, speed and spacing from
+        # rowSource.nextRow(); otherwise, every row gets a random gap, and the rows always move at the same speed
+        self.rowSource = None
+
         # Contact Object
         self._contactObj = None
         self._contactVel= Vector2D() # Note - consider extending the base class
+        # The row index and CollisionGeom that generated _contactObj
+        self._contactRowIndex = -1
+        self._contactGeom = None
+
+        # Contact manifold:  every contact found this tick, as (depth, normal, row index, CollisionGeom) tuples.
+        # _contactObj is the deepest of them.  When the ball touches more than one CollisionGeom, the contacts are
+        # resolved deepest first, contactIterations times over (see collision_ProcessCollisions)
+        self.contacts = []
+        self.contactIterations = 4
+        self._manifoldNormal = Vector2D()
+
+        # Resting contact.  While the ball sits on top of a row, the ball is simply carried along with that row, and
+        # the full collision pipeline is skipped (see step).  restingRowIndex is the index (in self.rows) of the
+        # supporting row, or -1 if the ball is not resting; restingGeom is the CollisionGeom the ball sits on.
+        self.restingRowIndex = -1
+        self.restingGeom = None
+        # Set restingFastPath to False to run the full collision pipeline every tick (e.g. to compare the two)
+        self.restingFastPath = True
+        self._restingNormal = Vector2D()
+
+        # Collidables (pickups, hazards, ...) riding with the rows, in a spatial hash (see spatialhash.py and
+        # addCollidable).  collidableHandlers maps a Collidable's kind to what happens when a ball touches one:
+        # handler(ball, collidable)
+        self.spatialHash = SpatialHash()
+        self.collidableHandlers = {COLLIDABLE_PICKUP: self.collectPickup, COLLIDABLE_HAZARD: self.hitHazard}
+        self.pickupsCollected = 0
+        self._collidableHits = []
+
+        # Fixed-point physics (a fixedpoint.FixedPointPhysics), or None to use the float physics.  See
+        # setFixedPointPhysics
+        self.fixedPhysics = None
 
         # State Machine for managing play states (e.g. Intro, MainMenu, InGame,etc)
         self.stateMachine = CStateMachine()
@@ -74,33 +131,46 @@ class GameObject:
 
 
 
-    def addNewRow(self, yPos, gapIndex = -1):
+    def addNewRow(self, yPos, gapIndex = -1, yVel = -200):
         """ Add new row to the level/game board
 
         This function appends a row to the rows array of the GameObject.  Thus, addNewRow will only ever be called
         at the beginning of the game, or when the player reaches a newlevel (i.e. we need to add another row to the rows
         list).
         """
-        newRow = FalldownRow(yPos, self.blocksPerRow, self.blockWidth, self.blockHeight)
+        newRow = FalldownRow(yPos, self.blocksPerRow, self.blockWidth, self.blockHeight, yVel, gapIndex)
         self.rows.append(newRow)
+        self.rowGeneration += 1
 
-    def resetRow(self, itemNum, yPos, gapIndex = -1):
+    def resetRow(self, itemNum, yPos, gapIndex = -1, yVel = -200):
         """ Re-initialize an existing row
         """
-        newRow = FalldownRow(yPos, self.blocksPerRow, self.blockWidth, self.blockHeight)
+        self.dropRowCollidables(self.rows[itemNum])
+        newRow = FalldownRow(yPos, self.blocksPerRow, self.blockWidth, self.blockHeight, yVel, gapIndex)
         self.rows[itemNum] = newRow
+        self.rowGeneration += 1
+
+    def setRowSpeed(self, yVel):
+        """ Set the speed of every row (the rows always move together, so they never overlap)
+        """
+        for i in xrange(0, len(self.rows)):
+            self.rows[i].yVel = yVel
 
 
     def draw(self, screen):
         """ Draw the game
         """
 
-        # Draw the rows
+        # Draw the rows (and anything riding on them)
         for i in xrange(0, self.numRows):
             self.rows[i].draw(screen)
+            if self.rows[i].collidables:
+                for obj in self.rows[i].collidables:
+                    obj.draw(screen)
 
-        # Draw the ball
-        self.ball.draw(screen)
+        # Draw the ball(s)
+        for ball in self.balls:
+            ball.draw(screen)
 
     def shiftRows(self, yPos):
         """ Shift rows up one index
@@ -110,7 +180,19 @@ class GameObject:
         bottom-most row.
         """
         # Store a temp row
-        tmp = FalldownRow(yPos, self.blocksPerRow, self.blockWidth, self.blockHeight)
+        if self.rowSource != None:
+            # Let the row source decide the new row's gap, speed, and distance from the row above it
+            gap, yVel, spacing = self.rowSource.nextRow()
+            tmp = FalldownRow(self.rows[self.numRows - 1].yPos + spacing, self.blocksPerRow, self.blockWidth,
+                              self.blockHeight, yVel, gap)
+            self.setRowSpeed(yVel)
+        else:
+            # The new row moves at the same speed as the others
+            tmp = FalldownRow(yPos, self.blocksPerRow, self.blockWidth, self.blockHeight,
+                              self.rows[self.numRows - 1].yVel)
+
+        # The top row is leaving the level, along with whatever rides on it
+        self.dropRowCollidables(self.rows[0])
 
         for i in xrange(0, self.numRows - 1):
             # Shift the row references (e.g. rows[0] now points to rows[1])
@@ -118,6 +200,13 @@ class GameObject:
 
         # Assign the last row of rows[] to point to tmp
         self.rows[self.numRows - 1] = tmp
+        self.rowGeneration += 1
+
+        # The supporting row (if any) has moved up one index.  If it was rows[0], it has left the level
+        if self.restingRowIndex >= 0:
+            self.restingRowIndex -= 1
+            if self.restingRowIndex < 0:
+                self.clearResting()
 
     def setScreenSize(self, x, y):
         """ Set the screen size
@@ -148,18 +237,33 @@ class GameObject:
         #Initially, the top row should be 2/3 of the way up the screen (or, since Pygame increases y values going DOWN
         #the screen, the top row should be 1/3 of the way down the screen)
         rowSpacing = float ((ySize + self.blockHeight )/ self.numRows )
+        self.rowSpacing = rowSpacing
 
         # Starting yPos = screen height / 2
         #NOTE:  ySize is hard-coded here.  We'll need to make it respond to the
         #window size
         yPos = ySize / 2
 
+        if self.rowSource != None:
+            self.rowSource.reset()
+
+        # (The rows are all new, so nothing rides on them yet)
+        self.spatialHash.clear()
+
         for i in xrange(0, self.numRows):
             #self.addNewRow( int( ( yPos * i ) + yPos - self.blockHeight) )
-            self.addNewRow(yPos + (rowSpacing * i))
+            if self.rowSource != None:
+                gap, yVel, spacing = self.rowSource.nextRow()
+                if i > 0:
+                    yPos = self.rows[len(self.rows) - 1].yPos + spacing
+                self.addNewRow(yPos, gap, yVel)
+                self.setRowSpeed(yVel)
+            else:
+                self.addNewRow(yPos + (rowSpacing * i))
 
         # Set the ball's position
         self.ball.setPosition(self.sizeX / 2, self.ball.radius)
+        self.clearResting()
 
         # Initialize gravity on the ball
         # NOTE:  For Pygame, the Y axis increases down the screen.  Therefore, to animate
@@ -171,6 +275,12 @@ class GameObject:
         # Set the ball's gravity force vector
         self.ball.initGravity(gravity)
 
+        # Multi-ball mode:  put the other balls in play
+        self.resetExtraBalls()
+
+        if self.fixedPhysics != None:
+            self.fixedPhysics.capture()
+
 
     def resetLevel(self, ySize = 600.0):
         """ Reset the level
@@ -185,17 +295,35 @@ class GameObject:
         #the screen (or, since Pygame increases y values going DOWN the screen,
         #the top row should be 1/3 of the way down the screen)
         rowSpacing = float ((ySize + self.blockHeight )/ self.numRows )
+        self.rowSpacing = rowSpacing
+
+        if self.rowSource != None:
+            self.rowSource.reset()
 
         #For each row in this level, re-initialize the row
         for i in xrange(0, self.numRows):
-            self.resetRow(i, yPos + (rowSpacing * i))
+            if self.rowSource != None:
+                gap, yVel, spacing = self.rowSource.nextRow()
+                if i > 0:
+                    yPos = self.rows[i - 1].yPos + spacing
+                self.resetRow(i, yPos, gap, yVel)
+                self.setRowSpeed(yVel)
+            else:
+                self.resetRow(i, yPos + (rowSpacing * i))
 
         # Set the ball's position
         self.ball.setPosition(self.sizeX / 2, self.ball.radius)
+        self.clearResting()
 
         # Reset the ball's control state
         self.ball.controlState.reset()
 
+        # Multi-ball mode:  put the other balls back in play
+        self.resetExtraBalls()
+
+        if self.fixedPhysics != None:
+            self.fixedPhysics.capture()
+
         # This reset is necessary because, without it, there is a bug that
         # occurs when you get crushed while holding down a direction key. The
         # bug is that, when you die while holding down a direction key, you
@@ -213,14 +341,18 @@ class GameObject:
 
         # Check to see if we need to add a new row (the whole block needs to have cleared the screen)
         if self.rows[0].yPos <= (0 - int(self.blockHeight)):
-            # Shift rows -- create a new row at sizeY (give the block the appearance of coming in from  off-the-screen.)
-            # Creating the new block at sizeY will create the very top of the block at the very bottom of the screen.
-            self.shiftRows(self.sizeY)
-
-    def constrainBallToScreen(self):
-        """ Constrain the position of the ball to the screen
+            # Shift rows -- create a new row one row spacing below the bottom row.  That's at sizeY (give the block the
+            # appearance of coming in from  off-the-screen.)  Creating the new block at sizeY will create the very top of
+            # the block at the very bottom of the screen.
+            # NOTE:  Unless the rows move a whole number of pixels per tick, the top row overshoots -blockHeight by a
+            # fraction of a tick.  Placing the new row at exactly sizeY would then make the spacing between rows drift
+            self.shiftRows(self.rows[self.numRows - 1].yPos + self.rowSpacing)
+
+    def constrainBallToScreen(self, ballRef = None):
+        """ Constrain the position of the ball (self.ball, unless another ball is given) to the screen
         """
-        ballRef = self.ball
+        if ballRef == None:
+            ballRef = self.ball
         ballPos = ballRef.currPhysState.position
 
         if int(ballRef.currPhysState.position[0] - ballRef.radius) < int(0):
@@ -233,13 +365,406 @@ class GameObject:
             ballRef.setPosition(ballPos[0], int(self.sizeY - ballRef.radius))
             Vector2D_setxy(ballRef.currPhysState.velocity, 0, 0)
 
+    def addCollidable(self, rowIndex, kind, x, halfWidth, halfHeight, offsetY = None):
+        """ Add a Collidable of the given kind (e.g. COLLIDABLE_PICKUP), centered at x, riding with rows[rowIndex],
+        and return it
+
+        offsetY is how far below the top of the row its center is; by default, it sits on top of the row.  It leaves
+        the level with its row
+        """
+        if offsetY == None:
+            offsetY = -halfHeight
+        row = self.rows[rowIndex]
+        obj = Collidable(kind, x, halfWidth, halfHeight, offsetY)
+        obj.geom.center[1] = row.yPos + obj.offsetY
+        obj.row = row
+        if row.collidables == None:
+            row.collidables = []
+            row.spatialHash = self.spatialHash
+        row.collidables.append(obj)
+        self.spatialHash.insert(obj)
+        return obj
+
+    def removeCollidable(self, obj):
+        """ Take a Collidable out of the level
+        """
+        obj.row.collidables.remove(obj)
+        obj.row = None
+        self.spatialHash.remove(obj)
+
+    def dropRowCollidables(self, row):
+        """ Take the Collidables riding with a row out of the level (e.g. when the row leaves it)
+        """
+        if row.collidables:
+            for obj in row.collidables:
+                obj.row = None
+                self.spatialHash.remove(obj)
+            del row.collidables[:]
+
+    def collidableState(self):
+        """ Return the Collidables in play, and pickupsCollected, as an immutable value (for snapshots):
+        (pickupsCollected, ((rowIndex, kind, x, halfWidth, halfHeight, offsetY), ...)), in row order -- or None if
+        there are no Collidables and no pickups have been collected
+        """
+        if self.spatialHash.count == 0 and self.pickupsCollected == 0:
+            return None
+        collidables = []
+        for i in xrange(0, self.numRows):
+            if self.rows[i].collidables:
+                for obj in self.rows[i].collidables:
+                    geom = obj.geom
+                    collidables.append((i, obj.kind, geom.center[0], geom.r[0], geom.r[1], obj.offsetY))
+        return (self.pickupsCollected, tuple(collidables))
+
+    def setCollidableState(self, state):
+        """ Replace the Collidables in play (and pickupsCollected) with the ones in state (see collidableState)
+
+        The rows must already be where state was saved (e.g. restored from the same snapshot)
+        """
+        if self.spatialHash.count > 0:
+            for i in xrange(0, self.numRows):
+                self.dropRowCollidables(self.rows[i])
+        if state == None:
+            self.pickupsCollected = 0
+            return
+        self.pickupsCollected = state[0]
+        for rowIndex, kind, x, halfWidth, halfHeight, offsetY in state[1]:
+            self.addCollidable(rowIndex, kind, x, halfWidth, halfHeight, offsetY)
+
+    def collectPickup(self, ball, obj):
+        """ Collidable handler:  the ball picks the pickup up
+        """
+        self.pickupsCollected += 1
+        self.removeCollidable(obj)
+
+    def hitHazard(self, ball, obj):
+        """ Collidable handler:  the hazard crushes the ball
+        """
+        self.loseBall(ball)
+
+    def loseBall(self, ball):
+        """ A ball got crushed:  in multi-ball mode, it leaves play; if it was the last ball, the game is over
+        """
+        balls = self.balls
+        if len(balls) == 1:
+            self.stateMachine.setState('GotCrushed')
+            return
+        if ball not in balls:
+            return
+        balls.remove(ball)
+        if self.ball is not balls[0]:
+            # The player now steers the next ball
+            balls[0].direction = self.ball.direction
+            self.ball = balls[0]
+
+    def collision_Collidables(self):
+        """ Find the Collidables each ball touches (using the spatial hash), and call their kinds' handlers
+        """
+        hits = self._collidableHits
+        handlers = self.collidableHandlers
+        state = self.stateMachine.currentState
+        # (A handler may take a ball out of play, so go through a copy of the list)
+        for ball in self.balls[:]:
+            sphere = ball.collisionGeom
+            sx = sphere.center[0]
+            sy = sphere.center[1]
+            sr = sphere.r
+            del hits[:]
+            self.spatialHash.querySphere(sx, sy, sr, hits)
+            for obj in hits:
+                geom = obj.geom
+                if obj.row != None and \
+                   isIntersecting_Sphere_AABB_f(sx, sy, sr, geom.center[0], geom.center[1], geom.r[0], geom.r[1]):
+                    handler = handlers.get(obj.kind)
+                    if handler != None:
+                        handler(ball, obj)
+                        # Once a handler has ended the game, or taken the ball out of play, the ball's hits are moot
+                        if self.stateMachine.currentState != state or ball not in self.balls:
+                            break
+            if self.stateMachine.currentState != state:
+                return
+
+    def setBallCount(self, ballCount):
+        """ Set the number of balls a level starts with (1 = the normal game; more = multi-ball mode), and put that
+        many balls in play now
+
+        In multi-ball mode, every ball is steered by the player's input.  The balls don't collide with each other,
+        only with the rows.  A ball that gets crushed leaves play, and the game is over when the last one does.
+        Multi-ball mode doesn't work with fixed-point physics.
+        """
+        if ballCount < 1:
+            raise ValueError("a level needs at least 1 ball")
+        if ballCount > 1 and self.fixedPhysics != None:
+            raise ValueError("multi-ball mode doesn't work with fixed-point physics")
+        self.ballCount = ballCount
+        self.resetExtraBalls()
+
+    def makeExtraBall(self):
+        """ Return a new Ball, set up like self.ball (for multi-ball mode)
+        """
+        ball = Ball(self.ball.radius)
+        ball.setMaxSpeed(self.ball.maxSpeed)
+        Vector2D_setxy(ball.forceGravity, self.ball.forceGravity[0], self.ball.forceGravity[1])
+        # All of the balls follow the same controls
+        ball.controlState = self.ball.controlState
+        return ball
+
+    def setBallsInPlay(self, numBalls):
+        """ Make the number of balls in play numBalls (adding new balls, or taking the last ones out of play)
+        """
+        while len(self.balls) < numBalls:
+            self.balls.append(self.makeExtraBall())
+        del self.balls[numBalls:]
+
+    def resetExtraBalls(self):
+        """ Put ballCount balls in play:  self.ball where it is, and the others spread along the top of the screen
+        """
+        self.setBallsInPlay(self.ballCount)
+        r = self.ball.radius
+        for i in xrange(1, len(self.balls)):
+            ball = self.balls[i]
+            Vector2D_setxy(ball.forceGravity, self.ball.forceGravity[0], self.ball.forceGravity[1])
+            # Spread the balls out with the golden ratio, so any number of them is evenly spread
+            x = r + ((self.sizeX - (2 * r)) * ((i * 0.6180339887) % 1.0))
+            ball.setPosition(x, r)
+            ball.setVelocity(0, 0)
+            copyPhysicsState(ball.prevPhysState, ball.currPhysState)
+        if len(self.balls) > 1:
+            # The resting fast path is for a single ball
+            self.clearResting()
+
+    def setFixedPointPhysics(self, enabled):
+        """ Turn fixed-point physics on or off
+
+        With fixed-point physics, step() runs the game in integers (see fixedpoint.py), so a game plays out exactly
+        the same on every machine.  Turn it on after the level has been initialized (the fixed-point state is taken
+        from the current float state)
+        """
+        if enabled and len(self.balls) > 1:
+            raise ValueError("fixed-point physics doesn't work in multi-ball mode")
+        if enabled:
+            self.fixedPhysics = FixedPointPhysics(self)
+        else:
+            self.fixedPhysics = None
+
+    def snapshot(self, snap = None):
+        """ Save the game state, and return it as a snapshot.WorldSnapshot (reusing snap, if given)
+        """
+        if snap == None:
+            snap = WorldSnapshot(self.numRows, len(self.balls))
+        snap.capture(self)
+        return snap
+
+    def restore(self, snap):
+        """ Put the game back in the state saved in snap (see snapshot)
+        """
+        snap.restore(self)
+
+    def stateHash(self):
+        """ Return a hash of the game state (see fixedpoint.stateHash)
+        """
+        return stateHash(self)
+
+    def step(self, dt):
+        """ Advance the game by one fixed timestep, dt (in seconds)
+        """
+        self.stepPhysics(dt)
+
+        # Anything else the ball touches (only if there is anything)
+        if self.spatialHash.count > 0:
+            self.collision_Collidables()
+
+    def stepPhysics(self, dt):
+        """ Advance the ball(s) and rows by one fixed timestep, dt (in seconds)
+        """
+        if self.fixedPhysics != None:
+            self.fixedPhysics.step(dt)
+            return
+        if len(self.balls) > 1:
+            self.stepBalls(dt)
+            return
+
+        ballRef = self.ball
+
+        # Copy current physics state into previous state
+        copyPhysicsState(ballRef.prevPhysState, ballRef.currPhysState)
+
+        # Update the ball
+        # NOTE:  This function has the code that processes the effect of
+        # forces (including gravity) on the ball
+        # DOUBLE NOTE: A better way to handle the level updates is
+        # to make all objects derive from a base object, and
+        # "integrate" or update all objects.
+        ballRef.moveBall(dt)
+
+        # After moving the ball, check to see if we've been crushed
+        # We're crushed if the center of the ball reaches the top of
+        #the screen
+        if int(ballRef.getPosition()[1]) < 0:
+            # If we've gotten crushed, then we need to change the game
+            # state to process the crushing.
+            self.stateMachine.setState('GotCrushed')
+
+        # Update the level
+        self.moveLevel(dt)
+
+        # Constrain the ball to the screen
+        self.constrainBallToScreen()
+
+        # Fast path:  if the ball is resting on a row, just carry it along with the row
+        if self.restingRowIndex >= 0 and self.restingFastPath and self.collision_KeepResting():
+            return
+
+        # Accumulate forces acting on the ball
+        ballRef.accumulateForces(dt)
+
+        # Detect Collisions & Generate a contact
+        self.collision_GenerateContacts()
+
+        # Process collisions
+        # NOTE:  This function has the code that removes the effect of
+        # gravity on the ball
+        self.collision_ProcessCollisions()
+
+    def stepBalls(self, dt):
+        """ Advance the game by one fixed timestep, dt (in seconds), in multi-ball mode
+
+        This is step(), for every ball in play (without the resting fast path).  The collision broadphase is
+        row-banded:  the rows are horizontal bands, in order down the screen, so each ball only needs testing against
+        the rows whose band (the row, grown by the ball's radius) it's in -- found by bisecting the rows' tops.  That
+        keeps the cost of a tick linear in the number of balls, whatever the number of rows.
+        """
+        balls = self.balls
+        primary = self.ball
+        direction = primary.direction
+
+        crushed = None
+        for ball in balls:
+            copyPhysicsState(ball.prevPhysState, ball.currPhysState)
+            if ball is not primary:
+                # Every ball follows the player's input
+                ball.direction = direction
+                ball.respondToControllerInput()
+            ball.moveBall(dt)
+
+            # A crushed ball leaves play
+            if int(ball.currPhysState.position[1]) < 0:
+                if crushed == None:
+                    crushed = []
+                crushed.append(ball)
+
+        if crushed != None:
+            for ball in crushed:
+                self.loseBall(ball)
+
+        self.moveLevel(dt)
+
+        rows = self.rows
+        rowTops = [row.yPos for row in rows]
+        blockHeight = self.blockHeight
+        contacts = self.contacts
+        normal = self._manifoldNormal
+        for ball in balls:
+            self.constrainBallToScreen(ball)
+            ball.accumulateForces(dt)
+
+            # Broadphase:  the rows whose band the ball is in (rows rowTops[:i] start above the ball's bottom; walk
+            # back up while they end below the ball's top)
+            sphere = ball.collisionGeom
+            sx = sphere.center[0]
+            sy = sphere.center[1]
+            sr = sphere.r
+            del contacts[:]
+            i = bisect.bisect_right(rowTops, sy + sr) - 1
+            while i >= 0 and rowTops[i] + blockHeight >= sy - sr:
+                # Narrowphase
+                for geom in rows[i].collisionGeoms:
+                    if geom != None:
+                        cx = geom.center[0]
+                        cy = geom.center[1]
+                        rx = geom.r[0]
+                        ry = geom.r[1]
+                        if isIntersecting_Sphere_AABB_f(sx, sy, sr, cx, cy, rx, ry):
+                            penDepth = minimumPenetrationDepthAndNormal_Sphere_AABB_f(sx, sy, sr, cx, cy, rx, ry,
+                                                                                       normal)
+                            contacts.append((penDepth, None, i, geom))
+                i -= 1
+
+            if contacts:
+                landedRow, landedGeom = self.collision_ResolveContacts(ball, contacts)
+                if landedRow >= 0:
+                    # Landed:  cancel gravity, and stop falling
+                    Vector2D_sub(ball.currPhysState.netForce, ball.forceGravity, ball.currPhysState.netForce)
+                    ball.setVelocity(ball.currPhysState.velocity[0], 0)
+
+    def clearResting(self):
+        """ Take the ball out of the resting state
+        """
+        self.restingRowIndex = -1
+        self.restingGeom = None
+
+    def collision_KeepResting(self):
+        """ Carry a resting ball along with its supporting row
+
+        While the ball rests on a row, the full pipeline (add gravity, test every row, subtract gravity, snap the
+        ball back onto the row) always ends the same way, so here we only test the supporting CollisionGeom.
+        Returns True if the ball is still resting on it (the ball's position is corrected exactly as
+        collision_ProcessCollisions would have done).  Otherwise, leaves the resting state and returns False, and
+        the full collision pipeline should run.
+
+        NOTE:  This makes the collision stage of a resting tick 6-7x cheaper, but the rest of the tick (moving the
+        ball and the rows) costs the same, so whole ticks in scripted play are only ~1.5x faster, and from run to
+        run the gain can vanish in the noise (see benchmark.py resting)
+        """
+        ballRef = self.ball
+        sphere = ballRef.collisionGeom
+        sx = sphere.center[0]
+        sy = sphere.center[1]
+        sr = sphere.r
+        i = self.restingRowIndex
+
+        # Nothing but the supporting row may be within reach:  the rows directly above and below must be clear of
+        # the ball (rows move together, so this only fails if the level has rows closer than a ball's diameter)
+        if (i > 0 and sy - sr <= self.rows[i - 1].yPos + self.blockHeight) or \
+           (i < self.numRows - 1 and sy + sr >= self.rows[i + 1].yPos):
+            self.clearResting()
+            return False
+
+        # ...and the ball must not reach the supporting row's other CollisionGeom (i.e. the far side of the gap)
+        for geom in self.rows[i].collisionGeoms:
+            if geom != None and geom is not self.restingGeom and \
+               isIntersecting_Sphere_AABB_f(sx, sy, sr, geom.center[0], geom.center[1], geom.r[0], geom.r[1]):
+                self.clearResting()
+                return False
+
+        # The ball must still be sitting on top of restingGeom (i.e. it hasn't rolled off the edge of the gap)
+        geom = self.restingGeom
+        cx = geom.center[0]
+        cy = geom.center[1]
+        rx = geom.r[0]
+        ry = geom.r[1]
+        if not isIntersecting_Sphere_AABB_f(sx, sy, sr, cx, cy, rx, ry):
+            self.clearResting()
+            return False
+        penDepth = minimumPenetrationDepthAndNormal_Sphere_AABB_f(sx, sy, sr, cx, cy, rx, ry, self._restingNormal)
+        if self._restingNormal[1] != -1.0:
+            self.clearResting()
+            return False
+
+        # Snap the ball back onto the top of the row (gravity was never added, and the ball's y velocity is
+        # already 0, so there's nothing else to undo)
+        ballRef.setPosition(sx, sy - penDepth)
+        return True
+
     def collision_GenerateContacts(self):
-        """ Detect collisions btwn ball and row; generate a contact
-        Note: At any point in time (in this game in particular), this function
-        will generate only 1 contact.
+        """ Detect collisions btwn ball and row; generate the contact manifold
+        Note: Usually (in this game in particular), the ball touches only 1
+        CollisionGeom at a time -- but it can touch 2 (e.g. a row and the
+        edge of the gap in the row above it, if rows are close together, or at
+        low tick rates), so every contact is kept in self.contacts.
 
-        returns None if no collision, or otherwise returns a contact object
-        calculated by GetPenetrationDepth_AABB_Sphere (from MKFCollision)
+        Sets _contactObj to None if no collision, or otherwise to the deepest contact -- a (depth, normal) tuple
+        calculated by minimumPenetrationDepthAndNormal_Sphere_AABB (from collision.py)
 
         Note:  As of today (3/12/2014), this game uses static collision
         detection (i.e. the game only considers the current position of the ball
@@ -251,6 +776,8 @@ class GameObject:
         ballRef = self.ball
 
         contactRef = None
+        contacts = self.contacts
+        del contacts[:]
 
         # Iterate through the rows
         for i in xrange(0, self.numRows):
@@ -259,18 +786,23 @@ class GameObject:
                 # If there is a CollisionGeom here, then test for collisions
                 if self.rows[i].collisionGeoms[j] != None:
                     CGRef = self.rows[i].collisionGeoms[j]
-                    if IsColliding_AABB_Sphere(CGRef, ballRef.collisionGeom):
+                    if isIntersecting_Sphere_AABB(ballRef.collisionGeom, CGRef):
 
                         # Get minimum penetration depth and the surface normal for the least-penetrated wall
-                        contactRef = GetPenetrationDepth_AABB_Sphere(CGRef, ballRef.collisionGeom)
-
-                        # NOTE: this contactVel assignment is redundant. An improvement would be
-                        # to assign the velocity only if it is null (or otherwise outdated, say if
-                        # it was storing a 'previous' value, and then for some reason, the
-                        # velocity was supposed to increase). But for our purposes,
-                        # this assignment is fine
-                        Vector2D_setxy(self._contactVel, 0, self.rows[i].yVel)
-                        self._contactObj = contactRef
+                        penDepth, penNorm = minimumPenetrationDepthAndNormal_Sphere_AABB(ballRef.collisionGeom, CGRef)
+                        contacts.append((penDepth, penNorm, i, CGRef))
+
+                        # Keep the deepest contact (the first one found, on a tie)
+                        if contactRef == None or penDepth > contactRef[0]:
+                            contactRef = (penDepth, penNorm)
+                            # NOTE: this contactVel assignment is redundant. An improvement would be
+                            # to assign the velocity only if it is null (or otherwise outdated, say if
+                            # it was storing a 'previous' value, and then for some reason, the
+                            # velocity was supposed to increase). But for our purposes,
+                            # this assignment is fine
+                            Vector2D_setxy(self._contactVel, 0, self.rows[i].yVel)
+                            self._contactRowIndex = i
+                            self._contactGeom = CGRef
 
         self._contactObj = contactRef
 
@@ -280,6 +812,11 @@ class GameObject:
         other games, you might need to make more robust collision handling.
         """
         if self._contactObj == None:
+            self.clearResting()
+            return
+
+        if len(self.contacts) > 1:
+            self.collision_ResolveManifold()
             return
 
         # DEBUG the contact obj
@@ -288,8 +825,7 @@ class GameObject:
 
         ballRef = self.ball
 
-        penNorm = self._contactObj.getNormal()
-        penDepth = self._contactObj.getMinDepth()
+        penDepth, penNorm = self._contactObj
 
         # =======================
         # Correct ball's velocity
@@ -310,12 +846,13 @@ class GameObject:
             #ball's velocity to 0
             Vector2D_sub(ballRef.currPhysState.netForce, ballRef.forceGravity, ballRef.currPhysState.netForce)
             ballRef.setVelocity(ballRef.currPhysState.velocity[0],0)
-##
-##            # NOTE:  An optimization for this would be:  Instead of subtracting
-##            # the effect of gravity at this point, simply set a flag to tell the
-##            # game not to process gravity on the ball (in the
-##            # ball.accumulateForces) function.  That would cut out unnecessary
-##            # calculations.
+
+            # The ball is now resting on the row.  Until it rolls off (or the row leaves), step() carries it along
+            # with the row instead of processing gravity and collisions (see collision_KeepResting)
+            self.restingRowIndex = self._contactRowIndex
+            self.restingGeom = self._contactGeom
+        else:
+            self.clearResting()
 
 
         # =======================
@@ -331,6 +868,68 @@ class GameObject:
         # DEBUG the position correction vector
         #print "Correction Vector: %s" % (correctionVec)
 
+    def collision_ResolveContacts(self, ballRef, contacts):
+        """ Resolve a ball's contacts (a list of (depth, normal, row index, CollisionGeom) tuples)
+
+        Resolving one contact moves the ball, which changes (or removes) the others, so the contacts are resolved
+        one at a time, deepest first, each one re-measured from where the ball is by then.  That's repeated (up to
+        contactIterations passes) until a pass doesn't have to move the ball.
+
+        Returns the (row index, CollisionGeom) of the deepest contact the ball landed on top of in the first pass,
+        or (-1, None) if it didn't land
+        """
+        sphere = ballRef.collisionGeom
+        normal = self._manifoldNormal
+
+        # Deepest first (sort is stable, so ties stay in the order they were found)
+        if len(contacts) > 1:
+            contacts.sort(key = _contactDepth, reverse = True)
+
+        landedRow = -1
+        landedGeom = None
+        for iteration in xrange(0, self.contactIterations):
+            moved = False
+            for penDepth, penNorm, rowIndex, geom in contacts:
+                sx = sphere.center[0]
+                sy = sphere.center[1]
+                sr = sphere.r
+                cx = geom.center[0]
+                cy = geom.center[1]
+                rx = geom.r[0]
+                ry = geom.r[1]
+                if not isIntersecting_Sphere_AABB_f(sx, sy, sr, cx, cy, rx, ry):
+                    continue
+                penDepth = minimumPenetrationDepthAndNormal_Sphere_AABB_f(sx, sy, sr, cx, cy, rx, ry, normal)
+                if penDepth <= 0.0:
+                    continue
+
+                if iteration == 0 and landedRow < 0 and normal[0] == 0.0 and normal[1] == -1.0:
+                    landedRow = rowIndex
+                    landedGeom = geom
+                ballRef.setPosition(sx + (penDepth * normal[0]), sy + (penDepth * normal[1]))
+                moved = True
+            if not moved:
+                break
+
+        return landedRow, landedGeom
+
+    def collision_ResolveManifold(self):
+        """ Resolve a contact manifold with more than one contact (see collision_ResolveContacts).  The response is
+        the same as for a single contact:  if the ball lands on top of any of the rows, it stops falling and rests on
+        the deepest such row.
+        """
+        ballRef = self.ball
+        landedRow, landedGeom = self.collision_ResolveContacts(ballRef, self.contacts)
+
+        if landedRow >= 0:
+            # Landed:  cancel gravity, and stop falling (as collision_ProcessCollisions does)
+            Vector2D_sub(ballRef.currPhysState.netForce, ballRef.forceGravity, ballRef.currPhysState.netForce)
+            ballRef.setVelocity(ballRef.currPhysState.velocity[0], 0)
+            self.restingRowIndex = landedRow
+            self.restingGeom = landedGeom
+        else:
+            self.clearResting()
+
     # # Get an array with the time of initial and final contacts for the 2 collision geometries
     # scaledYVel = Vector2D()
     # Vector2D_scale(self.fixedDeltaTimeS, Vector2D(0.0, self.gameObj.rows[i].yVel), scaledYVel)
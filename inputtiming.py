@@ -0,0 +1,139 @@
+""" Timestamped input for Falldown
+
+Pygame (SDL 1.2) events don't say when they happened, and the game used to read them once per rendered frame and
+hand the resulting key state to every fixed-step tick of that frame.  So a key press waited for the next frame, and
+a quick tap (pressed and released between two reads) was lost altogether.
+
+Instead, the application now reads events before every frame (and between ticks), stamps each key change with
+hiresTime() as it reads it, and queues it in an InputQueue.  Each fixed-step tick stands for a slice of wall-clock
+time:  the accumulator loop runs a frame's ticks back to back, but tick k of a frame simulates the time
+previousTimeS - accumulatorS + (k * fixedDeltaTimeS).  A tick applies only the queued changes stamped at or before
+its own time, in order, and at most one change per key -- so each key change lands on the tick its stamp falls in
+(not simply the first tick that happens to run), and a tap always moves the ball for at least one tick.
+
+A LatencyMeter measures input-to-photon latency:  the time from reading a key change to the first frame that shows
+its effect being handed to the display.  (That is a lower bound on the latency the player sees:  it leaves out the
+time the key press waited to be read, and the display's own lag.)
+
+Usage:
+    queue.push(hiresTime(), INPUT_LEFT, True)      # when an event is read
+    stamp = queue.apply(ball.controlState, tickTime)    # before each tick (tickTime = the time it simulates)
+    meter.inputApplied(stamp)
+    ...draw, and pygame.display.update()...
+    meter.framePresented(hiresTime())
+"""
+
+__author__ = 'Mass KonFuzion'
+
+import collections
+import timeit
+
+# hiresTime() returns wall-clock seconds from the best timer on this platform (time.clock on Windows, time.time
+# elsewhere -- on UNIX, time.clock is processor time, which stops while the game waits on the display)
+hiresTime = timeit.default_timer
+
+# Keys
+INPUT_LEFT = 0
+INPUT_RIGHT = 1
+
+
+class InputQueue(object):
+    """ Key changes waiting to be applied, each stamped with the time it was read
+    """
+
+    def __init__(self, size = 64):
+        # (stamp, key, pressed) tuples, oldest first.  If the game stalls long enough to fill the queue, the oldest
+        # changes are dropped
+        self.events = collections.deque(maxlen = size)
+
+    def __len__(self):
+        return len(self.events)
+
+    def push(self, stamp, key, pressed):
+        """ Queue a key change (key is INPUT_LEFT or INPUT_RIGHT; pressed is True for a press, False for a release)
+        """
+        self.events.append((stamp, key, pressed))
+
+    def clear(self):
+        """ Drop every queued key change (e.g. when the game starts over)
+        """
+        self.events.clear()
+
+    def apply(self, controlState, tickTime = None):
+        """ Apply the queued key changes to a BallControlState, in order, for the tick that simulates time tickTime
+
+        Only the changes stamped at or before tickTime are applied (all of them, if tickTime is None); later ones
+        wait for a later tick.  A key changes at most once per tick, so the rest of its changes wait for the following
+        ticks too.  Returns the stamp of the last change applied, or None if there were none
+        """
+        events = self.events
+        stamp = None
+        leftChanged = False
+        rightChanged = False
+        while events:
+            eventStamp, key, pressed = events[0]
+            if tickTime != None and eventStamp > tickTime:
+                break
+            if key == INPUT_LEFT:
+                if leftChanged:
+                    break
+                controlState.leftKeyPressed = pressed
+                leftChanged = True
+            else:
+                if rightChanged:
+                    break
+                controlState.rightKeyPressed = pressed
+                rightChanged = True
+            events.popleft()
+            stamp = eventStamp
+        return stamp
+
+
+class LatencyMeter(object):
+    """ Measures the time from reading a key change to presenting the first frame that shows it
+    """
+
+    def __init__(self):
+        # Stamp of the oldest input applied since the last frame was presented, or None
+        self.pendingStamp = None
+
+        # Latencies (in seconds):  the number measured, their total, the largest, and the last one
+        self.count = 0
+        self.totalS = 0.0
+        self.maxS = 0.0
+        self.lastS = 0.0
+
+    def reset(self):
+        self.pendingStamp = None
+        self.count = 0
+        self.totalS = 0.0
+        self.maxS = 0.0
+        self.lastS = 0.0
+
+    def inputApplied(self, stamp):
+        """ Note that a tick applied input read at stamp (does nothing if stamp is None)
+        """
+        if stamp != None and self.pendingStamp == None:
+            self.pendingStamp = stamp
+
+    def framePresented(self, now):
+        """ Note that a frame was handed to the display at time now (after every tick before it was simulated)
+        """
+        if self.pendingStamp == None:
+            return
+        latency = now - self.pendingStamp
+        self.pendingStamp = None
+        self.count += 1
+        self.totalS += latency
+        self.lastS = latency
+        if latency > self.maxS:
+            self.maxS = latency
+
+    def averageS(self):
+        if self.count == 0:
+            return 0.0
+        return self.totalS / self.count
+
+    def __repr__(self):
+        return "LatencyMeter(%d inputs, last %.1f ms, average %.1f ms, max %.1f ms)" % (
+            self.count, self.lastS * 1000.0, self.averageS() * 1000.0, self.maxS * 1000.0)
@@ -0,0 +1,285 @@
+""" Binary level files for Falldown
+
+A level file holds a fixed sequence of rows (e.g. a hand-made level, or a tournament level everyone plays), in a
+compact binary format:
+
+    header      magic "FDLV", version, blocks per row, row spacing, number of rows   (LEVEL_HEADER, 20 bytes)
+    records     one per row:  gap index, row speed                                    (LEVEL_RECORD, 4 bytes each)
+
+All values are little-endian.  The row speed is a yVel, in pixels/sec (negative = up the screen, as in FalldownRow).
+Row n's record is at a fixed offset, so a LevelFile memory-maps the file and reads row n directly:  opening a level
+with millions of rows takes no parsing, and no memory beyond the map.
+
+A LevelFile is a row source (see levelgen.py), so it can be plugged into GameObject.rowSource.
+
+Command line:
+    python levelfile.py convert SEED NUMROWS FILE       write the level that a seeded LevelGenerator generates
+    python levelfile.py validate FILE [--solve]         check a level file (--solve:  check it can be survived, too)
+    python levelfile.py info FILE                       print a level file's header
+"""
+
+__author__ = 'Mass KonFuzion'
+
+import array
+import mmap
+import struct
+import sys
+import zlib
+
+# magic, version, blocks per row, row spacing, number of rows
+LEVEL_HEADER = struct.Struct("<4sHHdI")
+# gap index, yVel
+LEVEL_RECORD = struct.Struct("<Hh")
+LEVEL_MAGIC = "FDLV"
+LEVEL_VERSION = 1
+
+# The screen size, and number of rows on screen, that falldown.py plays level files with
+GAME_SIZE = (800, 600)
+GAME_ROWS = 6
+
+
+class LevelFile(object):
+    """ A memory-mapped level file (read-only)
+    """
+
+    def __init__(self, filename):
+        """ Open a level file
+
+        Raises ValueError if filename is not a level file (or is truncated)
+        """
+        self.filename = filename
+        self.file = open(filename, "rb")
+        header = self.file.read(LEVEL_HEADER.size)
+        if len(header) < LEVEL_HEADER.size:
+            raise ValueError("%s is not a Falldown level file" % filename)
+        magic, version, self.numBlocks, self.spacing, self.numRows = LEVEL_HEADER.unpack(header)
+        if magic != LEVEL_MAGIC or version != LEVEL_VERSION:
+            raise ValueError("%s is not a Falldown level file" % filename)
+        self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+        if len(self.map) < LEVEL_HEADER.size + (self.numRows * LEVEL_RECORD.size):
+            raise ValueError("%s is truncated" % filename)
+
+        # Index of the next row that nextRow returns
+        self.cursor = 0
+        # CRC-32 of the records (see identity), once it's been computed
+        self.crc = None
+
+    def __len__(self):
+        return self.numRows
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def row(self, n):
+        """ Return row n's (gap index, yVel, spacing)
+        """
+        gap, yVel = LEVEL_RECORD.unpack_from(self.map, LEVEL_HEADER.size + (n * LEVEL_RECORD.size))
+        return gap, float(yVel), self.spacing
+
+    def nextRow(self):
+        """ Return the next row's (gap index, yVel, spacing).  After the last row, the level starts over
+        """
+        if self.cursor >= self.numRows:
+            self.cursor = 0
+        n = self.cursor
+        self.cursor += 1
+        return self.row(n)
+
+    def reset(self):
+        """ Start the level over
+        """
+        self.cursor = 0
+
+    def getState(self):
+        """ Return the level's state:  the index of the next row
+        """
+        return self.cursor
+
+    def setState(self, state):
+        """ Put the level back in a state returned by getState
+        """
+        self.cursor = state
+
+    def identity(self):
+        """ Return the level's identity (see levelgen.py):  its header, and a CRC-32 of its records
+        """
+        if self.crc == None:
+            end = LEVEL_HEADER.size + (self.numRows * LEVEL_RECORD.size)
+            self.crc = zlib.crc32(buffer(self.map, LEVEL_HEADER.size, end - LEVEL_HEADER.size)) & 0xffffffff
+        return ("LevelFile", self.numBlocks, self.spacing, self.numRows, self.crc)
+
+    def records(self, start = 0, count = None):
+        """ Return rows [start, start + count) as an array('h') of interleaved gap indices and yVels
+
+        (For bulk processing; gap indices above 32767 come out negative)
+        """
+        if count == None:
+            count = self.numRows - start
+        offset = LEVEL_HEADER.size + (start * LEVEL_RECORD.size)
+        values = array.array("h")
+        values.fromstring(self.map[offset:offset + (count * LEVEL_RECORD.size)])
+        if sys.byteorder != "little":
+            values.byteswap()
+        return values
+
+
+def writeLevelFile(filename, rows, numBlocks, spacing):
+    """ Write a level file
+
+    rows is an iterable of (gap index, yVel) or (gap index, yVel, spacing) tuples (the spacing is ignored:  a level
+    file has one spacing for every row).  The rows are written as they come, so rows can be a generator of any length.
+    Returns the number of rows written.
+    """
+    f = open(filename, "wb")
+    try:
+        f.write(LEVEL_HEADER.pack(LEVEL_MAGIC, LEVEL_VERSION, numBlocks, spacing, 0))
+        numRows = 0
+        chunk = []
+        for row in rows:
+            chunk.append(LEVEL_RECORD.pack(row[0], int(round(row[1]))))
+            numRows += 1
+            if len(chunk) == 4096:
+                f.write("".join(chunk))
+                del chunk[:]
+        f.write("".join(chunk))
+
+        # Now that we know how many rows there are, fill in the header
+        f.seek(0)
+        f.write(LEVEL_HEADER.pack(LEVEL_MAGIC, LEVEL_VERSION, numBlocks, spacing, numRows))
+    finally:
+        f.close()
+    return numRows
+
+
+def convertSeed(filename, seed, numRows, numBlocks = 10, **generatorOptions):
+    """ Write the first numRows rows that a LevelGenerator with the given seed generates to a level file
+
+    generatorOptions are passed to the LevelGenerator (e.g. curve, minSpeed, maxSpeed, spacing)
+    """
+    from levelgen import LevelGenerator
+
+    gen = LevelGenerator(numBlocks, seed = seed, **generatorOptions)
+    rows = (gen.nextRow() for i in xrange(0, numRows))
+    return writeLevelFile(filename, rows, numBlocks, gen.spacing)
+
+
+def layoutProblems(numBlocks, world):
+    """ Return a list of reasons world (a GameObject whose screen size is set) can't lay out rows of numBlocks blocks
+    (an empty list means it can)
+
+    A row needs a gap and at least one block, and the blocks (the gap included) have to be wider than the ball, or it
+    can't fall through
+    """
+    problems = []
+    if numBlocks < 2:
+        problems.append("blocks per row is %d" % numBlocks)
+    elif world.sizeX / numBlocks <= 2 * world.ball.radius:
+        problems.append("%d blocks per row are too narrow for the ball (%d pixels wide on a %d pixel screen)" % (
+            numBlocks, world.sizeX / numBlocks, world.sizeX))
+    return problems
+
+
+def levelWorld(level):
+    """ Return a GameObject set up to play level (a LevelFile) the way falldown.py plays it
+
+    The level's header has to pass layoutProblems first
+    """
+    import gameobj
+
+    world = gameobj.GameObject()
+    world.setScreenSize(GAME_SIZE[0], GAME_SIZE[1])
+    world.rowSource = level
+    world.initLevel(GAME_SIZE[1], GAME_ROWS, level.numBlocks)
+    return world
+
+
+def validateLevelFile(filename, solver = None):
+    """ Check a level file, and return a list of problems (an empty list means the file is fine)
+
+    Checks the header (including that the game can lay out its rows -- see layoutProblems), the file size, and every
+    record (gap index within the row, rows moving up the screen).  With a
+    solver (a survival.SurvivalSolver for the level's layout), also checks that a perfect player can survive the whole
+    level.  (The solver assumes a constant row speed, so for levels that speed up, use a solver set up for the
+    fastest speed.)
+    """
+    try:
+        level = LevelFile(filename)
+    except (IOError, ValueError), e:
+        return [str(e)]
+
+    import gameobj
+
+    world = gameobj.GameObject()
+    world.setScreenSize(GAME_SIZE[0], GAME_SIZE[1])
+    problems = []
+    try:
+        problems.extend(layoutProblems(level.numBlocks, world))
+        if level.spacing <= 0:
+            problems.append("row spacing is %s" % level.spacing)
+        extra = len(level.map) - (LEVEL_HEADER.size + (level.numRows * LEVEL_RECORD.size))
+        if extra != 0:
+            problems.append("%d bytes of garbage after the last row" % extra)
+        if level.numRows == 0:
+            problems.append("no rows")
+
+        # Check the records a chunk at a time, so huge levels don't need huge amounts of memory
+        chunkRows = 65536
+        for start in xrange(0, level.numRows, chunkRows):
+            values = level.records(start, min(chunkRows, level.numRows - start))
+            gaps = values[0::2]
+            yVels = values[1::2]
+            if min(gaps) < 0 or max(gaps) >= level.numBlocks:
+                for i in xrange(0, len(gaps)):
+                    if gaps[i] < 0 or gaps[i] >= level.numBlocks:
+                        problems.append("row %d:  gap index %d is not in the row" % (start + i, gaps[i] & 0xffff))
+                        break
+            if max(yVels) >= 0:
+                for i in xrange(0, len(yVels)):
+                    if yVels[i] >= 0:
+                        problems.append("row %d:  yVel %d does not move the row up the screen" % (start + i, yVels[i]))
+                        break
+
+        if solver != None and not problems:
+            gaps = array.array("H", level.records()[0::2])
+            report = solver.solve(gaps)
+            if not report.survivable:
+                problems.append("a perfect player can't survive all %d rows" % level.numRows)
+    finally:
+        level.close()
+    return problems
+
+
+def main(args):
+    if len(args) == 4 and args[0] == "convert":
+        numRows = convertSeed(args[3], int(args[1]), int(args[2]))
+        print "Wrote %d rows to %s" % (numRows, args[3])
+    elif len(args) in (2, 3) and args[0] == "validate":
+        problems = validateLevelFile(args[1])
+        if not problems and len(args) == 3 and args[2] == "--solve":
+            import survival
+            level = LevelFile(args[1])
+            # Solve for the level as the game lays it out, at the fastest row speed in the level
+            yVel = 0
+            for start in xrange(0, len(level), 65536):
+                yVel = min(yVel, min(level.records(start, min(65536, len(level) - start))[1::2]))
+            solver = survival.solverForGameObject(levelWorld(level), rowSpeed = -yVel)
+            level.close()
+            problems = validateLevelFile(args[1], solver)
+        for problem in problems:
+            print "%s: %s" % (args[1], problem)
+        if not problems:
+            print "%s: OK" % args[1]
+        return len(problems) != 0
+    elif len(args) == 2 and args[0] == "info":
+        level = LevelFile(args[1])
+        print "%s: %d rows, %d blocks per row, row spacing %s" % (args[1], len(level), level.numBlocks, level.spacing)
+        level.close()
+    else:
+        print __doc__
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
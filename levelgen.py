@@ -0,0 +1,169 @@
+""" Procedural level generator for Falldown
+
+By default, every new row gets a uniformly random gap, and the rows always rise at 200 pixels/sec, so the game
+never gets any harder.  A LevelGenerator produces the rows of a level one at a time instead, following a difficulty
+curve:  as the level goes on, the rows rise faster, and the gaps jump further from one row to the next.
+
+A GameObject uses a row source if it has one (see GameObject.rowSource).  A row source is any object with:
+    nextRow()   returns the next row's (gap index, yVel, spacing).  yVel is the row speed (negative = up the screen,
+                as in FalldownRow), and spacing is the distance from the previous row's top to this row's top
+    reset()     starts the level over
+and, optionally (for snapshot.py):
+    getState()  returns the source's state (an object that later changes to the source don't affect)
+    setState()  puts the source back in a state returned by getState
+and (for checkpoint.py):
+    identity()  returns a value (of marshallable types) that identifies the level, so a checkpoint's state is only
+                resumed on the level it was saved on
+
+Generating a row takes constant time, and allocates nothing but the row's tuple, so rows can be generated in the
+middle of a frame.  Rows can also be generated ahead of time (see pregenerate), e.g. to look ahead at the level.
+
+Usage:
+    world.rowSource = LevelGenerator(world.blocksPerRow, seed = 1234)
+    world.resetLevel(world.sizeY)
+"""
+
+__author__ = 'Mass KonFuzion'
+
+import random
+
+
+def linearCurve(rampRows):
+    """ Return a difficulty curve that ramps from 0 to 1 over the first rampRows rows, then stays at 1
+    """
+    def curve(rowNumber):
+        if rowNumber >= rampRows:
+            return 1.0
+        return rowNumber / float(rampRows)
+    return curve
+
+
+class LevelGenerator(object):
+    """ Generates the rows of a level, following a difficulty curve
+    """
+
+    def __init__(self, numBlocks, seed = None, curve = None, minSpeed = 200.0, maxSpeed = 400.0, spacing = 105.0,
+                 lookahead = 16):
+        """ Set up the generator
+
+        numBlocks is the number of blocks per row.  curve is a function from the row number (0 = the first row of the
+        level) to a difficulty between 0 and 1 (by default, linearCurve(200)).  At difficulty 0, the rows rise at
+        minSpeed (pixels/sec), and each gap is at most one block away from the previous one.  At difficulty 1, they rise
+        at maxSpeed, and the gaps can be anywhere.  lookahead is the number of rows to keep generated ahead of time.
+
+        With a seed, the level is the same every time it is reset (otherwise, it's different each time)
+        """
+        self.numBlocks = numBlocks
+        self.seed = seed
+        self.curve = curve or linearCurve(200)
+        self.minSpeed = minSpeed
+        self.maxSpeed = maxSpeed
+        self.spacing = spacing
+
+        # The generator has its own random number generator, so it doesn't share a stream with anything else
+        self.rng = random.Random(seed)
+
+        # Lookahead buffer:  a ring of generated (but not yet used) rows
+        self.ring = [None] * max(lookahead, 1)
+        self.head = 0
+        self.count = 0
+
+        # Number of rows generated so far, and the gap of the last one
+        self.rowNumber = 0
+        self.lastGap = -1
+
+        self.reset()
+
+    def reset(self):
+        """ Start the level over
+        """
+        self.rng.seed(self.seed)
+        self.head = 0
+        self.count = 0
+        self.rowNumber = 0
+        self.lastGap = -1
+        # Fill the lookahead buffer now (at the start of a level), rather than during play
+        self.pregenerate(len(self.ring))
+
+    def getState(self):
+        """ Return the generator's state (see setState)
+        """
+        return (self.rng.getstate(), tuple(self.ring), self.head, self.count, self.rowNumber, self.lastGap)
+
+    def setState(self, state):
+        """ Put the generator back in a state returned by getState
+        """
+        rngState, ring, self.head, self.count, self.rowNumber, self.lastGap = state
+        self.rng.setstate(rngState)
+        self.ring[:] = ring
+
+    def identity(self):
+        """ Return the level's identity (see the module docstring):  the generator's settings
+
+        (The difficulty curve is a function, so it isn't part of the identity)
+        """
+        return ("LevelGenerator", self.numBlocks, self.seed, self.minSpeed, self.maxSpeed, self.spacing)
+
+    def generateRow(self):
+        """ Generate the next row, and return its (gap index, yVel, spacing)
+        """
+        difficulty = min(max(self.curve(self.rowNumber), 0.0), 1.0)
+        n = self.numBlocks
+
+        if self.lastGap < 0:
+            gap = self.rng.randint(0, n - 1)
+        else:
+            # Jump up to maxJump blocks from the last gap (bouncing off the ends of the row)
+            maxJump = 1 + int(difficulty * (n - 2) + .5)
+            gap = self.lastGap + self.rng.randint(-maxJump, maxJump)
+            if gap < 0:
+                gap = -gap
+            elif gap > n - 1:
+                gap = (2 * (n - 1)) - gap
+            gap = min(max(gap, 0), n - 1)
+
+        speed = self.minSpeed + ((self.maxSpeed - self.minSpeed) * difficulty)
+
+        self.rowNumber += 1
+        self.lastGap = gap
+        return (gap, -speed, self.spacing)
+
+    def pregenerate(self, numRows):
+        """ Generate numRows rows ahead of time (growing the lookahead buffer if necessary)
+        """
+        if self.count + numRows > len(self.ring):
+            # Unroll the ring into a bigger one
+            ring = [None] * (self.count + numRows)
+            for i in xrange(0, self.count):
+                ring[i] = self.ring[(self.head + i) % len(self.ring)]
+            self.ring = ring
+            self.head = 0
+        for i in xrange(0, numRows):
+            self.ring[(self.head + self.count) % len(self.ring)] = self.generateRow()
+            self.count += 1
+
+    def peek(self, i = 0):
+        """ Return the (gap index, yVel, spacing) of the row i rows ahead (0 = the row nextRow will return next)
+        """
+        if i >= self.count:
+            self.pregenerate(i + 1 - self.count)
+        return self.ring[(self.head + i) % len(self.ring)]
+
+    def nextRow(self):
+        """ Return the next row's (gap index, yVel, spacing)
+        """
+        if self.count == 0:
+            self.pregenerate(1)
+        row = self.ring[self.head]
+        self.head = (self.head + 1) % len(self.ring)
+        self.count -= 1
+        # Top the lookahead buffer back up (one row per call, so no frame ever pays for more than one row)
+        self.ring[(self.head + self.count) % len(self.ring)] = self.generateRow()
+        self.count += 1
+        return row
+
+    def __iter__(self):
+        """ Yield the rows of the level, forever
+        """
+        while True:
+            yield self.nextRow()
@@ -0,0 +1,128 @@
+""" Parity checks for Falldown's other engines
+
+EventSim (eventsim.py) and VectorFalldownEnv (falldownenv.py) each reimplement GameObject.step, and each promises to
+play the same game as it.  Whenever GameObject's physics changes, they have to change with it -- so this plays the
+same games (same gaps, same input) with each of them and with GameObject, and fails if any of them disagree:  a ball
+position further off than TOLERANCE pixels at any sampled tick, or a crush on a different tick.
+
+The games are on the default level with 6 rows, and with 14 rows (45 pixels apart, closer than the ball is wide, so
+the ball often touches two rows at once -- see GameObject.collision_ResolveContacts).  The input is the autopilot's,
+with some random presses mixed in.
+
+Usage:
+    python paritycheck.py [SEEDS]        # exits with status 1 if any check fails
+"""
+
+__author__ = 'Mass KonFuzion'
+
+import os
+import random
+import sys
+
+# Largest ball position difference (in pixels) allowed.  EventSim jumps over quiet ticks in closed form (instead of
+# summing them tick by tick), so its positions can differ from GameObject's by rounding error
+TOLERANCE = 1e-6
+
+ROW_COUNTS = (6, 14)
+
+
+def steer(seed, numRows, ticks, dt = .01):
+    """ Play a game with GameObject (on the level from seed), and return the directions it was steered in, one per
+    tick (up to ticks, or until it's crushed)
+    """
+    import gameobj
+    from autopilot import Autopilot
+
+    random.seed(seed)
+    world = gameobj.GameObject()
+    world.initStateMachine()
+    world.setScreenSize(800, 600)
+    world.initLevel(600, numRows, 10)
+    world.stateMachine.setState('PlayingGame')
+
+    pilot = Autopilot(world, dt)
+    rng = random.Random(seed)
+    crushed = world.stateMachine.states['GotCrushed']
+    directions = []
+    for k in xrange(0, ticks):
+        direction = pilot.direction()
+        if rng.random() < .2:
+            direction = rng.choice([-1, 0, 1])
+        directions.append(direction)
+        world.ball.setDirection(direction)
+        world.ball.respondToControllerInput()
+        world.step(dt)
+        if world.stateMachine.currentState == crushed:
+            break
+    return directions
+
+
+def toSchedule(directions, dt = .01):
+    """ Return an EventSim input schedule ((timeS, direction) pairs) for a list of directions, one per tick
+    """
+    schedule = []
+    last = None
+    for k in xrange(0, len(directions)):
+        if directions[k] != last:
+            last = directions[k]
+            schedule.append((k * dt, last))
+    return schedule
+
+
+def checkEventSim(seeds, ticks = 3000):
+    """ Compare EventSim with GameObject, at 100 and 30 ticks/sec.  Returns a list of failure messages
+    """
+    import eventsim
+
+    failures = []
+    for dt in (.01, 1 / 30.0):
+        for numRows in ROW_COUNTS:
+            for seed in seeds:
+                directions = steer(seed, numRows, ticks, dt)
+                durationS = len(directions) * dt
+                error, tickCrush, eventCrush = eventsim.compareWithTickEngine(
+                    seed, toSchedule(directions, dt), durationS, dt, numRows, dt)
+                if error > TOLERANCE or tickCrush != eventCrush:
+                    failures.append("EventSim, %d rows, dt %.4f, seed %d:  error %g px, crushed at %s vs %s" % (
+                        numRows, dt, seed, error, tickCrush, eventCrush))
+    return failures
+
+
+def checkEnv(seeds, ticks = 3000):
+    """ Compare VectorFalldownEnv with GameObject.  Returns a list of failure messages
+    """
+    import falldownenv
+
+    failures = []
+    for numRows in ROW_COUNTS:
+        for seed in seeds:
+            error, objectCrush, envCrush = falldownenv.compareWithGameObject(seed, steer(seed, numRows, ticks),
+                                                                             numRows)
+            if error > TOLERANCE or objectCrush != envCrush:
+                failures.append("VectorFalldownEnv, %d rows, seed %d:  error %g px, crushed at %s vs %s" % (
+                    numRows, seed, error, objectCrush, envCrush))
+    return failures
+
+
+def main(args):
+    if len(args) > 1:
+        print __doc__
+        return 1
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    seeds = range(0, int(args[0]) if len(args) > 0 else 10)
+
+    failures = []
+    for name, check in (("EventSim", checkEventSim), ("VectorFalldownEnv", checkEnv)):
+        found = check(seeds)
+        print "%-20s %s" % (name, "FAILED" if found else "ok")
+        failures.extend(found)
+
+    for failure in failures:
+        print failure
+    if failures:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -2,10 +2,13 @@ __author__ = 'Mass KonFuzion'
 
 from MKFMath.Vector2D import *
 
-class EulerState:
+class EulerState(object):
     """ Euler Integration Physics State
     (see Glenn Fiedler's tutorials at gafferongames.com)
     """
+    # Slotted (no per-instance __dict__), since every ball carries 2 of these
+    __slots__ = ('position', 'velocity', 'acceleration', 'angle', 'angularVelocity', 'mass', 'inverseMass',
+                 'netForce')
 
     def __init__(self, m = 10.0, ang = 0.0):
         # Position
@@ -0,0 +1,135 @@
+""" Offscreen pixel observations for Falldown (requires NumPy)
+
+A PixelRenderer draws games into small grayscale images (84x84 by default) for agents that learn from pixels.  It
+never touches the display:  it draws into an ordinary 8-bit pygame Surface, so it works with no window at all (e.g.
+with SDL_VIDEODRIVER=dummy, and without calling pygame.display.init).
+
+All of the images live in one preallocated Surface, one below the other, and each game is drawn into its own
+subsurface of it.  The observations are a NumPy view of that Surface's pixels (pygame.surfarray.pixels2d), so
+rendering copies nothing and allocates no arrays or Surfaces:
+
+    observations    uint8 array, (numWorlds, height, width):  the images, row-major (y, then x)
+
+Pixel values are shades of gray:  0 for the background, ROW_SHADE for the rows, BALL_SHADE for the ball(s).  The
+observations array is overwritten by every render, so copy anything that has to be kept past the next one.
+
+The pixels view keeps the Surface locked (pygame allows drawing on a locked Surface, but not blitting from it); call
+close() to release it.
+
+Usage:
+    renderer = PixelRenderer(len(worlds))
+    renderer.renderWorlds(worlds)           # GameObjects
+    agent.observe(renderer.observations)
+
+    renderer = PixelRenderer(env.numEnvs)
+    renderer.renderEnv(env)                 # a VectorFalldownEnv (see falldownenv.py)
+"""
+
+__author__ = 'Mass KonFuzion'
+
+import pygame
+
+BACKGROUND_SHADE = 0
+ROW_SHADE = 128
+BALL_SHADE = 255
+
+
+class PixelRenderer(object):
+    """ Draws games into a batch of small grayscale images (see the module docstring)
+    """
+
+    def __init__(self, numWorlds = 1, width = 84, height = 84, sizeX = 800, sizeY = 600):
+        """ Make images of width x height pixels for numWorlds games, each played on a sizeX x sizeY screen
+        """
+        self.numWorlds = numWorlds
+        self.width = width
+        self.height = height
+        # Screen pixels -> image pixels
+        self.scaleX = width / float(sizeX)
+        self.scaleY = height / float(sizeY)
+
+        # One 8-bit Surface for every image (the pixel values are the shades themselves; there is no palette, since
+        # setting one needs the display)
+        self.surface = pygame.Surface((width, height * numWorlds), 0, 8)
+        self.surfaces = [self.surface.subsurface((0, i * height, width, height)) for i in xrange(0, numWorlds)]
+
+        # pixels2d is indexed [x][y]; transposed, the images are stacked row-major.  Setting the shape (instead of
+        # calling reshape) makes sure it stays a view
+        self.pixels = pygame.surfarray.pixels2d(self.surface)
+        self.observations = self.pixels.T.view()
+        self.observations.shape = (numWorlds, height, width)
+
+        # Reused for every rectangle drawn
+        self.rect = pygame.Rect(0, 0, 0, 0)
+
+    def close(self):
+        """ Release the pixels view (which unlocks the Surface).  The observations array can't be used after this
+        """
+        self.observations = None
+        self.pixels = None
+
+    def fillBox(self, surface, left, top, right, bottom, shade):
+        """ Fill a box (given in screen pixels) on an image
+        """
+        rect = self.rect
+        rect.left = int(round(left * self.scaleX))
+        rect.top = int(round(top * self.scaleY))
+        # At least a pixel in each direction, so thin rows don't disappear
+        rect.width = max(int(round(right * self.scaleX)) - rect.left, 1)
+        rect.height = max(int(round(bottom * self.scaleY)) - rect.top, 1)
+        surface.fill(shade, rect)
+
+    def drawBall(self, surface, x, y, radius):
+        """ Draw the ball (given in screen pixels) on an image
+        """
+        pygame.draw.circle(surface, BALL_SHADE, (int(x * self.scaleX), int(y * self.scaleY)),
+                           max(int(round(radius * self.scaleX)), 1))
+
+    def render(self, world, i = 0):
+        """ Draw a GameObject as image i
+        """
+        surface = self.surfaces[i]
+        surface.fill(BACKGROUND_SHADE)
+
+        # The rows' CollisionGeoms cover their blocks, so drawing them draws the rows in a rectangle or two each
+        for row in world.rows:
+            for geom in row.collisionGeoms:
+                if geom != None:
+                    self.fillBox(surface, geom.center[0] - geom.r[0], geom.center[1] - geom.r[1],
+                                 geom.center[0] + geom.r[0], geom.center[1] + geom.r[1], ROW_SHADE)
+
+        for ball in world.balls:
+            position = ball.currPhysState.position
+            self.drawBall(surface, position[0], position[1], ball.radius)
+
+    def renderWorlds(self, worlds):
+        """ Draw a list of GameObjects (one per image), and return the observations
+        """
+        for i in xrange(0, len(worlds)):
+            self.render(worlds[i], i)
+        return self.observations
+
+    def renderEnv(self, env):
+        """ Draw every copy of a VectorFalldownEnv (one per image), and return the observations
+        """
+        # Plain Python numbers are much faster for pygame than NumPy scalars
+        xs = env.x.tolist()
+        ys = env.y.tolist()
+        rowYs = env.rowY.tolist()
+        geomXs = env.geomX.tolist()
+        geomRXs = env.geomRX.tolist()
+        geomValids = env.geomValid.tolist()
+        blockHeight = env.blockHeight
+
+        for i in xrange(0, env.numEnvs):
+            surface = self.surfaces[i]
+            surface.fill(BACKGROUND_SHADE)
+            for r in xrange(0, env.numRows):
+                top = rowYs[i][r]
+                for g in xrange(0, 2):
+                    if geomValids[i][r][g]:
+                        cx = geomXs[i][r][g]
+                        rx = geomRXs[i][r][g]
+                        self.fillBox(surface, cx - rx, top, cx + rx, top + blockHeight, ROW_SHADE)
+            self.drawBall(surface, xs[i], ys[i], env.radius)
+        return self.observations
@@ -7,16 +7,18 @@ __author__ = 'Mass KonFuzion'
 
 import random
 from block import *
-from MKFCollision.primitives import *
-from MKFCollision.intersectiontools import *
+from collision import *
 
-class FalldownRow:
+class FalldownRow(object):
     """ Row class -- holds a row of blocks
     """
-    def __init__(self, yPos, numBlocks = 16, blockWidth = 50.0, blockHeight = 30.0, yVel = -200):
+    __slots__ = ('numBlocks', 'blocks', 'blockWidth', 'blockHeight', 'gap', 'yPos', 'yVel', 'collisionGeoms',
+                 'collidables', 'spatialHash')
+
+    def __init__(self, yPos, numBlocks = 16, blockWidth = 50.0, blockHeight = 30.0, yVel = -200, gapIndex = -1):
         """ Initialize FalldownRow
 
-        By default, the number of blocks per row is 16.
+        By default, the number of blocks per row is 16.  If gapIndex is -1, the gap is placed randomly (see createRow)
         """
         # Number of blocks in this row
         self.numBlocks = numBlocks
@@ -44,9 +46,14 @@ class FalldownRow:
         # 1 or 2 collisionGeoms.
         self.collisionGeoms = [None, None]
 
+        # Collidables (pickups, hazards, ...) riding along with this row, and the SpatialHash they're in (see
+        # spatialhash.py).  None until the row gets one, so plain rows cost nothing extra
+        self.collidables = None
+        self.spatialHash = None
+
 
         # Create a row
-        self.createRow(self.yPos)
+        self.createRow(self.yPos, gapIndex)
 
     def __str__(self):
         """ Return a string representation of the row
@@ -90,7 +97,9 @@ class FalldownRow:
             # block position, which is actually the first block when gap == 0)
             cgPos = self.blocks[1].position #Vector2D reference/pointer
 
-            self.collisionGeoms[0] = CCollisionAABB2D(int(cgPos[0] + (width * .5)), int(cgPos[1] + (height *.5)), int(width *.5), int(height * .5))
+            self.collisionGeoms[0] = CollisionGeomAABB(int(width *.5), int(height * .5))
+
+            self.collisionGeoms[0].setPosition(int(cgPos[0] + (width * .5)), cgPos[1] + (height *.5))
 
             # For good measure, make sure the 2nd collisionGeom is None
             # TODO:  Verify whether or not this is necessary -- we only need to
@@ -105,7 +114,9 @@ class FalldownRow:
             # block position)
             cgPos = self.blocks[0].position
 
-            self.collisionGeoms[0] = CCollisionAABB2D(int(cgPos[0] + (width * .5)), int(cgPos[1] + (height * .5)), int(width * .5), int(height * .5))
+            self.collisionGeoms[0] = CollisionGeomAABB(int(width * .5), int(height * .5))
+
+            self.collisionGeoms[0].setPosition(int(cgPos[0] + (width * .5)), cgPos[1] + (height * .5))
             self.collisionGeoms[1] = None
 
         else: # self.gap > 0 and self.gap < self.numBlocks - 1
@@ -115,7 +126,9 @@ class FalldownRow:
             width = self.blockWidth * self.gap
             cgPos = self.blocks[0].position
 
-            self.collisionGeoms[0] = CCollisionAABB2D(int(cgPos[0] + (width * .5)), int(cgPos[1] + (height * .5)), int(width * .5), int(height * .5))
+            self.collisionGeoms[0] = CollisionGeomAABB(int(width * .5), int(height * .5))
+
+            self.collisionGeoms[0].setPosition(int(cgPos[0] + (width * .5)), cgPos[1] + (height * .5))
 
             # Do the second collision geom
             # Width = blockWidth * (numBlocks - gap + 1)
@@ -123,7 +136,9 @@ class FalldownRow:
             width = self.blockWidth * (self.numBlocks - self.gap + 1)
             cgPos = self.blocks[self.gap + 1].position
 
-            self.collisionGeoms[1] = CCollisionAABB2D(int(cgPos[0] + (width * .5)), int(cgPos[1] + (height * .5)), int(width * .5), int(height * .5))
+            self.collisionGeoms[1] = CollisionGeomAABB(int(width * .5), int(height * .5))
+
+            self.collisionGeoms[1].setPosition(int(cgPos[0] + (width * .5)), cgPos[1] + (height * .5))
 
 
     def createRow(self, yPos, gapIndex = -1):
@@ -224,26 +239,38 @@ class FalldownRow:
         """
 
         # Calculate the new yPos for this row
-        self.yPos = self.yPos + int(self.yVel * deltaT)
+        # NOTE:  yPos is kept to a fraction of a pixel.  (Truncating each step to whole pixels would make the rows'
+        # speed depend on the tick rate, e.g. -150 px/sec at 60 ticks/sec would move 2 px/tick instead of 2.5.)  The
+        # blocks are drawn at whole pixels (see FalldownBlock.draw)
+        self.setYPos(self.yPos + (self.yVel * deltaT))
 
-        # Update this row's collision geometry
-        for j in xrange(0, len(self.collisionGeoms)):
-            if self.collisionGeoms[j] != None:
-                # Assign a reference to the CollisionGeom's center
-                posRef = self.collisionGeoms[j].getCenter()
-                self.collisionGeoms[j].setCenter(posRef[0], self.yPos + (self.blockHeight * .5))
+    def setYPos(self, yPos):
+        """ Put the row (its blocks and collision geometry) at the given y position
+        """
+        self.yPos = yPos
+
+        # Update this row's collision geometry (only the y coordinate of the CollisionGeoms' centers changes)
+        geomY = yPos + (self.blockHeight * .5)
+        for geom in self.collisionGeoms:
+            if geom != None:
+                geom.center[1] = geomY
 
 
         # Step through the blocks in this row
-        for i in xrange(0, self.numBlocks):
-            blk = self.blocks[i]
+        for blk in self.blocks:
             # If the block exists, then move it (if not, ignore it)
             if blk != None:
                 # Update the Y position of each block in the row
                 # NOTE:  Technically speaking, we should calculate new x and y positions, but because Falldown only cares
                 # about the vertical movement of rows, we only calculate y
                 # NOTE ^ 2:  Hmmm, maybe we could add side-to-side movement of rows as a feature of the game?
-                blk.setPosition(blk.position[0], self.yPos)
+                blk.position[1] = yPos
+
+        # Carry this row's Collidables along (the SpatialHash only re-files them when they cross into other cells)
+        if self.collidables:
+            for obj in self.collidables:
+                obj.geom.center[1] = yPos + obj.offsetY
+                self.spatialHash.move(obj)
 
     def setBlockWidth(self, sizeX):
         """ Compute the block width, given a width
@@ -0,0 +1,275 @@
+""" World snapshots for Falldown
+
+A WorldSnapshot saves the state of a GameObject -- the ball, the rows, the resting contact, the state machine, the
+fixed-point physics (if it's on), the random number generator, the row source, and the Collidables riding on the rows
+(with the number of pickups collected; see spatialhash.py) -- and can put the GameObject back
+in that state later.  This is for anything that needs to branch from a game state over and over (e.g. an AI looking
+ahead, a rollback, or a debugging tool), where copy.deepcopy of the whole GameObject would be far too slow.
+
+The numbers are packed into a preallocated buffer with one precompiled struct, so taking a snapshot allocates almost
+nothing.  Restoring reuses the GameObject's rows wherever their gap hasn't changed, so a restore that doesn't cross
+a row shift allocates nothing either.  (Collidables are the exception:  there can be any number of them, so they're
+saved as a tuple, and re-created on restore -- only if there are any.)
+
+A SnapshotRing keeps the most recent snapshots, e.g. one per tick.
+
+In multi-ball mode (see GameObject.setBallCount), a snapshot also saves the other balls in play; a snapshot is for a
+given number of rows and balls.
+
+Usage:
+    snap = world.snapshot()
+    ...                             # play on
+    world.restore(snap)             # and back again
+"""
+
+__author__ = 'Mass KonFuzion'
+
+import random
+import struct
+
+# Ball state:  current and previous physics state (position, velocity, acceleration, netForce, angle, angular
+# velocity)
+BALL_FORMAT = "20d"
+# Direction, left/right key pressed, balls remaining, resting row index, resting CollisionGeom index (in the resting
+# row's collisionGeoms), state machine state
+WORLD_FORMAT = "7q"
+# Per row:  yPos, yVel, gap
+ROW_FORMAT = "ddq"
+# Fixed-point physics:  on/off, x, y, vx, vy, ay (then, per row:  rowY, rowCarry)
+FIXED_FORMAT = "6q"
+FIXED_ROW_FORMAT = "qq"
+# Then, in multi-ball mode, BALL_FORMAT for each of the other balls (at the end, so a single-ball snapshot's layout
+# doesn't depend on it)
+
+# (numRows, numBalls) -> struct.Struct for a world with that many rows and balls
+_layouts = {}
+
+
+def snapshotLayout(numRows, numBalls = 1):
+    """ Return the struct.Struct that a snapshot of a world with numRows rows (and numBalls balls) is packed with
+    """
+    layout = _layouts.get((numRows, numBalls))
+    if layout == None:
+        layout = struct.Struct("<" + BALL_FORMAT + WORLD_FORMAT + (ROW_FORMAT * numRows) + FIXED_FORMAT +
+                               (FIXED_ROW_FORMAT * numRows) + (BALL_FORMAT * (numBalls - 1)))
+        _layouts[(numRows, numBalls)] = layout
+    return layout
+
+
+def _physStateValues(physState):
+    """ Return an EulerState's values, in snapshot order
+    """
+    return (physState.position[0], physState.position[1], physState.velocity[0], physState.velocity[1],
+            physState.acceleration[0], physState.acceleration[1], physState.netForce[0], physState.netForce[1],
+            physState.angle, physState.angularVelocity)
+
+
+def _setPhysState(physState, values, i):
+    """ Set an EulerState from values[i:i + 10] (in snapshot order)
+    """
+    physState.position[0] = values[i]
+    physState.position[1] = values[i + 1]
+    physState.velocity[0] = values[i + 2]
+    physState.velocity[1] = values[i + 3]
+    physState.acceleration[0] = values[i + 4]
+    physState.acceleration[1] = values[i + 5]
+    physState.netForce[0] = values[i + 6]
+    physState.netForce[1] = values[i + 7]
+    physState.angle = values[i + 8]
+    physState.angularVelocity = values[i + 9]
+
+
+class WorldSnapshot(object):
+    """ The saved state of a GameObject
+    """
+    __slots__ = ('numRows', 'numBalls', 'layout', 'buffer', 'randomState', 'rowSourceState', 'collidableState')
+
+    def __init__(self, numRows, numBalls = 1):
+        """ Make an (empty) snapshot for worlds with numRows rows (and numBalls balls in play)
+        """
+        self.numRows = numRows
+        self.numBalls = numBalls
+        self.layout = snapshotLayout(numRows, numBalls)
+        self.buffer = bytearray(self.layout.size)
+        # The random module's state (new rows get their gaps from it, if there is no row source)
+        self.randomState = None
+        # The row source's state (see levelgen.py), or None
+        self.rowSourceState = None
+        # The Collidables and pickups collected (see GameObject.collidableState), or None
+        self.collidableState = None
+
+    def capture(self, world):
+        """ Save world's state in this snapshot
+        """
+        if world.numRows != self.numRows:
+            raise ValueError("snapshot is for %d rows, not %d" % (self.numRows, world.numRows))
+        if len(world.balls) != self.numBalls:
+            raise ValueError("snapshot is for %d balls, not %d" % (self.numBalls, len(world.balls)))
+
+        ball = world.ball
+        rows = world.rows
+
+        # The resting CollisionGeom is saved as its index in the resting row
+        restingSlot = -1
+        if world.restingRowIndex >= 0:
+            geoms = rows[world.restingRowIndex].collisionGeoms
+            restingSlot = 0 if geoms[0] is world.restingGeom else 1
+
+        values = _physStateValues(ball.currPhysState) + _physStateValues(ball.prevPhysState) + \
+                 (ball.direction, ball.controlState.leftKeyPressed, ball.controlState.rightKeyPressed,
+                  ball.ballsRemaining, world.restingRowIndex, restingSlot, world.stateMachine.currentState)
+        for row in rows:
+            values += (row.yPos, row.yVel, row.gap)
+
+        fp = world.fixedPhysics
+        if fp != None:
+            values += (1, fp.x, fp.y, fp.vx, fp.vy, fp.ay)
+            for i in xrange(0, self.numRows):
+                values += (fp.rowY[i], fp.rowCarry[i])
+        else:
+            values += (0, 0, 0, 0, 0, 0) + ((0, 0) * self.numRows)
+
+        for i in xrange(1, self.numBalls):
+            other = world.balls[i]
+            values += _physStateValues(other.currPhysState) + _physStateValues(other.prevPhysState)
+
+        self.layout.pack_into(self.buffer, 0, *values)
+
+        # Without a row source, new rows get their gaps from the random module.  Its state is an immutable tuple, so
+        # keeping a reference to it is enough
+        if world.rowSource == None:
+            self.randomState = random.getstate()
+        else:
+            self.randomState = None
+        if world.rowSource != None and hasattr(world.rowSource, 'getState'):
+            self.rowSourceState = world.rowSource.getState()
+        else:
+            self.rowSourceState = None
+        self.collidableState = world.collidableState()
+
+    def restore(self, world):
+        """ Put world back in the state saved in this snapshot
+
+        Raises ValueError (before changing anything) if world can't hold it:  a different number of rows, or more balls
+        than world plays with.  (Fewer balls in play than when it was saved is fine -- they're put back in play)
+        """
+        if world.numRows != self.numRows:
+            raise ValueError("snapshot is for %d rows, not %d" % (self.numRows, world.numRows))
+        if self.numBalls > world.ballCount:
+            raise ValueError("snapshot is for %d balls, but the world plays with %d" % (self.numBalls, world.ballCount))
+
+        values = self.layout.unpack_from(self.buffer)
+        ball = world.ball
+
+        _setPhysState(ball.currPhysState, values, 0)
+        _setPhysState(ball.prevPhysState, values, 10)
+        ball.updateCollisionGeom()
+        ball.direction = values[20]
+        ball.controlState.leftKeyPressed = bool(values[21])
+        ball.controlState.rightKeyPressed = bool(values[22])
+        ball.ballsRemaining = values[23]
+        world.stateMachine.currentState = values[26]
+
+        # Rows:  move the rows that have the right gap; re-create the ones that don't
+        fp = world.fixedPhysics
+        i = 27
+        for r in xrange(0, self.numRows):
+            yPos, yVel, gap = values[i:i + 3]
+            row = world.rows[r]
+            if row.gap == gap:
+                row.yVel = yVel
+                row.setYPos(yPos)
+            else:
+                world.resetRow(r, yPos, gap, yVel)
+                if fp != None:
+                    fp.rowGeoms[r] = fp.captureGeoms(world.rows[r])
+            i += 3
+
+        world.restingRowIndex = values[24]
+        if world.restingRowIndex >= 0:
+            world.restingGeom = world.rows[world.restingRowIndex].collisionGeoms[values[25]]
+        else:
+            world.restingGeom = None
+
+        if fp != None:
+            if values[i]:
+                fp.x, fp.y, fp.vx, fp.vy, fp.ay = values[i + 1:i + 6]
+                i += 6
+                for r in xrange(0, self.numRows):
+                    fp.rowY[r] = values[i]
+                    fp.rowCarry[r] = values[i + 1]
+                    i += 2
+            else:
+                # Saved with the float physics:  start the fixed-point physics over from the float state
+                fp.capture()
+
+        # The other balls (multi-ball mode)
+        world.setBallsInPlay(self.numBalls)
+        i = 27 + (3 * self.numRows) + 6 + (2 * self.numRows)
+        for b in xrange(1, self.numBalls):
+            other = world.balls[b]
+            _setPhysState(other.currPhysState, values, i)
+            _setPhysState(other.prevPhysState, values, i + 10)
+            other.updateCollisionGeom()
+            i += 20
+
+        # (After the rows, so the Collidables ride with the restored rows -- not whatever rows were there before)
+        world.setCollidableState(self.collidableState)
+
+        if self.randomState != None:
+            random.setstate(self.randomState)
+        if self.rowSourceState != None:
+            world.rowSource.setState(self.rowSourceState)
+
+
+class SnapshotRing(object):
+    """ The most recent snapshots of a world (a fixed number of them, preallocated)
+    """
+
+    def __init__(self, numRows, size = 64, numBalls = 1):
+        """ Make a ring of size snapshots, for worlds with numRows rows (and numBalls balls)
+        """
+        self.snapshots = [WorldSnapshot(numRows, numBalls) for i in xrange(0, size)]
+        # A tag for each snapshot (e.g. the tick number it was taken at)
+        self.tags = [None] * size
+        # Index of the next snapshot to overwrite, and the number of snapshots taken (up to size)
+        self.head = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def push(self, world, tag = None):
+        """ Take a snapshot of world (overwriting the oldest one, if the ring is full), and return it
+        """
+        snap = self.snapshots[self.head]
+        snap.capture(world)
+        self.tags[self.head] = tag
+        self.head = (self.head + 1) % len(self.snapshots)
+        self.count = min(self.count + 1, len(self.snapshots))
+        return snap
+
+    def get(self, age = 0):
+        """ Return the snapshot taken age pushes ago (0 = the most recent one)
+
+        Raises IndexError if the ring doesn't go back that far
+        """
+        if age < 0 or age >= self.count:
+            raise IndexError("no snapshot %d pushes ago" % age)
+        return self.snapshots[(self.head - 1 - age) % len(self.snapshots)]
+
+    def find(self, tag):
+        """ Return the most recent snapshot with the given tag, or None
+        """
+        for age in xrange(0, self.count):
+            i = (self.head - 1 - age) % len(self.snapshots)
+            if self.tags[i] == tag:
+                return self.snapshots[i]
+        return None
+
+    def discardNewerThan(self, age):
+        """ Forget the snapshots taken less than age pushes ago (e.g. after rolling back to an older one)
+        """
+        age = min(age, self.count)
+        self.head = (self.head - age) % len(self.snapshots)
+        self.count -= age
@@ -0,0 +1,172 @@
+""" Spatial hash for Falldown's collidables (pickups, hazards, ...)
+
+The rows are tested against the ball directly (there are only a handful of them).  Anything else the ball can touch
+is a Collidable:  a box that rides along with a row (e.g. a pickup sitting on top of it, or a hazard hanging below
+it).  There can be hundreds of those, so instead of testing the ball against each one, they're kept in a
+SpatialHash:  a uniform grid of square cells (cellSize pixels on a side), with each Collidable listed in every cell
+its box overlaps.  "What could the ball touch?" is then a lookup of the few cells around the ball -- O(1), however
+many Collidables there are.
+
+The grid is kept up to date incrementally:  when a row moves (FalldownRow.setYPos), its Collidables move with it, and
+a Collidable is only moved to other cells when it actually crosses into them (every cellSize / rowSpeed seconds or
+so).  Rows without Collidables don't pay anything for them.
+
+Each Collidable has a kind (e.g. COLLIDABLE_PICKUP); what happens when the ball touches one is up to the handler
+registered for its kind (see GameObject.collidableHandlers).  Adding a kind doesn't add anything to the cost of a tick.
+
+Usage:
+    world.addCollidable(rowIndex, COLLIDABLE_PICKUP, x, 10, 10)     # a 20 x 20 pickup on top of a row
+    hits = world.spatialHash.querySphere(x, y, r, [])
+"""
+
+__author__ = 'Mass KonFuzion'
+
+import pygame
+
+from collision import CollisionGeomAABB
+
+# Kinds of Collidables
+COLLIDABLE_PICKUP = 'pickup'
+COLLIDABLE_HAZARD = 'hazard'
+
+# Kind -> color to draw it in
+COLLIDABLE_COLORS = {COLLIDABLE_PICKUP: (0, 204, 0), COLLIDABLE_HAZARD: (204, 0, 0)}
+
+# Cell key = cell x + (cell y * _KEY_STRIDE) (cell coordinates stay well within +/- _KEY_STRIDE / 2 on any screen)
+_KEY_STRIDE = 1 << 20
+
+
+class Collidable(object):
+    """ A box the ball can touch, riding along with a row
+    """
+    __slots__ = ('kind', 'geom', 'offsetY', 'row', 'cells', 'queryMark')
+
+    def __init__(self, kind, x, halfWidth, halfHeight, offsetY):
+        """ Make a Collidable of the given kind, centered at x, and offsetY below the top of its row
+        """
+        self.kind = kind
+        self.geom = CollisionGeomAABB(halfWidth, halfHeight)
+        self.geom.center[0] = float(x)
+        self.offsetY = float(offsetY)
+        # The FalldownRow it rides with
+        self.row = None
+        # The range of cells it's listed in:  (x0, y0, x1, y1), inclusive -- or None, if it's not in a SpatialHash
+        self.cells = None
+        # The last SpatialHash query that found it (so a query returns it only once)
+        self.queryMark = 0
+
+    def draw(self, screen):
+        """ Draw the Collidable
+        """
+        geom = self.geom
+        pygame.draw.rect(screen, COLLIDABLE_COLORS.get(self.kind, (200, 200, 200)),
+                         (int(geom.center[0] - geom.r[0]), int(geom.center[1] - geom.r[1]),
+                          int(geom.r[0] * 2), int(geom.r[1] * 2)))
+
+
+class SpatialHash(object):
+    """ A uniform grid of Collidables (see the module docstring)
+    """
+
+    def __init__(self, cellSize = 64.0):
+        """ Make an empty grid with cells cellSize pixels on a side
+
+        (The ball should fit in a cell, so it never overlaps more than 4 of them)
+        """
+        self.cellSize = float(cellSize)
+        self.inverseCellSize = 1.0 / self.cellSize
+        # Cell key -> list of the Collidables in that cell (cells with nothing in them aren't kept)
+        self.cells = {}
+        # Number of Collidables in the grid
+        self.count = 0
+        self.queryMark = 0
+
+    def __len__(self):
+        return self.count
+
+    def cellRange(self, geom):
+        """ Return the (x0, y0, x1, y1) range of cells (inclusive) that an AABB overlaps
+        """
+        s = self.inverseCellSize
+        cx = geom.center[0]
+        cy = geom.center[1]
+        rx = geom.r[0]
+        ry = geom.r[1]
+        return (int((cx - rx) * s // 1), int((cy - ry) * s // 1), int((cx + rx) * s // 1), int((cy + ry) * s // 1))
+
+    def addToCells(self, obj, cells):
+        x0, y0, x1, y1 = cells
+        for cy in xrange(y0, y1 + 1):
+            for cx in xrange(x0, x1 + 1):
+                key = cx + (cy * _KEY_STRIDE)
+                bucket = self.cells.get(key)
+                if bucket == None:
+                    self.cells[key] = [obj]
+                else:
+                    bucket.append(obj)
+
+    def removeFromCells(self, obj, cells):
+        x0, y0, x1, y1 = cells
+        for cy in xrange(y0, y1 + 1):
+            for cx in xrange(x0, x1 + 1):
+                key = cx + (cy * _KEY_STRIDE)
+                bucket = self.cells[key]
+                bucket.remove(obj)
+                if not bucket:
+                    del self.cells[key]
+
+    def insert(self, obj):
+        """ Add a Collidable to the grid (where its geom is now)
+        """
+        obj.cells = self.cellRange(obj.geom)
+        self.addToCells(obj, obj.cells)
+        self.count += 1
+
+    def remove(self, obj):
+        """ Take a Collidable out of the grid
+        """
+        self.removeFromCells(obj, obj.cells)
+        obj.cells = None
+        self.count -= 1
+
+    def move(self, obj):
+        """ Update the grid after a Collidable's geom has moved (does nothing unless it crossed into other cells)
+        """
+        cells = self.cellRange(obj.geom)
+        if cells != obj.cells:
+            self.removeFromCells(obj, obj.cells)
+            self.addToCells(obj, cells)
+            obj.cells = cells
+
+    def clear(self):
+        """ Take every Collidable out of the grid
+        """
+        for bucket in self.cells.itervalues():
+            for obj in bucket:
+                obj.cells = None
+        self.cells.clear()
+        self.count = 0
+
+    def query(self, left, top, right, bottom, out):
+        """ Append the Collidables in the cells that a box overlaps to out (each one once), and return out
+
+        These are the Collidables that could touch the box; the caller tests them exactly
+        """
+        self.queryMark += 1
+        mark = self.queryMark
+        s = self.inverseCellSize
+        cells = self.cells
+        for cy in xrange(int(top * s // 1), int(bottom * s // 1) + 1):
+            for cx in xrange(int(left * s // 1), int(right * s // 1) + 1):
+                bucket = cells.get(cx + (cy * _KEY_STRIDE))
+                if bucket != None:
+                    for obj in bucket:
+                        if obj.queryMark != mark:
+                            obj.queryMark = mark
+                            out.append(obj)
+        return out
+
+    def querySphere(self, x, y, r, out):
+        """ Append the Collidables that could touch a sphere (e.g. the ball) to out, and return out
+        """
+        return self.query(x - r, y - r, x + r, y + r, out)
@@ -0,0 +1,273 @@
+""" Survivability solver for Falldown gap sequences
+
+Given the gaps of a sequence of rows (e.g. the gap indices chosen by FalldownRow.createRow), SurvivalSolver decides
+whether a perfect player can get the ball through every row without being crushed, and how much room to spare
+the player has along the way.  This lets a level generator reject unwinnable levels, and gives a difficulty score
+for a level.
+
+The model
+---------
+The rows rise at a constant speed, so the only resource the player has is height:  a ball that lands on a row with
+its center at y = h has h / rowSpeed seconds to reach the row's gap before it gets crushed at the top of the screen.
+
+When the ball lands on row k, every x position in some interval [lo, hi] is reachable (it can steer while falling).
+The player then rolls to a drop position x in the gap (taking dist([lo, hi], x) / maxSpeed seconds), and drops.
+While the ball passes through the row, it has to stay inside the gap; after that, it can steer freely until it
+lands on row k + 1, a fixed fall time later (and a fixed distance lower, relative to the rows).  So the state when
+landing on row k is (k, [lo, hi], h), and
+
+    need(k, I) = min over drop positions x of
+                     rowSpeed * dist(I, x) / maxSpeed  +  max(0, need(k + 1, landing(x)) - fallGain)
+
+is the lowest landing height from which rows k, k + 1, ... can all be survived (fallGain is the height gained by
+falling to the next row).  Heights are capped by the floor:  need() values above it mean "impossible."
+
+Drop positions are sampled every `quantum` pixels and the landing intervals are shrunk to multiples of `quantum`,
+so the solver errs on the side of calling a level harder than it really is.  It also ignores a few things that could
+only help a perfect player:  falling straight through more than one row, and steering while waiting on the floor.
+
+need(k, I) only depends on row k and the rows after it, so it is computed back to front, memoized on
+(row index, quantized interval).  The drop positions and landing intervals of a gap don't depend on the sequence at
+all, so they are computed once per gap index.  Solving a sequence takes time linear in its length.
+
+Usage:
+    solver = solverForGameObject(world)          # world is an initialized GameObject
+    report = solver.solve([3, 7, 0, 9, 2, 5])
+    print report.survivable, report.difficulty
+"""
+
+__author__ = 'Mass KonFuzion'
+
+import math
+
+# need() value for "cannot be survived"
+IMPOSSIBLE = float('inf')
+
+
+class SurvivalReport(object):
+    """ The result of solving a gap sequence
+    """
+    __slots__ = ('survivable', 'rows', 'drops', 'minSlack', 'difficulty')
+
+    def __init__(self):
+        # True if a perfect player can survive every row of the sequence
+        self.survivable = True
+        # One (lo, hi, height, slack) tuple per row, following the perfect player:  the interval of x positions
+        # reachable when the ball lands on the row, the height (ball center y) it lands at, and how much lower it
+        # could have landed and still survived (negative = doomed).  Rows after a doomed one are not listed
+        self.rows = []
+        # The perfect player's drop position (ball x) on each row it survives
+        self.drops = []
+        # The smallest slack over all rows
+        self.minSlack = IMPOSSIBLE
+        # The most height (as a fraction of the playing field) that the perfect player needs on landing on any row:
+        # 0 = trivial, 1 = only survivable from the floor, inf = impossible
+        self.difficulty = 0.0
+
+    def __repr__(self):
+        return "SurvivalReport(survivable=%s, minSlack=%.1f, difficulty=%.3f, %d rows)" % (
+            self.survivable, self.minSlack, self.difficulty, len(self.rows))
+
+
+class SurvivalSolver(object):
+    """ Decides whether gap sequences can be survived (see the module docstring for the model)
+    """
+
+    def __init__(self, sizeX, sizeY, numBlocks, blockWidth, blockHeight, rowSpacing, rowSpeed, gravity, radius,
+                 maxSpeed, quantum = 5.0):
+        """ Set up the solver for a level layout
+
+        rowSpacing is the vertical distance between rows, rowSpeed is the speed at which they rise (a positive number,
+        in pixels/sec), and gravity is the ball's acceleration (pixels/sec^2).  quantum is the resolution (in pixels)
+        at which drop positions and landing intervals are considered.
+        """
+        self.sizeX = sizeX
+        self.sizeY = sizeY
+        self.numBlocks = numBlocks
+        self.blockWidth = blockWidth
+        self.blockHeight = blockHeight
+        self.rowSpacing = rowSpacing
+        self.rowSpeed = rowSpeed
+        self.gravity = gravity
+        self.radius = radius
+        self.maxSpeed = maxSpeed
+        self.quantum = quantum
+
+        # Highest possible landing height (ball resting on the floor)
+        self.floorY = sizeY - radius
+
+        # Falling from one row to the next:  the ball starts at rest, and the rows come up to meet it.  It has passed
+        # through the row it dropped from once it has fallen the height of the row plus the ball's diameter
+        self.clearTime = self.fallTime(blockHeight + (2 * radius))
+        self.landTime = self.fallTime(rowSpacing)
+        self.fallGain = rowSpacing - (rowSpeed * self.landTime)
+
+        # Per-gap tables of (drop x, quantized landing interval on the next row)
+        self.dropTables = [self.makeDropTable(g) for g in xrange(0, numBlocks)]
+
+    def fallTime(self, distance):
+        """ Return the time it takes a ball dropped from rest to fall the given distance, relative to the rising rows
+        """
+        # .5 * g * t^2 + rowSpeed * t = distance
+        g = self.gravity
+        v = self.rowSpeed
+        return (-v + math.sqrt((v * v) + (2 * g * distance))) / g
+
+    def quantize(self, lo, hi):
+        """ Shrink [lo, hi] to multiples of quantum, and return it as a pair of integers (in quantum units)
+        """
+        qlo = int(math.ceil(lo / self.quantum - 1e-9))
+        qhi = int(math.floor(hi / self.quantum + 1e-9))
+        if qhi < qlo:
+            # Narrower than one quantum; keep the point nearest its middle
+            qlo = qhi = int(round((lo + hi) * .5 / self.quantum))
+        return qlo, qhi
+
+    def dropRange(self, gap):
+        """ Return the range of ball x positions from which the ball drops cleanly through the given gap
+        """
+        return (gap * self.blockWidth) + self.radius, ((gap + 1) * self.blockWidth) - self.radius
+
+    def makeDropTable(self, gap):
+        """ Return a list of (drop x, qlo, qhi) for the gap:  the drop positions, and the (quantized) interval of x
+        positions that can be reached when landing on the next row after dropping from each of them
+        """
+        dropLo, dropHi = self.dropRange(gap)
+        steer = self.maxSpeed * self.clearTime
+        spread = self.maxSpeed * (self.landTime - self.clearTime)
+        minX = self.radius
+        maxX = self.sizeX - self.radius
+
+        table = []
+        count = max(int((dropHi - dropLo) / self.quantum), 0)
+        for i in xrange(0, count + 1):
+            if count > 0:
+                x = dropLo + ((dropHi - dropLo) * i / count)
+            else:
+                x = (dropLo + dropHi) * .5
+            # While passing through the row, the ball can only steer within the gap
+            lo = max(x - steer, dropLo) - spread
+            hi = min(x + steer, dropHi) + spread
+            qlo, qhi = self.quantize(max(lo, minX), min(hi, maxX))
+            table.append((x, qlo, qhi))
+        return table
+
+    def startInterval(self, x, y, firstRowY):
+        """ Return (lo, hi, height):  the landing interval and height on the first row (whose top is at firstRowY),
+        for a ball falling from rest at (x, y)
+        """
+        t = self.fallTime(firstRowY - self.radius - y)
+        spread = self.maxSpeed * t
+        height = firstRowY - self.radius - (self.rowSpeed * t)
+        return max(x - spread, self.radius), min(x + spread, self.sizeX - self.radius), height
+
+    # ---------------------------------------------------------------------------------------------------------------
+    # The DP
+    # ---------------------------------------------------------------------------------------------------------------
+
+    def dropCosts(self, gaps):
+        """ Return, for each row k of the sequence, the list of max(0, need(k + 1, landing(x)) - fallGain) over the
+        drop positions x of row k's gap (IMPOSSIBLE where need exceeds the floor)
+
+        This is the backward pass of the DP.  need(len(gaps), I) = 0:  whatever comes after the sequence is not
+        considered.
+        """
+        costs = [None] * len(gaps)
+        nextMemo = None
+        for k in xrange(len(gaps) - 1, -1, -1):
+            table = self.dropTables[gaps[k]]
+            rowCosts = []
+            memo = {}
+            for x, qlo, qhi in table:
+                if nextMemo == None:
+                    rowCosts.append(0.0)
+                    continue
+                need = nextMemo.get((qlo, qhi))
+                if need == None:
+                    need = self.bestDrop(gaps[k + 1], costs[k + 1], qlo * self.quantum, qhi * self.quantum)[0]
+                    nextMemo[(qlo, qhi)] = need
+                if need > self.floorY:
+                    rowCosts.append(IMPOSSIBLE)
+                else:
+                    rowCosts.append(max(0.0, need - self.fallGain))
+            costs[k] = rowCosts
+            nextMemo = memo
+        return costs
+
+    def bestDrop(self, gap, rowCosts, lo, hi):
+        """ Return (need(k, [lo, hi]), i) for row k (with the given gap), given its drop costs (see dropCosts), where
+        i is the index of the best drop position in the gap's drop table
+        """
+        best = IMPOSSIBLE
+        bestI = -1
+        scale = self.rowSpeed / self.maxSpeed
+        table = self.dropTables[gap]
+        for i in xrange(0, len(table)):
+            x = table[i][0]
+            if x < lo:
+                distance = lo - x
+            elif x > hi:
+                distance = x - hi
+            else:
+                distance = 0.0
+            need = (scale * distance) + rowCosts[i]
+            if need < best:
+                best = need
+                bestI = i
+        if best > self.floorY:
+            return IMPOSSIBLE, bestI
+        return best, bestI
+
+    def solve(self, gaps, lo = None, hi = None, height = None):
+        """ Solve a gap sequence, and return a SurvivalReport
+
+        The ball lands on the first row with x in [lo, hi], at the given height (ball center y).  By default, it
+        starts the way a new game does:  falling from the top middle of the screen onto a row halfway down.
+        """
+        if lo == None:
+            lo, hi, height = self.startInterval(self.sizeX * .5, self.radius, self.sizeY * .5)
+
+        report = SurvivalReport()
+        if len(gaps) == 0:
+            return report
+        costs = self.dropCosts(gaps)
+        scale = self.rowSpeed / self.maxSpeed
+
+        # Forward pass:  follow the perfect player
+        for k in xrange(0, len(gaps)):
+            need, i = self.bestDrop(gaps[k], costs[k], lo, hi)
+            slack = height - need
+            report.rows.append((lo, hi, height, slack))
+            report.minSlack = min(report.minSlack, slack)
+            report.difficulty = max(report.difficulty, need / self.floorY)
+            if slack < 0:
+                report.survivable = False
+                return report
+
+            # Take the best drop position, and land on the next row
+            x, qlo, qhi = self.dropTables[gaps[k]][i]
+            report.drops.append(x)
+            distance = max(lo - x, x - hi, 0.0)
+            height = min(height - (scale * distance) + self.fallGain, self.floorY)
+            lo = qlo * self.quantum
+            hi = qhi * self.quantum
+        return report
+
+    def isSurvivable(self, gaps):
+        """ Return True if a perfect player can survive the gap sequence (starting as a new game does)
+        """
+        return self.solve(gaps).survivable
+
+
+def solverForGameObject(world, quantum = 5.0, rowSpeed = None):
+    """ Return a SurvivalSolver for the level of world (a GameObject whose level has been initialized)
+
+    The rows move at the top row's speed, unless rowSpeed (pixels/sec, up the screen) is given
+    """
+    ball = world.ball
+    rows = world.rows
+    if rowSpeed == None:
+        rowSpeed = -rows[0].yVel
+    return SurvivalSolver(world.sizeX, world.sizeY, world.blocksPerRow, world.blockWidth, world.blockHeight,
+                          rows[1].yPos - rows[0].yPos, rowSpeed, ball.forceGravity[1] * ball.currPhysState.inverseMass,
+                          ball.radius, ball.maxSpeed, quantum)
@@ -0,0 +1,450 @@
+""" Two-player versus Falldown, with rollback netcode
+
+Each player plays their own world (the same level:  both worlds use a LevelGenerator with the same seed), and the
+last one standing wins.  Both processes simulate both worlds, so each player sees the other's game too.
+
+The processes exchange their players' inputs (one ball direction per tick) over UDP.  A process never waits for the
+other player's input:  it predicts that the other player is still doing whatever they did last, and plays on.  When
+the real input arrives and turns out to differ from the prediction, the other player's world is rolled back to the
+tick where the prediction went wrong (see snapshot.py) and re-simulated with the real input.  A process only waits if
+it gets more than maxRollback ticks ahead of the input it has received.
+
+Both worlds use fixed-point physics (see fixedpoint.py), so a world re-simulated on one machine comes out exactly as
+it was played on the other.  Every CHECK_INTERVAL ticks, each process sends a hash of its own player's world;
+the other process compares it with its copy of that world, to catch any desync.
+
+Usage:
+    python versus.py PLAYER [REMOTE_HOST]       play as player 0 or 1 (run one process per player)
+    python versus.py test [TICKS]               play a headless match between two bots (in one process), and check
+                                                that both processes agree on both worlds
+"""
+
+__author__ = 'Mass KonFuzion'
+
+import errno
+import random
+import socket
+import struct
+import sys
+import time
+
+from gameobj import GameObject
+from levelgen import LevelGenerator
+from snapshot import SnapshotRing
+
+# Packet header:  magic, frame number of the first input, ack (number of the receiver's inputs the sender has), hash
+# check frame, hash check value, number of inputs.  Then one signed byte (the ball direction) per input
+PACKET_HEADER = struct.Struct("<4sIIIIB")
+PACKET_MAGIC = "FDVS"
+# Most inputs sent in one packet (unacknowledged inputs are resent in every packet, until they are acknowledged)
+MAX_PACKET_INPUTS = 64
+
+# Ticks between desync checks
+CHECK_INTERVAL = 32
+
+# UDP port of player 0 (player 1 uses the next one)
+BASE_PORT = 47800
+
+# Fixed timestep (seconds)
+VERSUS_DT = .01
+
+
+def makeVersusWorld(seed, sizeX = 800, sizeY = 600):
+    """ Return a GameObject set up for a versus match:  the level generated from seed, and fixed-point physics
+    """
+    world = GameObject()
+    world.initStateMachine()
+    world.setScreenSize(sizeX, sizeY)
+    world.rowSource = LevelGenerator(10, seed = seed)
+    world.initLevel(sizeY, 6, 10)
+    world.stateMachine.setState('PlayingGame')
+    world.setFixedPointPhysics(True)
+    return world
+
+
+class VersusSession(object):
+    """ One player's side of a versus match:  both worlds, the inputs, and the connection to the other player
+    """
+
+    def __init__(self, localPlayer, localAddress, remoteAddress, seed = 0, maxRollback = 8):
+        """ Set up the match
+
+        localPlayer is 0 or 1.  The session receives on localAddress and sends to remoteAddress (both (host, port)).
+        """
+        self.localPlayer = localPlayer
+        self.remotePlayer = 1 - localPlayer
+        self.remoteAddress = remoteAddress
+        self.maxRollback = maxRollback
+
+        self.worlds = [makeVersusWorld(seed), makeVersusWorld(seed)]
+        self.crushedState = self.worlds[0].stateMachine.states['GotCrushed']
+        # A snapshot of each world at the start of each of the last few ticks, tagged with the tick number
+        self.rings = [SnapshotRing(world.numRows, maxRollback + 2) for world in self.worlds]
+
+        # Number of the next tick to simulate
+        self.frame = 0
+        # Each player's inputs, by tick.  The remote player's list only holds the inputs received so far
+        self.inputs = [[], []]
+        # The remote player's input that was used to simulate each tick (the real one, or a prediction)
+        self.usedInputs = []
+        # Number of our inputs the other process has received
+        self.remoteAck = 0
+
+        # The tick at which each world got crushed (None = still playing)
+        self.crushFrames = [None, None]
+        # Hashes of each world at the start of every CHECK_INTERVAL-th tick:  tick -> hash
+        self.hashes = [{}, {}]
+        # The latest (tick, hash) the other process sent for its world, waiting to be checked
+        self.pendingCheck = None
+        # The tick of the first hash mismatch, if any
+        self.desyncFrame = None
+
+        # Statistics
+        self.rollbacks = 0
+        self.rollbackTicks = 0
+        self.maxRollbackS = 0.0
+        self.stalls = 0
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(localAddress)
+        self.socket.setblocking(False)
+
+    def close(self):
+        self.socket.close()
+
+    def remoteInput(self, frame):
+        """ Return the remote player's input for a tick:  the real one if it has arrived, or else a prediction (the
+        last input received)
+        """
+        inputs = self.inputs[self.remotePlayer]
+        if frame < len(inputs):
+            return inputs[frame]
+        if inputs:
+            return inputs[-1]
+        return 0
+
+    def confirmedFrames(self):
+        """ Return the number of ticks (from the start) that both worlds have been simulated with real inputs
+        """
+        return min(self.frame, len(self.inputs[self.remotePlayer]))
+
+    def canAdvance(self):
+        """ Return True if the session can simulate another tick without getting too far ahead of the other player
+        """
+        return self.frame - len(self.inputs[self.remotePlayer]) < self.maxRollback
+
+    def advance(self, direction):
+        """ Simulate one tick, with the local player's ball moving in the given direction (-1, 0, 1)
+
+        Returns False (and simulates nothing) if the session is too far ahead of the other player; call it again
+        later with the same input.
+        """
+        self.poll()
+        if not self.canAdvance():
+            self.stalls += 1
+            self.send()
+            return False
+
+        self.inputs[self.localPlayer].append(direction)
+        self.stepWorld(self.localPlayer, self.frame)
+        self.stepWorld(self.remotePlayer, self.frame)
+        self.frame += 1
+        self.send()
+        return True
+
+    def stepWorld(self, player, frame):
+        """ Simulate one tick of a player's world
+        """
+        world = self.worlds[player]
+        if player == self.localPlayer:
+            direction = self.inputs[player][frame]
+        else:
+            direction = self.remoteInput(frame)
+            if frame < len(self.usedInputs):
+                self.usedInputs[frame] = direction
+            else:
+                self.usedInputs.append(direction)
+
+        if frame % CHECK_INTERVAL == 0:
+            self.hashes[player][frame] = int(world.stateHash()[:8], 16)
+        self.rings[player].push(world, frame)
+
+        # A crushed world stays as it is for the rest of the match
+        if self.crushFrames[player] != None:
+            return
+        world.ball.setDirection(direction)
+        world.ball.respondToControllerInput()
+        world.step(VERSUS_DT)
+        if world.stateMachine.currentState == self.crushedState:
+            self.crushFrames[player] = frame
+
+    def rollback(self, frame):
+        """ Re-simulate the remote player's world from the start of the given tick up to now
+        """
+        start = time.time()
+        player = self.remotePlayer
+        ring = self.rings[player]
+        ring.find(frame).restore(self.worlds[player])
+        # Forget the snapshots from that tick on (re-simulating takes them again)
+        ring.discardNewerThan(self.frame - frame)
+        if self.crushFrames[player] != None and self.crushFrames[player] >= frame:
+            self.crushFrames[player] = None
+
+        for f in xrange(frame, self.frame):
+            self.stepWorld(player, f)
+
+        self.rollbacks += 1
+        self.rollbackTicks += self.frame - frame
+        self.maxRollbackS = max(self.maxRollbackS, time.time() - start)
+
+    def poll(self):
+        """ Receive the other process's packets, and roll back if any of its inputs were mispredicted
+        """
+        inputs = self.inputs[self.remotePlayer]
+        received = len(inputs)
+        while True:
+            try:
+                packet = self.socket.recv(PACKET_HEADER.size + MAX_PACKET_INPUTS)
+            except socket.error, e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                # (e.g. ECONNREFUSED:  the other process isn't running yet)
+                continue
+            if len(packet) < PACKET_HEADER.size:
+                continue
+            magic, first, ack, checkFrame, checkHash, count = PACKET_HEADER.unpack_from(packet)
+            if magic != PACKET_MAGIC or len(packet) < PACKET_HEADER.size + count:
+                continue
+
+            self.remoteAck = max(self.remoteAck, ack)
+            # Take the inputs that follow on from the ones we have (inputs after a gap are resent later anyway)
+            directions = struct.unpack_from("%db" % count, packet, PACKET_HEADER.size)
+            for i in xrange(max(len(inputs) - first, 0), count):
+                inputs.append(directions[i])
+            if self.pendingCheck == None or checkFrame > self.pendingCheck[0]:
+                self.pendingCheck = (checkFrame, checkHash)
+
+        # Roll back to the first simulated tick whose prediction was wrong
+        for f in xrange(received, min(len(inputs), self.frame)):
+            if inputs[f] != self.usedInputs[f]:
+                self.rollback(f)
+                break
+
+        self.checkHash()
+
+    def checkHash(self):
+        """ Compare the other process's hash of its world with ours, once we have all the inputs that led up to it
+        """
+        if self.pendingCheck == None:
+            return
+        frame, value = self.pendingCheck
+        if frame > len(self.inputs[self.remotePlayer]) or frame >= self.frame:
+            return
+        self.pendingCheck = None
+        ours = self.hashes[self.remotePlayer].get(frame)
+        if ours != None and ours != value and self.desyncFrame == None:
+            self.desyncFrame = frame
+
+    def send(self):
+        """ Send the other process our unacknowledged inputs (and our latest world hash)
+        """
+        inputs = self.inputs[self.localPlayer]
+        first = self.remoteAck
+        count = min(len(inputs) - first, MAX_PACKET_INPUTS)
+        if self.frame > 0:
+            checkFrame = ((self.frame - 1) // CHECK_INTERVAL) * CHECK_INTERVAL
+        else:
+            checkFrame = 0
+        checkHash = self.hashes[self.localPlayer].get(checkFrame, 0)
+        packet = PACKET_HEADER.pack(PACKET_MAGIC, first, len(self.inputs[self.remotePlayer]), checkFrame, checkHash,
+                                    count) + struct.pack("%db" % count, *inputs[first:first + count])
+        try:
+            self.socket.sendto(packet, self.remoteAddress)
+        except socket.error:
+            # The other process isn't there (yet); the inputs are resent with the next packet
+            pass
+
+    def result(self):
+        """ Return the outcome of the match:  None (still playing), the winning player (0 or 1), or -1 (a draw --
+        both got crushed on the same tick)
+        """
+        confirmed = self.confirmedFrames()
+        crushed = [c if c != None and c < confirmed else None for c in self.crushFrames]
+        if crushed[0] == None and crushed[1] == None:
+            return None
+        if crushed[0] != None and crushed[1] != None:
+            if crushed[0] == crushed[1]:
+                return -1
+            return 1 if crushed[0] < crushed[1] else 0
+        # One player got crushed; the other wins if they were still playing at that tick
+        loser = 0 if crushed[0] != None else 1
+        other = self.crushFrames[1 - loser]
+        if other != None and other <= crushed[loser]:
+            # (the other player's crush isn't confirmed yet; wait for it)
+            return None
+        if confirmed <= crushed[loser]:
+            return None
+        return 1 - loser
+
+
+def botDirection(world, rng):
+    """ Return a test bot's ball direction:  usually towards the gap in the row below the ball, sometimes at random
+    """
+    if rng.random() < .2:
+        return rng.choice((-1, 0, 1))
+    ballPos = world.ball.getPosition()
+    for row in world.rows:
+        if row.yPos > ballPos[1]:
+            gapX = (row.gap + .5) * row.blockWidth
+            if ballPos[0] < gapX - 10:
+                return 1
+            elif ballPos[0] > gapX + 10:
+                return -1
+            return 0
+    return 0
+
+
+def playLocalMatch(ticks = 6000, seed = 0, maxRollback = 8, lag = 4, port = BASE_PORT):
+    """ Play a headless match between two bots, as two sessions in one process, and return the sessions
+
+    The sessions take turns simulating lag ticks at a time, so each one keeps predicting up to lag ticks of the
+    other's input (and rolling back when it was wrong).
+    """
+    sessions = [VersusSession(0, ("127.0.0.1", port), ("127.0.0.1", port + 1), seed, maxRollback),
+                VersusSession(1, ("127.0.0.1", port + 1), ("127.0.0.1", port), seed, maxRollback)]
+    rngs = [random.Random(seed + 1), random.Random(seed + 2)]
+    directions = [0, 0]
+    try:
+        while min(s.frame for s in sessions) < ticks and sessions[0].result() == None:
+            for p in (0, 1):
+                session = sessions[p]
+                for i in xrange(0, lag):
+                    if session.frame >= ticks:
+                        break
+                    # Now and then, the bots change their minds (heading for the gap below, or wandering off)
+                    if rngs[p].random() < .05:
+                        directions[p] = botDirection(session.worlds[p], rngs[p])
+                    if not session.advance(directions[p]):
+                        break
+
+        # Bring both sessions to the same tick
+        for p in (0, 1):
+            while sessions[p].frame < sessions[1 - p].frame:
+                sessions[p].advance(directions[p])
+
+        # Let the last packets arrive
+        for i in xrange(0, 10):
+            for session in sessions:
+                session.send()
+            for session in sessions:
+                session.poll()
+    finally:
+        for session in sessions:
+            session.close()
+    return sessions
+
+
+def selfTest(ticks = 6000, seed = 0):
+    """ Play a local match, and check that both sessions ended up with the same worlds
+    """
+    sessions = playLocalMatch(ticks, seed)
+    for session in sessions:
+        print "player %d:  %d ticks, %d rollbacks (%d ticks re-simulated, longest %.2f ms), %d stalls, result %s" % (
+            session.localPlayer, session.frame, session.rollbacks, session.rollbackTicks,
+            session.maxRollbackS * 1000.0, session.stalls, session.result())
+    same = True
+    for p in (0, 1):
+        a = sessions[0].worlds[p].stateHash()
+        b = sessions[1].worlds[p].stateHash()
+        print "world %d:  %s %s" % (p, a[:12], b[:12])
+        same = same and a == b
+    for session in sessions:
+        if session.desyncFrame != None:
+            print "player %d:  desync at tick %d" % (session.localPlayer, session.desyncFrame)
+            same = False
+    print "OK" if same else "MISMATCH"
+    return same
+
+
+def playVersus(localPlayer, remoteHost = "127.0.0.1", seed = 0):
+    """ Play a versus match in a window (both worlds, side by side)
+    """
+    import pygame
+    from application import PygameApplication
+
+    session = VersusSession(localPlayer, ("", BASE_PORT + localPlayer), (remoteHost, BASE_PORT + 1 - localPlayer),
+                            seed)
+    app = PygameApplication()
+    app.initializeGraphics(800, 600)
+    window = pygame.display.set_mode((1600, 600))
+    pygame.display.set_caption("Falldown Rebirth -- versus (player %d)" % localPlayer)
+    controlState = session.worlds[localPlayer].ball.controlState
+
+    previousTimeS = time.time()
+    accumulatorS = 0.0
+    playing = True
+    while playing and session.result() == None:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                playing = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_LEFT or event.key == pygame.K_j:
+                    controlState.setLeftKeyPressedTrue()
+                elif event.key == pygame.K_RIGHT or event.key == pygame.K_l:
+                    controlState.setRightKeyPressedTrue()
+            elif event.type == pygame.KEYUP:
+                if event.key == pygame.K_LEFT or event.key == pygame.K_j:
+                    controlState.setLeftKeyPressedFalse()
+                elif event.key == pygame.K_RIGHT or event.key == pygame.K_l:
+                    controlState.setRightKeyPressedFalse()
+
+        if controlState.leftKeyPressed:
+            direction = -1
+        elif controlState.rightKeyPressed:
+            direction = 1
+        else:
+            direction = 0
+
+        # Fixed timestep, as in PygameApplication.doPlayingState
+        currentTimeS = time.time()
+        accumulatorS = min(accumulatorS + (currentTimeS - previousTimeS), .25)
+        previousTimeS = currentTimeS
+        while accumulatorS >= VERSUS_DT:
+            if not session.advance(direction):
+                # Waiting for the other player
+                break
+            accumulatorS -= VERSUS_DT
+        if accumulatorS >= VERSUS_DT:
+            # (don't let the wait build up a backlog of ticks)
+            accumulatorS = 0.0
+            session.poll()
+
+        window.fill((0, 0, 0))
+        for p in (0, 1):
+            session.worlds[p].draw(window.subsurface((p * 800, 0, 800, 600)))
+        pygame.display.update()
+
+    result = session.result()
+    session.close()
+    pygame.quit()
+    if result == None:
+        print "Match abandoned"
+    elif result < 0:
+        print "Draw"
+    else:
+        print "Player %d wins%s" % (result, " (you)" if result == localPlayer else "")
+
+
+def main(args):
+    if len(args) >= 1 and args[0] == "test":
+        ticks = int(args[1]) if len(args) > 1 else 6000
+        return 0 if selfTest(ticks) else 1
+    elif len(args) in (1, 2) and args[0] in ("0", "1"):
+        playVersus(int(args[0]), args[1] if len(args) > 1 else "127.0.0.1")
+        return 0
+    print __doc__
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
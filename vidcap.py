@@ -7,6 +7,9 @@
 #    this file directly to encode the AVI:
 #       python vidcap.py [viddir]
 #    This will produce the file viddir/vidcap.avi.
+#    The video is encoded a segment at a time. To encode segments while the game is still running,
+#    so the video is ready soon after it exits, start the encoder with --follow:
+#       python vidcap.py --follow [viddir]
 #    Make sure you call pygame.init() early in your program (but after you import vidcap). This is
 #    how vidcap knows to start the recording, and it's necessary for timing to work.
 
@@ -18,7 +21,8 @@
 
 # TODO: draw mouse cursor
 
-import pygame, datetime, os, inspect, subprocess, glob
+import pygame, datetime, os, inspect, subprocess, glob, mmap, struct, bisect, atexit, time, threading
+import sys, weakref, heapq
 
 # is automatically recorded when you call these functions? If this is false,
 # you'll need to call vidcap.cap() once per frame
@@ -35,6 +39,14 @@ recordsymbol = True  # Put a "recording" symbol in the corner when recording
 
 usepng = False  # Use png rather than bmp (takes less disk space but is slower)
 
+usearchive = False  # Record raw frames into memory-mapped archive files instead of one image
+                    # file per frame (much cheaper per frame, but takes more disk space)
+archivecapacity = 1500  # Number of frames each archive file is preallocated to hold
+
+logbuffersize = 65536  # Write the log out once this many bytes are buffered...
+logflushinterval = 1.0  # ...or once this many seconds have passed since it was last written
+logthread = False  # Write the log out from a background thread rather than from log() itself
+
 
 _recording = True
 _recordaudio = False
@@ -73,6 +85,14 @@ def isaudiopath(path, exten = "ogg"):
     """Does the path describe a timestamped image?"""
     return path.endswith("." + exten) and path[-14:-4].isdigit() and path[-20:-14] == "audio-"
 
+def archivepath(n):
+    checkdir()
+    return os.path.join(viddir, "frames-%04d.vcfa" % n)
+
+def isarchivepath(path):
+    """Does the path describe a numbered frame archive?"""
+    return path.endswith(".vcfa") and path[-9:-5].isdigit() and path[-16:-9] == "frames-"
+
 def blankpath():
     checkdir()
     return os.path.join(viddir, "frame-blank.png")
@@ -93,10 +113,78 @@ def logpath():
     checkdir()
     return os.path.join(viddir, "log.txt")
 
+# Log records are "<t> <kind> <text>". t is in milliseconds, written as "+<t since the previous
+#   record>" for all but the first record from each run, and common kinds are abbreviated.
+_logcodes = {"alias": "a", "init": "i", "audiostart": "s", "audiostop": "e"}
+_logkinds = dict((code, kind) for kind, code in _logcodes.items())
+
+_logbuffer = []
+_logbuffered = 0  # Number of bytes in _logbuffer
+_loglastt = None  # Timestamp of the last record logged
+_logflushed = time.time()  # When the log was last written out
+_loglock = threading.Lock()  # Guards the buffer
+_logflushlock = threading.Lock()  # Keeps flushes in order
+_logevent = threading.Event()  # Wakes up the background writer
+_logwriter = None  # The background writer thread, once started
+
 def log(line):
-    f = open(logpath(), "a")
-    f.write(timestamp() + " " + line + "\n")
-    f.close()
+    """Buffer a log record; it's written out by flushlog"""
+    global _logbuffered, _loglastt
+    t = pygame.time.get_ticks()
+    kind, _, text = line.partition(" ")
+    kind = _logcodes.get(kind, kind)
+    with _loglock:
+        stamp = str(t) if _loglastt is None else "+%d" % (t - _loglastt)
+        _loglastt = t
+        record = "%s %s %s\n" % (stamp, kind, text) if text else "%s %s\n" % (stamp, kind)
+        _logbuffer.append(record)
+        _logbuffered += len(record)
+        full = _logbuffered >= logbuffersize
+    if logthread:
+        startlogwriter()
+        if full: _logevent.set()
+    elif full or time.time() - _logflushed >= logflushinterval:
+        flushlog()
+
+def flushlog():
+    """Write all the buffered log records out to the log file"""
+    global _logbuffer, _logbuffered, _logflushed
+    with _logflushlock:
+        with _loglock:
+            records, _logbuffer, _logbuffered = _logbuffer, [], 0
+            _logflushed = time.time()
+        if not records: return
+        f = open(logpath(), "a")
+        f.write("".join(records))
+        f.close()
+atexit.register(flushlog)
+
+def _logwriterloop():
+    while True:
+        _logevent.wait(logflushinterval)
+        _logevent.clear()
+        flushlog()
+
+def startlogwriter():
+    """Start the background thread that writes out the log, if it isn't running already"""
+    global _logwriter
+    if _logwriter is not None: return
+    _logwriter = threading.Thread(target = _logwriterloop, name = "vidcap log writer")
+    _logwriter.daemon = True
+    _logwriter.start()
+
+def readlog(path = None):
+    """Yield (timestamp, kind, text) for each record in a log file, reading it a line at a time
+
+    Understands both the compact record format and the older one-line-per-call format.
+    """
+    t = 0
+    for line in open(path or logpath(), "r"):
+        words = line.split(None, 2)
+        if len(words) < 2: continue
+        stamp = words[0]
+        t = t + int(stamp[1:]) if stamp.startswith("+") else int(stamp)
+        yield t, _logkinds.get(words[1], words[1]), words[2].strip() if len(words) > 2 else ""
 
 def getmonitorsource():
     p = subprocess.Popen("pactl list".split(), stdout = subprocess.PIPE)
@@ -150,13 +238,149 @@ def stopaudiorecording():
     _audioprocess.terminate()
     _audioprocess = None
 
+class FrameArchive(object):
+    """A single preallocated, memory-mapped file of fixed-size raw frames plus a timestamp index
+
+    The file is a fixed-size header, then an index of capacity 64-bit timestamps, then capacity
+    frame slots. Each frame is the surface's raw pixel data (pitch included), so capturing a frame
+    is one copy into the map, with no per-frame open/close. Raw frames can only be encoded from
+    16, 24 or 32 bit surfaces.
+    """
+    magic = "VCFA"
+    version = 1
+    # magic, version, width, height, pitch, bytesize, rmask, gmask, bmask, amask, capacity, count
+    headerformat = "<4sIIIIIIIIIQQ"
+    countoffset = struct.calcsize(headerformat) - 8
+    headersize = 64
+    def __init__(self, filename, surf = None, capacity = None):
+        """Create a new archive shaped like surf, or open an existing one read-only if surf is None"""
+        self.filename = filename
+        if surf is None:
+            self.file = open(filename, "rb")
+            header = self.file.read(self.headersize)
+            if len(header) < self.headersize:
+                raise ValueError("%s is not a vidcap frame archive" % filename)
+            (magic, version, self.width, self.height, self.pitch, self.bytesize, rmask, gmask, bmask,
+                amask, self.capacity, _) = struct.unpack_from(self.headerformat, header)
+            if magic != self.magic or version != self.version:
+                raise ValueError("%s is not a vidcap frame archive" % filename)
+            self.masks = rmask, gmask, bmask, amask
+            self.framesize = self.pitch * self.height
+            self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+        else:
+            self.width, self.height = surf.get_size()
+            self.pitch = surf.get_pitch()
+            self.bytesize = surf.get_bytesize()
+            self.masks = surf.get_masks()
+            self.capacity = capacity or archivecapacity
+            self.framesize = self.pitch * self.height
+            self.file = open(filename, "w+b")
+            self.file.truncate(self.frameoffset(self.capacity))
+            self.map = mmap.mmap(self.file.fileno(), 0)
+            struct.pack_into(self.headerformat, self.map, 0, self.magic, self.version, self.width,
+                self.height, self.pitch, self.bytesize, self.masks[0], self.masks[1], self.masks[2],
+                self.masks[3], self.capacity, 0)
+        self.writable = surf is not None
+    def __len__(self):
+        """Number of frames recorded so far (re-read, so a reader sees frames as they're added)"""
+        return struct.unpack_from("<Q", self.map, self.countoffset)[0]
+    def frameoffset(self, n):
+        return self.headersize + 8 * self.capacity + n * self.framesize
+    def append(self, t, surf):
+        """Copy the pixels of surf into the next free slot. Returns False if the archive is full."""
+        n = len(self)
+        if n >= self.capacity: return False
+        struct.pack_into("<q", self.map, self.headersize + 8 * n, t)
+        offset = self.frameoffset(n)
+        self.map[offset:offset + self.framesize] = surf.get_buffer().raw
+        # Bump the count last, so a reader never sees a frame before it's complete
+        struct.pack_into("<Q", self.map, self.countoffset, n + 1)
+        return True
+    def timestamps(self):
+        """A zero-copy numpy view of the timestamp index"""
+        import numpy
+        return numpy.frombuffer(self.map, "<i8", len(self), self.headersize)
+    def frames(self):
+        """A zero-copy numpy view of the recorded frames, shaped (frame, row, pitch)"""
+        import numpy
+        n = len(self)
+        return numpy.frombuffer(self.map, numpy.uint8, n * self.framesize,
+            self.frameoffset(0)).reshape(n, self.height, self.pitch)
+    def close(self):
+        if self.map is None: return
+        if self.writable: self.map.flush()
+        self.map.close()
+        self.file.close()
+        self.map, self.file = None, None
+
+_archive = None  # The FrameArchive currently being recorded into, if any
+_narchive = 0  # Number of that archive within viddir
+
+def archiveframe(screen):
+    """Copy the screen into the current frame archive, moving on to a new archive when it fills up"""
+    global _archive, _narchive
+    t = pygame.time.get_ticks()
+    if _archive is None:
+        _archive = FrameArchive(archivepath(_narchive), screen)
+    if not _archive.append(t, screen):
+        _archive.close()
+        _narchive += 1
+        _archive = FrameArchive(archivepath(_narchive), screen)
+        _archive.append(t, screen)
+
+def closearchive():
+    global _archive
+    if _archive is not None:
+        _archive.close()
+        _archive = None
+
+def endrecording():
+    """Called at exit. The end record tells an encoder running with --follow it has everything."""
+    closearchive()
+    log("end")
+    flushlog()
+
+def recordingended():
+    """Is the last record in the log an end record?"""
+    if not os.path.exists(logpath()): return False
+    f = open(logpath(), "rb")
+    f.seek(0, 2)
+    f.seek(max(0, f.tell() - 64))
+    lines = f.read().splitlines()
+    f.close()
+    words = lines[-1].split() if lines else []
+    return len(words) >= 2 and words[1] == "end"
+
+def writerawframes(frames, archive, out):
+    """Write raw frames to out. frames holds (archive, frame number) pairs, or None for a blank
+    frame; archive gives the frame size."""
+    import numpy
+    rowbytes = archive.width * archive.bytesize
+    blank = numpy.zeros((archive.height, rowbytes), numpy.uint8)
+    for f in frames:
+        if f is None:
+            frame = blank
+        else:
+            frame = f[0].frames()[f[1]]
+            if archive.pitch != rowbytes:
+                frame = numpy.ascontiguousarray(frame[:, :rowbytes])
+        out.write(frame.data)
+
+def rawvideoformat(bytesize, rmask):
+    """mencoder rawvideo format name for little-endian surface pixels"""
+    if bytesize not in (2, 3, 4):
+        raise ValueError("can't encode %s-bit raw frames" % (bytesize * 8))
+    return "%s%s" % ("bgr" if rmask > 0xff else "rgb", bytesize * 8)
+
 def cap(screen = None):
     """Call this once a frame to capture the screen"""
     global _recordaudio
     if not _recording: return
     if screen is None: screen = pygame.display.get_surface()
-    fname = currentimagepath()
-    pygame.image.save(screen, fname)
+    if usearchive:
+        archiveframe(screen)
+    else:
+        pygame.image.save(screen, currentimagepath())
     if recordsymbol and pygame.time.get_ticks() / 250 % 2:
         pygame.draw.circle(screen, (255, 0, 0), (14, 14), 10, 0)
     startaudiorecording()
@@ -182,6 +406,13 @@ def convertallbmps():
     os.system("mogrify -format png " + os.path.join(viddir, "*.bmp"))
     os.system("rm " + os.path.join(viddir, "*.bmp"))
 
+def convertbmps(paths):
+    """Convert the given bmps into pngs (requires mogrify)"""
+    for i in range(0, len(paths), 100):
+        chunk = " ".join(paths[i:i+100])
+        os.system("mogrify -format png " + chunk)
+        os.system("rm " + chunk)
+
 def convertaudio():
     """Convert raw audio in the vidcap directory into oggs"""
     for f in os.listdir(viddir):
@@ -191,33 +422,161 @@ def convertaudio():
         if os.path.exists(oggfile): continue
         os.system("oggenc --raw --quiet -o %s %s" % (oggfile, rawfile))
 
-def interpolateframes(fts, nframes, dt, t0 = 0):
+def interpolateframes(times, nframes, dt, t0 = 0):
+    """Index into times of the input frame to show for each output frame
+
+    times must be sorted; times[0] belongs to the frame to show before recording started.
+    """
     # TODO: better interpolation function
     iframes = []
-    index = 1  # The first frame that's later than the current timestamp
     for jframe in range(nframes):
         t = float(jframe) * dt + t0
-        while index < len(fts) and t > fts[index][0]:
-            index += 1
-        iframes.append(fts[index-1][1])
+        # The first frame that's later than the current timestamp
+        index = bisect.bisect_left(times, t, 1)
+        iframes.append(index - 1)
     return iframes
 
+def segmentpath(n):
+    return os.path.join(viddir, "segment-%04d.avi" % n)
+
+class ImageFrames(object):
+    """The frames of a recording saved as one image file per frame"""
+    def __init__(self):
+        self.times = []  # Timestamps of the frames found so far, sorted (each one once)
+        self.lastname = ""  # "frame-" + the last of those timestamps
+    def refresh(self):
+        """Add the frames saved since the last call
+
+        Frames are saved in timestamp order, so only the names after the last one seen are parsed
+        (and a bmp's png, made later by convertbmps, isn't counted again)"""
+        lastname = self.lastname
+        new = set(int(f[6:16]) for f in os.listdir(viddir)
+                  if f[:16] > lastname and (isimagepath(f) or isimagepath(f, "bmp")))
+        if new:
+            self.times.extend(sorted(new))
+            self.lastname = "frame-" + timestamp(self.times[-1])
+    def timestamps(self):
+        self.refresh()
+        return self.times
+    def timerange(self):
+        """First and last timestamps recorded so far, or None"""
+        times = self.timestamps()
+        return (times[0], times[-1]) if times else None
+    def pick(self, nframes, dt, t0):
+        """The image to show for each of nframes output frames starting at time t0"""
+        tlast = float(nframes - 1) * dt + t0
+        # Only hang on to the frames this stretch of video can use
+        times = self.timestamps()
+        times = times[max(0, bisect.bisect_left(times, t0) - 1):bisect.bisect_left(times, tlast)]
+        bmps = [currentimagepath("bmp", t) for t in times]
+        convertbmps([path for path in bmps if os.path.exists(path)])
+        paths = [currentimagepath("png", t) for t in times]
+        if paths and not os.path.exists(blankpath()): makeblankframe(paths[0])
+        paths = [blankpath()] + paths
+        return [paths[i] for i in interpolateframes([-1] + times, nframes, dt, t0)]
+    def encode(self, frames, path, fps):
+        listpath = path + ".txt"
+        open(listpath, "w").write("\n".join(frames))
+        com = "mencoder mf://@%s -mf fps=%s:type=png -ovc copy -oac copy -o %s" % (listpath, fps, path)
+        print com
+        os.system(com)  # TODO: check for errors
+
+class ArchiveFrames(object):
+    """The frames of a recording saved in frame archives"""
+    def __init__(self):
+        self.archives = []
+        self.firsttimes = []  # Timestamp of the first frame in each archive
+    def refresh(self):
+        """Open any archives that have been started since the last call"""
+        while os.path.exists(archivepath(len(self.archives))):
+            try:
+                archive = FrameArchive(archivepath(len(self.archives)))
+            except ValueError:
+                return  # Still being created
+            if not len(archive):
+                archive.close()
+                return
+            self.archives.append(archive)
+            self.firsttimes.append(int(archive.timestamps()[0]))
+    def timerange(self):
+        """First and last timestamps recorded so far, or None"""
+        self.refresh()
+        if not self.archives: return None
+        return self.firsttimes[0], int(self.archives[-1].timestamps()[-1])
+    def pick(self, nframes, dt, t0):
+        """The (archive, frame number) to show for each of nframes output frames starting at time
+        t0, found by binary search of the archive indexes"""
+        import numpy
+        frames = []
+        for jframe in range(nframes):
+            t = float(jframe) * dt + t0
+            n = bisect.bisect_left(self.firsttimes, t) - 1
+            if n < 0:
+                frames.append(None)
+            else:
+                index = int(numpy.searchsorted(self.archives[n].timestamps(), t))
+                frames.append((self.archives[n], index - 1))
+        return frames
+    def encode(self, frames, path, fps):
+        archive = self.archives[0]
+        com = "mencoder - -demuxer rawvideo -rawvideo fps=%s:w=%s:h=%s:format=%s" % (fps,
+            archive.width, archive.height, rawvideoformat(archive.bytesize, archive.masks[0]))
+        com += " -ovc lavc -lavcopts vcodec=png -oac copy -o %s" % path
+        print com
+        # Feed the frames to mencoder straight out of the memory maps
+        p = subprocess.Popen(com.split(), stdin = subprocess.PIPE)
+        writerawframes(frames, archive, p.stdin)
+        p.stdin.close()
+        p.wait()
+
 # The following class is used for audio logging. We use a wrapper around pygame.mixer that logs all
 #   access to the module. Later, this can be reconstructed by reading the log.
 
 class LogAlias(object):
-    """An alias to an object that logs all calls made."""
-    _aliasList = {}
+    """An alias to an object that logs all calls made.
+
+    Aliases are numbered so the log can refer to them. The registry only holds weak references,
+    so an alias (e.g. one wrapping a Sound) is freed once the game lets go of it, and its number is
+    reused by the next alias created.
+    """
+    _aliasList = {}  # Alias number -> weak reference to the live alias with that number
+    _freeList = []  # Heap of numbers released by aliases that have been collected
     _listname = "objs"  # How the array should be written in the log
-    _nAlias = 0
+    _nAlias = 0  # Lowest number that has never been used
     def __init__(self, obj, name, ongetattr = None):
         self._obj = obj
         self._name = name  # This is a string that can be eval'd to give self._obj later
-        self._n = self._nAlias
-        self._aliasList[LogAlias._nAlias] = self
+        self._n = LogAlias._newnumber()
+        release = LogAlias._release
+        self._aliasList[self._n] = weakref.ref(self, lambda ref, n = self._n: release(n))
         self._log("%s[%s] = %s" % (self._listname, self._n, self._name))
         self._ongetattr = ongetattr  # Callback when self.__getattr__ is called
+    @staticmethod
+    def _newnumber():
+        if LogAlias._freeList:
+            return heapq.heappop(LogAlias._freeList)
         LogAlias._nAlias += 1
+        return LogAlias._nAlias - 1
+    @classmethod
+    def _release(cls, n, heappush = heapq.heappush):
+        """Called when alias number n has been garbage collected (possibly during shutdown, hence
+        no module globals)"""
+        del cls._aliasList[n]
+        heappush(cls._freeList, n)
+    @staticmethod
+    def livealiases():
+        """Number of aliases currently alive"""
+        return len(LogAlias._aliasList)
+    @staticmethod
+    def memoryusage():
+        """Approximate number of bytes held by the alias registry and the live aliases"""
+        total = sys.getsizeof(LogAlias._aliasList) + sys.getsizeof(LogAlias._freeList)
+        for ref in LogAlias._aliasList.values():
+            alias = ref()
+            total += sys.getsizeof(ref)
+            if alias is not None:
+                total += sys.getsizeof(alias) + sys.getsizeof(alias.__dict__)
+        return total
     @staticmethod
     def _lname(obj):
         """This is the name of this object via the alias list, if applicable"""
@@ -245,6 +604,7 @@ class LogAlias(object):
 
 _wrapped = False
 if __name__ != "__main__":
+    atexit.register(endrecording)
     mixer = LogAlias(pygame.mixer, "pygame.mixer")
     if wrappygame and not _wrapped:
         pygame.mixer = mixer
@@ -255,62 +615,71 @@ if __name__ != "__main__":
 
 if __name__ == "__main__":
     # Encode the images and audio into an AVI file
+    # The video is encoded in segments, which are joined together at the end. With --follow, each
+    #   segment is encoded as soon as it has been recorded, until the game exits.
     import sys, numpy
 
     fps = 25
-    fixedfps = False
+    segmentlength = 60  # Seconds of video per segment
+    follow = "--follow" in sys.argv
+    args = [arg for arg in sys.argv[1:] if arg != "--follow"]
 
-    viddir = sys.argv[1] if len(sys.argv) > 1 else lastdir()
+    viddir = args[0] if args else lastdir()
     if not viddir:
         print "Vidcap directory not found!"
         print "Please specify a directory on the command line."
         sys.exit()
     print "vidcap directory is %s" % viddir
 
-    print "Converting BMPs into PNGs...."
-    convertallbmps()
+    archives, images = ArchiveFrames(), ImageFrames()
+    while True:
+        source = archives if archives.timerange() else images
+        trange = source.timerange()
+        if trange or not follow: break
+        time.sleep(1)
+    if not trange:
+        print "No frames found!"
+        sys.exit()
 
     # Analyze log file
-    objs = {}
-    logcomms = []
     t0 = None  # Start time of video
-    for line in open(logpath(), "r"):
-        words = line.split()
-        if len(words) < 2: continue
-        t = int(words[0])
-        if words[1] == "init":
-#            if t0 is None: t0 = t
-            pass
-        if words[1] == "audiostart":
-            if t0 is None: t0 = t
-        if words[1] == "alias":
-            logcomms.append((t, " ".join(words[2:]).strip()))
-
-    frames0 = sorted([f for f in os.listdir(viddir) if isimagepath(f)])
-    fts = [(int(frame[6:16]), os.path.join(viddir, frame)) for frame in frames0]
-    if t0 is None: t0 = fts[0][0]
-    tend = fts[-1][0]
-    print t0, tend
-
-    if fixedfps:
-        nframes = len(frames0)
-    else:
-        print "Number of input frames: %s" % len(frames0)
+    for t, kind, text in readlog() if os.path.exists(logpath()) else ():
+        if kind == "audiostart":
+            t0 = t
+            break
+    if t0 is None: t0 = trange[0]
+
+    segmentframes = segmentlength * fps
+    nsegments = 0
+    nframes = 0
+    while True:
+        ended = not follow or recordingended()
+        tend = source.timerange()[1]
+        # Every video frame before the last recorded frame is settled
         nframes = int((tend - t0) * fps / 1000.)
+        start = nsegments * segmentframes
+        if nframes >= start + segmentframes:
+            end = start + segmentframes
+        elif ended and nframes > start:
+            end = nframes
+        elif ended:
+            break
+        else:
+            time.sleep(1)
+            continue
+
+        path = segmentpath(nsegments)
+        if end < start + segmentframes or not os.path.exists(path):
+            print "Encoding video frames %s to %s...." % (start, end)
+            frames = source.pick(end - start, 1000. / fps, t0 + start * 1000. / fps)
+            source.encode(frames, path + ".part", fps)
+            os.rename(path + ".part", path)
+        nsegments += 1
+
     vidlength = nframes * 1. / fps
     print "Number of video frames: %s at %sfps" % (nframes, fps)
     print "Video duration: %.2fs" % vidlength
 
-    makeblankframe(fts[0][1])
-    fts = [(-1, blankpath())] + fts
-
-    # TODO: handle fixedfps mode
-    if fixedfps:
-        pass
-    else:
-        framelist = interpolateframes(fts, nframes, 1000. / fps, t0)
-        open(framelistpath(), "w").write("\n".join(framelist))
-
     # Lou's Hacks -- disable audio conversion
     #print "Converting RAW audio into OGG format...."
     #convertaudio()
@@ -319,16 +688,14 @@ if __name__ == "__main__":
 
     com = []
     com.append("mencoder")
-#    com.append("mf://%s/*.png" % viddir)
-    com.append("mf://@%s" % framelistpath())
-    com.append("-mf fps=%s:type=png" % fps)
+    com.extend(segmentpath(n) for n in range(nsegments))
     com.append("-ovc copy")
     com.append("-oac pcm -audiofile %s" % oggfile if oggfile else "-oac copy")
     com.append("-o %s/vidcap.avi" % viddir)
 
     com = " ".join(com)
     print
-    print "Encoding video...."
+    print "Joining video segments...."
     print com
     os.system(com)  # TODO: check for errors
 